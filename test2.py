@@ -1,4 +1,37 @@
+import argparse
+import asyncio
+import gc
+import glob
+import hashlib
+import json
+import marshal
+import math
+import mmap
+import os
+import random
 import re
+import signal
+import string
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+try:
+    import numpy as np
+except ImportError: # Lexer.vectorize falls back to Lexer.tokenize
+    np = None
 
 # TOKENS
 
@@ -34,7 +67,7 @@ NOT = 29
 BOOL = 30
 
 DIGITS = re.compile("^[0-9]+$")
-FLOAT = re.compile("^[0-9]+.[0-9]+$")
+FLOATS = re.compile("^[0-9]+\\.[0-9]*$")
 LETTERS = re.compile("^[a-zA-Z]+$")
 VARNAME = re.compile("^[a-zA-Z_]{6,8}$")
 BLOCKS = re.compile("{(});")
@@ -54,24 +87,228 @@ KEYWORDS = [
 
 DATATYPES = [KEYWORDS[0], KEYWORDS[1], KEYWORDS[2], KEYWORDS[3]]
 
+# Token types of words found in KEYWORDS, used by the scanner
+WORDTYPES = {word: KEYWORD for word in KEYWORDS}
+WORDTYPES.update({word: DT for word in DATATYPES})
+WORDTYPES['CHECK'] = CHECK
+WORDTYPES['SPAN'] = SPAN
+WORDTYPES['PSYCH'] = PSYCH
+
+# Single character tokens
+PUNCTUATION = {
+            '+': PLUS,
+            '-': MINUS,
+            '*': MUL,
+            '/': DIV,
+            '%': MOD,
+            '(': LPRN,
+            ')': RPRN,
+            ';': SEMI,
+            '{': LBR,
+            '}': RBR
+        }
+
+# Operator lexemes, read up to the next space like createEquals/createLts/createGts/createBoolOps
+OPERATORS = {
+            '=': EQ,
+            '==': EE,
+            '!=': NE,
+            '!!': NOT,
+            '<': LT,
+            '<=': LTE,
+            '>': GT,
+            '>=': GTE,
+            '&&': AND,
+            '||': OR
+        }
+
+# Characters allowed to follow a number
+NUMSTOP = ' ;)\n'
+
+# Master pattern for Lexer.scan, one alternative per lexeme class.
+# Leading whitespace is consumed by every match so it never produces a token.
+SCANNER = re.compile(
+            "[ \t\n]*(?:"
+            "(?P<NUM>[0-9]+(?:\\.[0-9]*)?)"
+            "|(?P<ID>[a-zA-Z]+)"
+            "|(?P<OP>[=!<>&|][^ ]*)"
+            "|(?P<PUNCT>[-+*/%();{}])"
+            "|(?P<ILLEGAL>[^ \t\n]))")
+NUMGROUP, IDGROUP, OPGROUP, PUNCTGROUP, ILLEGALGROUP = 1, 2, 3, 4, 5
+
+# Token boundary where lexing picks up again after an illegal lexeme
+SPACES = re.compile("[ \t\n]")
+BYTES_SPACES = re.compile(SPACES.pattern.encode())
+# UTF-8 continuation bytes, the bytes of a character after its first one
+CONTINUATION = re.compile(b'[\x80-\xbf]')
+
+# Same pattern and lookup tables for bytes buffers such as the mmap returned by openSource
+BYTES_SCANNER = re.compile(SCANNER.pattern.encode())
+BYTES_PUNCTUATION = {char.encode(): tokenType for char, tokenType in PUNCTUATION.items()}
+
+# Token types of interned words, the tokens with a symbol id
+WORDKINDS = set(WORDTYPES.values()) | {IDENTIFIER}
+
+# Token types whose Token.pos is the start of the lexeme, every other token records its end
+STARTPOS = set(PUNCTUATION.values())
+
+# Default cap on the errors collected from one source before lexing and parsing give up
+MAXERRORS = 100
+
+# Tokens the parser resynchronizes on after a syntax error, besides the `;` ending a statement
+SYNCTOKENS = {RBR, CHECK, SPAN, DT}
+
+# VECTORIZED LEXING
+
+# Byte classes of Lexer.vectorize, a token is a run of bytes of one class
+# Punctuation and illegal bytes are tokens of a byte each
+RUN_SPACE = 0
+RUN_WORD = 1
+RUN_NUMBER = 2 # Digits and dots, runs starting with a dot are illegal
+RUN_OPERATOR = 3
+RUN_PUNCT = 4
+RUN_ILLEGAL = 5
+
+# Sources at least this long are lexed with Lexer.vectorize by lexAndParse,
+# below it the setup of the arrays costs more than tokenize
+VECTORSOURCE = 4 << 10
+
+# bytes.translate table from a byte to its class
+RUNCLASSES = bytearray([RUN_ILLEGAL] * 256)
+for chars, runClass in ((' \t\n', RUN_SPACE), (string.ascii_letters, RUN_WORD), (string.digits+'.', RUN_NUMBER),
+                        ('=!<>&|', RUN_OPERATOR), (''.join(PUNCTUATION), RUN_PUNCT)):
+    for char in chars.encode():
+        RUNCLASSES[char] = runClass
+RUNCLASSES = bytes(RUNCLASSES)
+
+# Words are grouped by a multiplicative hash of their key into 2**WORDBITS slots
+WORDBITS = 16
+WORDHASH = 0x9E3779B97F4A7C15
+
+# Lookup tables of Lexer.vectorize, indexed by byte or by the two bytes of an operator
+if np is not None:
+    PUNCTKINDS = np.zeros(256, np.int32)
+    PUNCTKINDS[[ord(char) for char in PUNCTUATION]] = list(PUNCTUATION.values())
+    NUMSTOPS = np.zeros(256, np.bool_)
+    NUMSTOPS[list(NUMSTOP.encode())] = True
+    OPERATORKINDS = np.zeros(1 << 16, np.int32)
+    for lexeme, tokenType in OPERATORS.items():
+        OPERATORKINDS[int.from_bytes(lexeme.encode().ljust(2, b'\0'), 'big')] = tokenType
+    # Keeps the first n bytes of a little endian word key
+    KEYMASKS = np.array([(1 << 8 * size) - 1 for size in range(9)], np.uint64)
+    LONGWORD = 1 << 63
+
+# TRACE LEVELS
+
+TRACE_OFF = 0 # No parse trace, the plain Parser is used
+TRACE_TEXT = 1 # Buffered "Enter <...>" / "Next token is" text
+TRACE_EVENTS = 2 # Structured events for a callback or a binary log
+
+# Trace events
+TRACE_ENTER = 1
+TRACE_EXIT = 2
+TRACE_TOKEN = 3
+TRACE_ERROR = 4
+
+# Number of trace lines or events kept before a sink writes them out
+TRACEBUFFER = 4096
+
+# Rule names used in the trace, in the order of their ids in a binary log
+RULES = [
+            'stmt',
+            'block_stmt',
+            'if_stmt',
+            'while_stmt',
+            'declare_stmt',
+            'assign_stmt',
+            'expr',
+            'term',
+            'factor',
+            'bool_expr',
+            'band',
+            'beq',
+            'brel',
+            'bexpr',
+            'bterm',
+            'bnot',
+            'bfactor'
+        ]
+RULEIDS = {name: ruleId for ruleId, name in enumerate(RULES)}
+
+# Binary trace record: event, rule id or token kind, token index or message length
+TRACERECORD = struct.Struct('<BHi')
+
+# GRAMMAR
+
+GRAMMAR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'grammar.txt')
+
+# Token type of each terminal spelled in grammar.txt
+TERMINALS = {
+            'check': CHECK,
+            'span': SPAN,
+            'psych': PSYCH,
+            'id': IDENTIFIER,
+            'int_lit': INT,
+            'float_lit': FLOAT,
+            'bool_lit': BOOL,
+            'SHODAI': DT,
+            'NIDAIME': DT,
+            'SANDAIME': DT,
+            'YONDAIME': DT,
+            'HATIDAIME': DT,
+            '{': LBR,
+            '}': RBR,
+            '(': LPRN,
+            ')': RPRN,
+            ';': SEMI,
+            '=': EQ,
+            '+': PLUS,
+            '-': MINUS,
+            '*': MUL,
+            '\\': DIV,
+            '/': DIV,
+            '%': MOD,
+            '||': OR,
+            '&&': AND,
+            '==': EE,
+            '!=': NE,
+            '<': LT,
+            '>': GT,
+            '<=': LTE,
+            '>=': GTE,
+            '!!': NOT
+        }
+
+# Spelling of each token type, used in program listings
+TERMINALNAMES = {tokenType: spelling for spelling, tokenType in TERMINALS.items()}
+TERMINALNAMES[DT] = 'data_type'
+TERMINALNAMES[DIV] = '/'
+TERMINALNAMES[EOF] = 'EOF'
+
 class Error:
-    def __init__(self, pos, errorName, details, fn, ln):
+    def __init__(self, pos, errorName, details, fn, ln, col = None):
         self.pos = pos
         self.errorName = errorName
         self.details = details
         self.fn = fn
         self.ln = ln
+        self.col = col # Column of the start of the lexeme, None when unknown
 
     def __repr__(self):
-        result = f'{self.errorName}: {self.details}\nFile: {self.fn} Line: {self.ln} at {self.pos}'
+        column = '' if self.col is None else f' Column: {self.col}'
+        result = f'{self.errorName}: {self.details}\nFile: {self.fn} Line: {self.ln}{column} at {self.pos}'
         return result
 
 # Token class to store token object with type and value
+# Keywords and identifiers also carry their SymbolTable id in symbol, -1 for other tokens
 class Token:
-    def __init__(self, type_, pos, value = None):
+    __slots__ = ('type', 'pos', 'value', 'symbol')
+
+    def __init__(self, type_, pos, value = None, symbol = -1):
         self.type = type_
         self.pos = pos
         self.value = value
+        self.symbol = symbol
 
     def matches(self, type_, value):
         return self.type == type_ and self.value == value
@@ -80,11 +317,234 @@ class Token:
     def __repr__(self):
         if self.value: return f'Next token is: {self.type}, Next Lexeme is {self.value}'
 
+# Interned keywords and identifiers, numbered in the order they are first seen
+# The keywords come first, with ids in KEYWORDS order, so their token types are
+# precomputed and a word is classified with one dict lookup
+# Each word is kept once, as a str, and looked up by its str or bytes spelling
+class SymbolTable:
+    def __init__(self):
+        self.ids = {} # Spelling -> symbol id
+        self.wordTypes = {} # Spelling -> token type, for lexers that only need the type
+        self.names = [] # Symbol id -> word
+        self.types = [] # Symbol id -> token type
+        for word in KEYWORDS:
+            self.add(word, WORDTYPES[word])
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, word, tokenType):
+        symbol = len(self.names)
+        self.names.append(word)
+        self.types.append(tokenType)
+        self.ids[word] = symbol
+        self.ids[word.encode()] = symbol
+        self.wordTypes[word] = tokenType
+        self.wordTypes[word.encode()] = tokenType
+        return symbol
+
+    # Symbol id of word, a str or bytes, adding it as an identifier when it is new
+    # Returns -1 for a new word that is not a valid variable name
+    def intern(self, word):
+        symbol = self.ids.get(word)
+        if symbol is None:
+            if not isinstance(word, str):
+                word = word.decode('utf-8', 'replace')
+            if not VARNAME.match(word):
+                return -1
+            symbol = self.add(word, IDENTIFIER)
+        return symbol
+
+# Compact token list built by Lexer.tokenize
+# Token kinds and lexeme start/end offsets live in parallel arrays,
+# values are sliced out of the source only when asked for
+# symbols holds the SymbolTable id of keywords and identifiers, -1 for other tokens
+# Offsets are 32 bit, so sources are limited to 2 GiB
+class TokenStream:
+    def __init__(self, fn, source, table = None):
+        self.fn = fn
+        self.source = source
+        self.kinds = array('i')
+        self.starts = array('i')
+        self.ends = array('i')
+        self.symbolIds = None
+        self.table = table # SymbolTable the ids in symbols refer to
+        self.map = None
+
+    # Symbol ids are looked up from the lexemes the first time they are needed,
+    # tokenize already interned every word so it does not pay for the column
+    @property
+    def symbols(self):
+        if self.symbolIds is None:
+            if self.table is None:
+                self.table = SymbolTable()
+            intern = self.table.intern
+            source = self.source
+            self.symbolIds = array('i', [intern(source[start:end]) if kind in WORDKINDS else -1
+                                         for kind, start, end in zip(self.kinds, self.starts, self.ends)])
+        return self.symbolIds
+
+    @symbols.setter
+    def symbols(self, symbolIds):
+        self.symbolIds = symbolIds
+
+    def __len__(self):
+        return len(self.kinds)
+
+    # Returns the Token object for index i, like an entry of the list from Lexer.lex
+    def __getitem__(self, i):
+        return Token(self.kinds[i], self.pos(i), self.value(i), self.symbols[i])
+
+    def __iter__(self):
+        for i in range(len(self.kinds)):
+            yield self[i]
+
+    # Position Lexer.lex records in Token.pos, counted in characters like Error.pos
+    def pos(self, i):
+        offset = self.offset(i)
+        return offset if isinstance(self.source, str) else self.sourceMap().chars(offset)
+
+    # Offset in the source behind pos, bytes in a bytes/mmap source
+    def offset(self, i):
+        return self.starts[i] if self.kinds[i] in STARTPOS else self.ends[i]
+
+    # Lexeme start and end offsets counted in characters
+    def charOffsets(self):
+        if isinstance(self.source, str):
+            return self.starts, self.ends
+        sourceMap = self.sourceMap()
+        return sourceMap.charArray(self.starts), sourceMap.charArray(self.ends)
+
+    # Text of token i
+    def lexeme(self, i):
+        if self.kinds[i] == EOF:
+            return 'EOF'
+        text = self.source[self.starts[i]:self.ends[i]]
+        return text if isinstance(text, str) else text.decode()
+
+    # Zero copy view of token i, only for bytes and mmap sources
+    def view(self, i):
+        return memoryview(self.source)[self.starts[i]:self.ends[i]]
+
+    # Value Lexer.lex stores in Token.value, the interned word for keywords and identifiers
+    def value(self, i):
+        kind = self.kinds[i]
+        if kind == INT:
+            return int(self.source[self.starts[i]:self.ends[i]])
+        elif kind == FLOAT:
+            return float(self.source[self.starts[i]:self.ends[i]])
+        symbol = self.symbols[i]
+        if symbol >= 0:
+            return self.table.names[symbol]
+        return self.lexeme(i)
+
+    # (line, column) of the start of token i and of the position just after it
+    def span(self, i):
+        sourceMap = self.sourceMap()
+        return sourceMap.location(self.starts[i]), sourceMap.location(self.ends[i])
+
+    # SourceMap of the source, built on first use and shared with the Lexer
+    def sourceMap(self):
+        if self.map is None:
+            self.map = SourceMap(self.source)
+        return self.map
+
+    # Materializes every token, same list Lexer.lex returns
+    # A Token only refers to ints and strs, so the cyclic collector is paused while they
+    # are built instead of walking the growing list, which about halves the time on
+    # large sources
+    def tokens(self):
+        source = self.source
+        binary = not isinstance(source, str)
+        names = self.table.names if self.table is not None else None
+        tokens = []
+        append = tokens.append
+        charStarts, charEnds = self.charOffsets()
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            for kind, start, end, symbol, charStart, charEnd in zip(self.kinds, self.starts, self.ends, self.symbols, charStarts, charEnds):
+                if kind == INT:
+                    value = int(source[start:end])
+                elif kind == FLOAT:
+                    value = float(source[start:end])
+                elif kind == EOF:
+                    value = 'EOF'
+                elif symbol >= 0:
+                    value = names[symbol]
+                else:
+                    value = source[start:end]
+                    if binary:
+                        value = value.decode()
+                append(Token(kind, charStart if kind in STARTPOS else charEnd, value, symbol))
+        finally:
+            if collecting:
+                gc.enable()
+        return tokens
+
+# Offsets where the lines of a source start, found with one scan for newlines
+# location bisects them to turn any offset into a 1-based (line, column)
+# Offsets count bytes in a bytes/mmap source, chars turns them into the character
+# offsets Error.pos holds, and columns count characters in either source
+# lineStarts can be given when they were already found, as by Lexer.vectorize, and
+# wide, the offsets of the UTF-8 continuation bytes, for a source that is not kept
+class SourceMap:
+    def __init__(self, source, lineStarts = None, wide = None):
+        self.source = source
+        self.wide = wide
+        if lineStarts is not None:
+            self.lineStarts = lineStarts
+            return
+        newline = '\n' if isinstance(source, str) else b'\n'
+        find = source.find
+        lineStarts = array('i', [0])
+        addStart = lineStarts.append
+        pos = find(newline)
+        while pos >= 0:
+            addStart(pos + 1)
+            pos = find(newline, pos + 1)
+        self.lineStarts = lineStarts
+
+    # Number of lines
+    def __len__(self):
+        return len(self.lineStarts)
+
+    # 1-based line holding offset
+    def line(self, offset):
+        return bisect_right(self.lineStarts, offset)
+
+    # 1-based (line, column) of offset
+    def location(self, offset):
+        line = bisect_right(self.lineStarts, offset)
+        return line, self.chars(offset) - self.chars(self.lineStarts[line - 1]) + 1
+
+    # Characters before offset, the continuation bytes of a bytes/mmap source are found on first use
+    def chars(self, offset):
+        wide = self.wide
+        if wide is None:
+            source = self.source
+            binary = source is not None and not isinstance(source, str)
+            wide = self.wide = array('i', [match.start() for match in CONTINUATION.finditer(source)] if binary else [])
+        return offset - bisect_left(wide, offset) if wide else offset
+
+    # Int array of the character offsets of the byte offsets in offsets
+    def charArray(self, offsets):
+        self.chars(0)
+        wide = self.wide
+        if not wide:
+            return intArray(offsets)
+        return array('i', [offset - bisect_left(wide, offset) for offset in offsets])
+
+# symbols is the SymbolTable keywords and identifiers are interned in, a new one by default
 class Lexer:
-    def __init__(self, fn ,text):
+    def __init__(self, fn ,text, symbols = None):
         self.fn = fn
         self.text = text
+        self.symbols = symbols if symbols is not None else SymbolTable()
         self.ln = 1
+        self.start = 0 # Start of the lexeme being built by a create method
+        self.map = None
+        self.errors = []
         self.position = -1
         self.currentChar = None
         self.advance()
@@ -99,9 +559,13 @@ class Lexer:
         self.ln += 1
 
     # Method to convert strings into tokens or errors
-    # Returns an array of tokens or a single error
-    def lex(self):
+    # Returns an array of tokens and the first error
+    # Up to maxErrors errors are collected in errors, lexing resumes at the next
+    # whitespace after each one, the tokens end in EOF unless the cap was reached
+    def lex(self, maxErrors = 1):
+        assert maxErrors >= 1, "maxErrors must be at least 1"
         tokens = []
+        self.errors = []
 
         while self.currentChar != None:
             if self.currentChar in ' \t\n':
@@ -124,6 +588,9 @@ class Lexer:
             elif self.currentChar == '/':
                 tokens.append(Token(DIV, self.position, '/'))
                 self.advance()
+            elif self.currentChar == '%':
+                tokens.append(Token(MOD, self.position, '%'))
+                self.advance()
             elif self.currentChar == '(':
                 tokens.append(Token(LPRN, self.position, '('))
                 self.advance()
@@ -132,7 +599,8 @@ class Lexer:
                 self.advance()
             elif self.currentChar == '=':
                 tokens.append(self.createEquals())
-                self.advance()
+                if tokens[-1] is not None:
+                    self.advance()
             elif self.currentChar == ';':
                 tokens.append(Token(SEMI, self.position, ';'))
                 self.advance()
@@ -144,38 +612,321 @@ class Lexer:
                 self.advance()
             elif self.currentChar == '!':
                 tokens.append(self.createEquals())
-                self.advance()
+                if tokens[-1] is not None:
+                    self.advance()
             elif self.currentChar == '<':
                 tokens.append(self.createLts())
-                self.advance()
+                if tokens[-1] is not None:
+                    self.advance()
             elif self.currentChar == '>':
                 tokens.append(self.createGts())
-                self.advance()
+                if tokens[-1] is not None:
+                    self.advance()
             elif self.currentChar == '&':
                 tokens.append(self.createBoolOps())
-                self.advance()
+                if tokens[-1] is not None:
+                    self.advance()
             elif self.currentChar == '|':
                 tokens.append(self.createBoolOps())
-                self.advance()
+                if tokens[-1] is not None:
+                    self.advance()
             elif not re.search(DIGITS, self.currentChar) or not re.search(LETTERS, self.currentChar):
                 pos= self.position
                 eName = "IllegalCharError" 
                 detail = "'"+self.currentChar+"'"
+                # A create method that failed left its message in currentChar
+                start = self.start if len(self.currentChar) > 1 else pos
                 self.advance()
-                return tokens, Error(pos, details=detail, errorName=eName,fn = self.fn, ln = self.ln)
+                if tokens and tokens[-1] is None:
+                    tokens.pop()
+                if not self.recover(self.lexError(pos, start, eName, detail), maxErrors):
+                    return tokens, self.errors[0]
             else:
                 pos = self.position
                 char = self.currentChar.split(":")
                 eName = char[0]
                 detail = "'"+char[1]+"'"
                 self.advance()
-                return tokens, Error(pos, details=detail, errorName=eName,fn = self.fn, ln = self.ln)
+                if tokens and tokens[-1] is None:
+                    tokens.pop()
+                if not self.recover(self.lexError(pos, self.start, eName, detail), maxErrors):
+                    return tokens, self.errors[0]
 
         tokens.append(Token(EOF, self.position, 'EOF'))
-        return tokens, None
+        return tokens, self.errors[0] if self.errors else None
+
+    # Records an error found by lex and moves past the illegal lexeme
+    # Returns False once maxErrors errors were recorded
+    def recover(self, error, maxErrors):
+        self.errors.append(error)
+        if len(self.errors) >= maxErrors:
+            return False
+        resume = self.resume(error.pos)
+        self.ln = self.sourceMap().line(resume)
+        self.position = resume - 1
+        self.advance()
+        return True
+
+    # Start of the first whitespace at or after pos, where lexing picks up after an error
+    def resume(self, pos):
+        spaces = SPACES if isinstance(self.text, str) else BYTES_SPACES
+        match = spaces.search(self.text, pos)
+        return match.start() if match else len(self.text)
+
+    # Single pass version of lex built on the SCANNER master pattern
+    # Returns the same tokens and errors as lex without per character dispatch
+    # Runs 5-6x faster than lex, most of what is left is building a Token per lexeme,
+    # which tokenize skips (benchmark --phase lex --phase scan --phase tokenize)
+    def scan(self, maxErrors = 1):
+        stream, error = self.tokenize(maxErrors=maxErrors)
+        return stream.tokens(), error
+
+    # Lexes into a TokenStream, no Token or lexeme string is created per token
+    # Works over a str or over a bytes/mmap buffer from openSource, starting at position
+    # Errors are collected like in lex, the stream ends in EOF unless maxErrors was reached
+    def tokenize(self, position = 0, maxErrors = 1):
+        assert maxErrors >= 1, "maxErrors must be at least 1"
+        text = self.text
+        symbols = self.symbols
+        stream = TokenStream(self.fn, text, symbols)
+        addKind = stream.kinds.append
+        addStart = stream.starts.append
+        addEnd = stream.ends.append
+        binary = not isinstance(text, str)
+        if binary:
+            pattern, punctuation = BYTES_SCANNER, BYTES_PUNCTUATION
+        else:
+            pattern, punctuation = SCANNER, PUNCTUATION
+        words = symbols.wordTypes
+        self.errors = []
+        end = position
+
+        while True:
+            error = None
+            for match in pattern.finditer(text, position):
+                group = match.lastindex
+                lexeme = match[group]
+                end = match.end()
+
+                if group == IDGROUP:
+                    tokenType = words.get(lexeme)
+                    if tokenType is None:
+                        if symbols.intern(lexeme) < 0:
+                            error = self.scanError(match.start(group), end, "Error:Illegal Variable Name")
+                            break
+                        tokenType = IDENTIFIER
+                    addKind(tokenType)
+                    addStart(end - len(lexeme))
+                    addEnd(end)
+                elif group == PUNCTGROUP:
+                    addKind(punctuation[lexeme])
+                    addStart(end - 1)
+                    addEnd(end)
+                elif group == NUMGROUP:
+                    nextChar = text[end:end + 1]
+                    if binary:
+                        lexeme = lexeme.decode()
+                        nextChar = firstChar(text, end) if nextChar >= b'\x80' else nextChar.decode()
+                    if lexeme[-1] == '.':
+                        if nextChar == '' or nextChar == '.' or nextChar in NUMSTOP:
+                            error = self.scanError(match.start(group), end, "IllegalCharError:.")
+                            break
+                        error = self.scanError(match.start(group), end + 1, "IllegalCharError:" + nextChar)
+                        break
+                    if nextChar != '' and nextChar not in NUMSTOP and not (nextChar == '.' and '.' in lexeme):
+                        error = self.scanError(match.start(group), end + 1, "IllegalCharError:" + nextChar)
+                        break
+                    addKind(FLOAT if '.' in lexeme else INT)
+                    addStart(end - len(lexeme))
+                    addEnd(end)
+                elif group == OPGROUP:
+                    if binary:
+                        lexeme = lexeme.decode('utf-8', 'replace')
+                    tokenType = OPERATORS.get(lexeme)
+                    start = match.start(group)
+                    if tokenType is None:
+                        error = self.scanError(start, match.end(group), "IllegalCharError:" + lexeme[-1])
+                        break
+                    addKind(tokenType)
+                    addStart(start)
+                    addEnd(end)
+                    # lex steps over the space that ended the operator
+                    end += 1
+                else:
+                    start = match.start(group)
+                    error = self.scanError(start, start, firstChar(text, start) if binary else lexeme)
+                    break
+            if error is None:
+                break
+            self.errors.append(error)
+            if len(self.errors) >= maxErrors:
+                self.characterPositions()
+                return stream, self.errors[0]
+            position = self.resume(max(error.pos, end))
+
+        addKind(EOF)
+        addStart(len(text))
+        addEnd(max(end, len(text)))
+        stream.map = self.map
+        self.characterPositions()
+        return stream, self.errors[0] if self.errors else None
+
+    # Turns the byte offsets of the errors tokenize found in a bytes/mmap source into
+    # character offsets, as in a str source
+    def characterPositions(self):
+        if self.errors and not isinstance(self.text, str):
+            chars = self.sourceMap().chars
+            for error in self.errors:
+                error.pos = chars(error.pos)
+
+    # Vectorized tokenize for large sources, left to tokenize without numpy or for a
+    # str that is not ASCII
+    # Every byte is classified through RUNCLASSES and tokens are the runs of one class,
+    # found where the class changes. Numbers and operators are checked and typed for all
+    # tokens at once, words are looked up once per distinct spelling. tokenize lexes the
+    # rest of the source from the first lexeme that can be an error, so the tokens,
+    # symbols and errors are always the ones of tokenize
+    def vectorize(self, maxErrors = 1):
+        assert maxErrors >= 1, "maxErrors must be at least 1"
+        text = self.text
+        if np is None or len(text) >= 1 << 31 or isinstance(text, str) and not text.isascii():
+            return self.tokenize(maxErrors=maxErrors)
+        raw = text.encode() if isinstance(text, str) else bytes(text)
+        size = len(raw)
+        padded = np.frombuffer(raw + bytes(16), np.uint8) # Words are read 8 bytes at a time
+        data = padded[:size]
+
+        runs = np.frombuffer(raw.translate(RUNCLASSES), np.uint8)
+        changes = np.ones(size, np.bool_)
+        np.not_equal(runs[1:], runs[:-1], out=changes[1:])
+        changes |= runs >= RUN_PUNCT
+        inside = runs != RUN_SPACE
+        starts = np.flatnonzero(changes & inside)
+        lasts = np.ones(size, np.bool_) # Last byte of a run
+        lasts[:-1] = changes[1:]
+        ends = np.flatnonzero(lasts & inside) + 1
+        firstBytes = data[starts]
+        tokenRuns = runs[starts]
+        following = padded[ends]
+        atEnd = ends == size
+        kinds = PUNCTKINDS[firstBytes]
+        suspect = tokenRuns == RUN_ILLEGAL # Lexemes left to tokenize
+
+        number = np.flatnonzero(tokenRuns == RUN_NUMBER)
+        numberStarts, numberEnds = starts[number], ends[number]
+        dots = np.flatnonzero(data == ord('.'))
+        dotCounts = np.searchsorted(dots, numberEnds) - np.searchsorted(dots, numberStarts)
+        kinds[number] = np.where(dotCounts, FLOAT, INT)
+        suspect[number] |= ((firstBytes[number] == ord('.')) | (data[numberEnds - 1] == ord('.')) | (dotCounts > 1)
+                            | ~(NUMSTOPS[following[number]] | atEnd[number]))
+
+        operator = np.flatnonzero(tokenRuns == RUN_OPERATOR)
+        lengths = ends[operator] - starts[operator]
+        seconds = np.where(lengths == 2, padded[starts[operator] + 1], 0)
+        operatorKinds = OPERATORKINDS[firstBytes[operator].astype(np.int32) << 8 | seconds]
+        kinds[operator] = operatorKinds
+        suspect[operator] |= (operatorKinds == 0) | (lengths > 2) | ~((following[operator] == ord(' ')) | atEnd[operator])
+
+        # Words of up to 8 letters are keyed by their bytes, longer ones by their id
+        # among the longer words with LONGWORD set, letters never set the top bit
+        word = np.flatnonzero(tokenRuns == RUN_WORD)
+        wordStarts = starts[word]
+        lengths = ends[word] - wordStarts
+        windows = np.lib.stride_tricks.sliding_window_view(padded, 8)
+        keys = windows[wordStarts].view('<u8').ravel() & KEYMASKS[np.minimum(lengths, 8)]
+        longWords = np.flatnonzero(lengths > 8)
+        if len(longWords):
+            tails = windows[wordStarts[longWords] + 8].view('<u8').ravel() & KEYMASKS[np.minimum(lengths[longWords] - 8, 8)]
+            pairs, pairIds = np.unique(np.stack([keys[longWords], tails], 1), axis=0, return_inverse=True)
+            keys[longWords] = pairIds.ravel().astype(np.uint64) | LONGWORD
+            suspect[word[longWords]] |= lengths[longWords] > 16
+
+        # Each distinct key is a group, the hash slot of its key unless another key took
+        # the slot, the few keys left over get groups past the slots
+        groups = (keys * np.uint64(WORDHASH) >> np.uint64(64 - WORDBITS)).astype(np.intp)
+        slots = np.zeros(1 << WORDBITS, np.uint64)
+        slots[groups] = keys
+        clashes = np.flatnonzero(slots[groups] != keys)
+        groupCount = 1 << WORDBITS
+        if len(clashes):
+            clashKeys, clashIds = np.unique(keys[clashes], return_inverse=True)
+            groups[clashes] = groupCount + clashIds.ravel()
+            groupCount += len(clashKeys)
+        firsts = np.full(groupCount, len(keys), np.intp)
+        np.minimum.at(firsts, groups, np.arange(len(keys)))
+        used = np.flatnonzero(firsts < len(keys))
+        used = used[np.argsort(firsts[used], kind='stable')] # In order of first appearance
+
+        ids = self.symbols.ids
+        spellings = []
+        for first, key in zip(firsts[used].tolist(), keys[firsts[used]].tolist()):
+            if key & LONGWORD:
+                spelling = b''.join(part.to_bytes(8, 'little') for part in pairs[key ^ LONGWORD].tolist()).rstrip(b'\0')
+            else:
+                spelling = key.to_bytes(8, 'little').rstrip(b'\0')
+            if spelling not in ids and not VARNAME.match(spelling.decode()):
+                suspect[word[first]] = True
+            spellings.append(spelling)
+
+        suspects = np.flatnonzero(suspect)
+        count = int(suspects[0]) if len(suspects) else len(starts)
+        # New words are interned in the order tokenize would meet them
+        wordCount = int(np.searchsorted(word, count))
+        intern = self.symbols.intern
+        groupSymbols = np.full(groupCount, -1, np.int32)
+        for group, first, spelling in zip(used.tolist(), firsts[used].tolist(), spellings):
+            if first >= wordCount:
+                break
+            groupSymbols[group] = intern(spelling)
+        wordSymbols = groupSymbols[groups[:wordCount]]
+        symbols = np.full(count, -1, np.int32)
+        symbols[word[:wordCount]] = wordSymbols
+        kinds[word[:wordCount]] = np.array(self.symbols.types, np.int32)[wordSymbols]
+
+        stream = TokenStream(self.fn, text, self.symbols)
+        stream.kinds = array('i', kinds[:count].tobytes())
+        stream.starts = array('i', starts[:count].astype(np.int32).tobytes())
+        stream.ends = array('i', ends[:count].astype(np.int32).tobytes())
+        stream.symbols = array('i', symbols.tobytes())
+        self.errors = []
+        if count < len(starts):
+            # Lines start after each newline
+            lineStarts = np.append(0, np.flatnonzero(data == ord('\n')) + 1).astype(np.int32)
+            self.map = SourceMap(text, array('i', lineStarts.tobytes()))
+            rest, error = self.tokenize(int(starts[count]), maxErrors)
+            stream.kinds.extend(rest.kinds)
+            stream.starts.extend(rest.starts)
+            stream.ends.extend(rest.ends)
+            stream.symbols.extend(rest.symbols)
+            stream.map = self.map
+            return stream, error
+        # tokenize steps over the space after an operator, even at the end of the source
+        end = int(ends[-1]) + (tokenRuns[-1] == RUN_OPERATOR) if count else 0
+        stream.kinds.append(EOF)
+        stream.starts.append(size)
+        stream.ends.append(max(end, size))
+        stream.symbols.append(-1)
+        stream.map = self.map
+        return stream, None
+
+    # Builds the IllegalCharError lex reports for the lexeme starting at start
+    def scanError(self, start, pos, char):
+        return self.lexError(pos, start, "IllegalCharError", "'"+char+"'")
+
+    # Error at pos located at the line and column of the lexeme starting at start
+    def lexError(self, pos, start, errorName, details):
+        line, col = self.sourceMap().location(start)
+        return Error(pos, errorName, details, self.fn, line, col)
+
+    # SourceMap of the text, built on the first error
+    def sourceMap(self):
+        if self.map is None:
+            self.map = SourceMap(self.text)
+        return self.map
 
     # Method to create Int or Float token returns error if not a match
     def createNumber(self):
+            self.start = self.position
             numStr = ''
             dotCount = 0
             
@@ -185,10 +936,10 @@ class Lexer:
                     dotCount += 1
                 numStr += self.currentChar
                 self.advance()
-                if not re.search(DIGITS, numStr):
+                if not re.search(FLOATS if dotCount else DIGITS, numStr):
                     break
 
-            if not re.search(DIGITS, numStr):
+            if not re.search(FLOATS if dotCount else DIGITS, numStr) or numStr[-1] == '.':
                 self.currentChar = "IllegalCharError:"+ numStr[-1]
                 return
             if dotCount == 0:
@@ -198,13 +949,15 @@ class Lexer:
                 return Token(FLOAT, self.position, float(numStr))
     
     # Method to create Identifier, Keyword, Data Type token returns error if not a match
+    # The word is classified by its symbol, interned on first sight
     def createIdentifier(self):
+        self.start = self.position
         idStr = ''
 
         while self.currentChar != None and self.currentChar != ' ' and self.currentChar != ')':
             idStr += self.currentChar
             self.advance()
-            if not re.search(LETTERS, self.currentChar):
+            if self.currentChar is None or not re.search(LETTERS, self.currentChar):
                 break
             
 
@@ -212,28 +965,15 @@ class Lexer:
             self.currentChar = "IllegalCharError:"+ idStr[-1]
             return
 
-        if idStr in KEYWORDS:
-            if idStr in DATATYPES:
-                tokenType = DT
-            elif idStr == 'CHECK':
-                tokenType = CHECK
-            elif idStr == 'SPAN':
-                tokenType = SPAN
-            else: tokenType = KEYWORD
-        else:
-            tokenType = IDENTIFIER
-
-        if tokenType == IDENTIFIER:
-            if not re.search(VARNAME, idStr):
-                print(idStr)
-                self.currentChar = "Error:Illegal Variable Name"
-                return
-            else: return Token(tokenType, self.position, idStr)
-        else:
-            return Token(tokenType, self.position, idStr)
+        symbol = self.symbols.intern(idStr)
+        if symbol < 0:
+            self.currentChar = "Error:Illegal Variable Name"
+            return
+        return Token(self.symbols.types[symbol], self.position, self.symbols.names[symbol], symbol)
 
     # Creates tokens for =, == , !=, and !! returns error if not a match
     def createEquals(self):
+        self.start = self.position
         idStr = ''
 
         while self.currentChar != None and self.currentChar != ' ':
@@ -245,7 +985,7 @@ class Lexer:
         elif idStr == '==':
             return Token(EE, self.position, '==')
         elif idStr == '!=':
-            return Token(EE, self.position, '!=')
+            return Token(NE, self.position, '!=')
         elif idStr == '!!':
             return Token(NOT, self.position, '!!')
         else:
@@ -254,6 +994,7 @@ class Lexer:
 
     # Creates tokens for <, and <= returns error if not a match
     def createLts(self):
+        self.start = self.position
         idStr = ''
 
         while self.currentChar != None and self.currentChar != ' ':
@@ -262,7 +1003,7 @@ class Lexer:
 
         if idStr == '<':
             return Token(LT, self.position, '<')
-        elif idStr == '==':
+        elif idStr == '<=':
             return Token(LTE, self.position, '<=')
         else:
             self.currentChar = "IllegalCharError:"+ idStr[-1]
@@ -270,6 +1011,7 @@ class Lexer:
 
     # Creates tokens for >, and >= returns error if not a match
     def createGts(self):
+        self.start = self.position
         idStr = ''
 
         while self.currentChar != None and self.currentChar != ' ':
@@ -278,7 +1020,7 @@ class Lexer:
 
         if idStr == '>':
             return Token(GT, self.position, '>')
-        elif idStr == '==':
+        elif idStr == '>=':
             return Token(GTE, self.position, '>=')
         else:
             self.currentChar = "IllegalCharError:"+ idStr[-1]
@@ -286,6 +1028,7 @@ class Lexer:
 
     # Creates tokens for AND, and OR returns error if not a match
     def createBoolOps(self):
+        self.start = self.position
         idStr = ''
 
         while self.currentChar != None and self.currentChar != ' ':
@@ -302,318 +1045,3887 @@ class Lexer:
 
 
 
+# AST NODES
+
+NODE_PROGRAM = 1
+NODE_BLOCK = 2
+NODE_IF = 3
+NODE_WHILE = 4
+NODE_DECLARE = 5
+NODE_ASSIGN = 6
+NODE_BINARY = 7 # Token is the operator
+NODE_NOT = 8
+NODE_NAME = 9
+NODE_INT = 10
+NODE_FLOAT = 11
+NODE_BOOL = 12
+
+# Binary operator precedence for Parser.climb, higher binds tighter, all left associative
+# First column is the <bool_expr> family, second the <expr> family, 0 when not part of it
+# Follows grammar.txt, where <expr> binds `+` and `-` tighter than `*`, `\` and `%`
+PRECEDENCE = {
+            OR: (1, 0),
+            AND: (2, 0),
+            EE: (3, 0),
+            NE: (3, 0),
+            LT: (4, 0),
+            GT: (4, 0),
+            LTE: (4, 0),
+            GTE: (4, 0),
+            PLUS: (5, 2),
+            MINUS: (5, 2),
+            MUL: (6, 1),
+            DIV: (6, 1),
+            MOD: (6, 1)
+        }
+BOOLPRECEDENCE = {tokenType: levels[0] for tokenType, levels in PRECEDENCE.items() if levels[0]}
+EXPRPRECEDENCE = {tokenType: levels[1] for tokenType, levels in PRECEDENCE.items() if levels[1]}
+BEXPRLEVEL = PRECEDENCE[PLUS][0] # Lowest level inside the parentheses of <bfactor>
+
+NODENAMES = [None, 'PROGRAM', 'BLOCK', 'IF', 'WHILE', 'DECLARE', 'ASSIGN', 'BINARY', 'NOT', 'NAME', 'INT', 'FLOAT', 'BOOL']
+
+# Node kinds of the literal and identifier tokens
+LEAVES = {
+            IDENTIFIER: NODE_NAME,
+            INT: NODE_INT,
+            FLOAT: NODE_FLOAT,
+            BOOL: NODE_BOOL
+        }
+LITERALNODES = {NODE_INT, NODE_FLOAT, NODE_BOOL}
+
+# Abstract syntax tree stored in flat arrays, one entry per node
+# Nodes are added children first, so every child index is lower than its parent's
+# and a forward pass over the arrays visits nodes bottom up without recursion
+#   kinds[n]     NODE_* kind of node n
+#   tokenIdx[n]  index of the token the node was built from, -1 for PROGRAM
+#   firsts[n]    start of the node's children in children
+#   counts[n]    number of children
+# Literals computed by the Optimizer keep their value in values, keyed by node
+class AST:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.kinds = array('i')
+        self.tokenIdx = array('i')
+        self.firsts = array('i')
+        self.counts = array('i')
+        self.children = array('i')
+        self.values = {}
+        self.root = -1
+
+    def __len__(self):
+        return len(self.kinds)
+
+    # Adds a node and returns its index, children of -1 (failed productions) are left out
+    def add(self, kind, token, children = ()):
+        if -1 in children:
+            children = [child for child in children if child != -1]
+        self.kinds.append(kind)
+        self.tokenIdx.append(token)
+        self.firsts.append(len(self.children))
+        self.counts.append(len(children))
+        self.children.extend(children)
+        return len(self.kinds) - 1
+
+    # Child indices of node
+    def childrenOf(self, node):
+        first = self.firsts[node]
+        return self.children[first:first + self.counts[node]]
+
+    # Token kind of the node's token, the operator of BINARY and NOT nodes
+    def tokenType(self, node):
+        token = self.tokenIdx[node]
+        if isinstance(self.tokens, TokenStream):
+            return self.tokens.kinds[token]
+        return self.tokens[token].type
+
+    # Value of the node's token, the name or literal of leaves
+    def value(self, node):
+        if node in self.values:
+            return self.values[node]
+        token = self.tokenIdx[node]
+        if isinstance(self.tokens, TokenStream):
+            return self.tokens.value(token)
+        return self.tokens[token].value
+
+    # SymbolTable id of the node's token, names compare as ints through it
+    def symbol(self, node):
+        token = self.tokenIdx[node]
+        if isinstance(self.tokens, TokenStream):
+            return self.tokens.symbols[token]
+        return self.tokens[token].symbol
+
+    # Yields (node, depth) in source order using an explicit stack
+    def walk(self, node = None):
+        stack = [(self.root if node is None else node, 0)]
+        while stack:
+            node, depth = stack.pop()
+            yield node, depth
+            stack.extend((child, depth + 1) for child in reversed(self.childrenOf(node)))
+
+    # Indented text form of the tree, one node per line
+    def dump(self, node = None):
+        lines = []
+        for node, depth in self.walk(node):
+            line = '  ' * depth + NODENAMES[self.kinds[node]]
+            if self.tokenIdx[node] >= 0 or node in self.values:
+                line += ' ' + str(self.value(node))
+            lines.append(line)
+        return '\n'.join(lines)
+
 class Parser:
-    def __init__(self, fn ,tokens):
+    # tokens is the list from Lexer.lex/scan or a TokenStream from Lexer.tokenize
+    # Parsing stops after maxErrors syntax errors, see recover
+    def __init__(self, fn ,tokens, maxErrors = 1):
+        assert maxErrors >= 1, "maxErrors must be at least 1"
         self.Error = False
+        self.maxErrors = maxErrors
+        self.errors = []
+        self.errorTokens = [] # Token index of each error in errors
         self.fn = fn
         self.tokens = tokens
+        # Only token kinds are needed to parse, a TokenStream is read without creating Tokens
+        self.kinds = tokens.kinds if isinstance(tokens, TokenStream) else [token.type for token in tokens]
+        self.ast = AST(tokens)
         self.idx = -1
-        self.currentToken = tokens[self.idx]
+        self.currentType = self.kinds[self.idx]
         self.getNextToken()
-    
+
+    # Token object at the current position
+    @property
+    def currentToken(self):
+        return self.tokens[self.idx]
+
     # Method to advance to next token
     def getNextToken(self):
-        if self.idx < len(self.tokens):
+        if self.idx < len(self.kinds) - 1:
             self.idx += 1
-            self.currentToken = self.tokens[self.idx]
-            return print(self.currentToken)
-        else:
-            return
-    
+            self.currentType = self.kinds[self.idx]
+
     # Method to parse through list of tokens
+    # Returns the AST, check errors for syntax errors
     def parse(self):
-        res = self.start()
-        return res
+        self.ast.root = self.start()
+        return self.ast
 
     # Parses strings in the language gnerated by the rule
-    # <start --> <stmt> 
+    # <start --> { <stmt> }
     def start(self):
-        while self.currentToken.type != EOF or not self.Error:
-            self.stmt()
-            if self.Error == True:
-                break
-            else:
-                self.getNextToken()
+        statements = []
+        while self.currentType != EOF and not self.Error:
+            first = self.idx
+            statements.append(self.stmt())
+            if self.Error:
+                self.recover(first)
+        return self.ast.add(NODE_PROGRAM, -1, statements)
 
     # Parses strings in the language gnerated by the rule
     # <stmt> --> <if_stmt> | <while_stmt> | <declare_stmt> | <assign_stmt> | <block> 
     def stmt(self):
-        print("Enter <stmt>")
-        # self.getNextToken()
-        # while self.idx < len(self.tokens):
-        if self.currentToken.type == CHECK:
-            self.if_stmt()
-        elif self.currentToken.type == SPAN:
-            self.while_stmt()
-        elif self.currentToken.type == DT:
-            self.declare_stmt()
-        elif self.currentToken.type == IDENTIFIER:
-            self.assign_stmt()
-        elif self.currentToken.type == LBR:
-            self.block()
-        elif self.currentToken.type == EOF:
-            return
+        if self.currentType == CHECK:
+            return self.if_stmt()
+        elif self.currentType == SPAN:
+            return self.while_stmt()
+        elif self.currentType == DT:
+            return self.declare_stmt()
+        elif self.currentType == IDENTIFIER:
+            return self.assign_stmt()
+        elif self.currentType == LBR:
+            return self.block()
         else:
             self.error("Inside stmt")
-        print("Exit <stmt>")
+            return -1
 
     # Parses strings in the language generated by the rule
-    # <block> --> `{` { <stmt>`;` } `}`
+    # <block> --> `{` { <stmt> } `}`
+    # Statements end with their own `;`
     def block(self):
-        print("Enter <block_stmt>")
-        if self.currentToken.type != LBR:
+        if self.currentType != LBR:
             self.error("Expected {")
-        else:
-            self.getNextToken()
-            self.stmt() 
-            # if self.currentToken.type != SEMI:
-            #     self.error("Expected ; from inside block")
-            # else:
-            self.getNextToken()
-            if self.currentToken.type != RBR:
-                self.error("Expected }")
-
-        print("Exit <block_stmt>")
+            return -1
+        token = self.idx
+        self.getNextToken()
+        statements = []
+        while self.currentType != RBR and self.currentType != EOF and not self.Error:
+            first = self.idx
+            statements.append(self.stmt())
+            if self.Error:
+                self.recover(first)
+        if self.Error:
+            return -1
+        if self.currentType != RBR:
+            self.error("Expected }")
+            return -1
+        self.getNextToken()
+        return self.ast.add(NODE_BLOCK, token, statements)
 
     # Parses the string in the language generated by the rule
     # <if_stmt> -->  `check``(`<bool_expr>`)` <block> [ `psych` <block> ] 
     def if_stmt(self):
-        print("Enter <if_stmt>")
-        if not self.currentToken.type == CHECK:
+        if not self.currentType == CHECK:
             self.error("Expected CHECK")
-        else:
+            return -1
+        token = self.idx
+        self.getNextToken()
+        if self.currentType != LPRN:
+            self.error("Expected LPRN")
+            return -1
+        self.getNextToken()
+        condition = self.bool_expr()
+        if self.currentType != RPRN:
+            self.error("Expected RPRN")
+            return -1
+        self.getNextToken()
+        children = [condition, self.block()]
+        if self.currentType == PSYCH:
             self.getNextToken()
-            if self.currentToken.type != LPRN:
-                self.error("Expected LPRN")
-            else:
-                self.getNextToken()
-                self.bool_expr()
-                if self.currentToken.type != RPRN:
-                    self.error("Expected RPRN")
-                else:
-                    self.getNextToken()
-                    self.block()
-                    if self.currentToken.type!= RBR:
-                        self.error("Expected RBR")
-                    else:
-                        self.getNextToken()
-                        if self.currentToken.type == PSYCH:
-                            self.getNextToken()
-                            self.block()
-                        else:
-                            self.error("Expected PSYCH")
-    print("Exit <if_stmt>")
+            children.append(self.block())
+        return self.ast.add(NODE_IF, token, children)
+
+    # Parses <bool_expr> by precedence climbing, see climb
+    def bool_expr(self):
+        return self.climb(True, 1)
 
     # Parses the string in the language generated by the rule
     # <bool_expr> --> <band> { `OR` <band> } 
-    def bool_expr(self):
-        print("Enter <bool_expr>")
-        self.band()
-        while self.currentToken.type == OR:
+    # Recursive descent form of bool_expr, one call per grammar rule, kept for the parse trace
+    def descendBoolExpr(self):
+        left = self.band()
+        while self.currentType == OR:
+            token = self.idx
             self.getNextToken()
-            self.band()
-        print("Exit <bool_expr>")
+            left = self.ast.add(NODE_BINARY, token, (left, self.band()))
+        return left
 
     # Parses the string in the language generated by the rule
     # <beq> { `AND` <beq> }
     def band(self):
-        print("Enter <band>")
-        self.beq()
-        while self.currentToken.type == AND:
+        left = self.beq()
+        while self.currentType == AND:
+            token = self.idx
             self.getNextToken()
-            self.beq()
-
-        print("Exit <band>")
+            left = self.ast.add(NODE_BINARY, token, (left, self.beq()))
+        return left
 
     # Parses the string in the language generated by the rule
     # <brel> { (`!=`|`==`) <brel> }
     def beq(self):
-        print("Enter <beq>")
-        self.brel()
-        while self.currentToken.type == EE or self.currentToken.type == NE:
+        left = self.brel()
+        while self.currentType == EE or self.currentType == NE:
+            token = self.idx
             self.getNextToken()
-            self.brel()
-        print("Exit <beq>")
+            left = self.ast.add(NODE_BINARY, token, (left, self.brel()))
+        return left
 
     # Parses the string in the language generated by the rule
     # <expr> { (`<=`|`>=` | `<` | `>`) <expr> }
     def brel(self):
-        print("Enter <brel>")
-        self.bexpr()
-        while self.currentToken.type == LT or self.currentToken.type == GT or self.currentToken.type == LTE or self.currentToken.type == GTE:
+        left = self.bexpr()
+        while self.currentType == LT or self.currentType == GT or self.currentType == LTE or self.currentType == GTE:
+            token = self.idx
             self.getNextToken()
-            self.bexpr()
-        print("Exit <brel>")
-
+            left = self.ast.add(NODE_BINARY, token, (left, self.bexpr()))
+        return left
 
     # Parses the string in the language generated by the rule
     # <bterm> { (`+`|`-`) <bterm> }
     def bexpr(self):
-        print("Enter <bexpr>")
-        self.bterm()
-        while self.currentToken.type == PLUS or self.currentToken.type == MINUS:
+        left = self.bterm()
+        while self.currentType == PLUS or self.currentType == MINUS:
+            token = self.idx
             self.getNextToken()
-            self.bterm()
-        print("Exit <bexpr>")
+            left = self.ast.add(NODE_BINARY, token, (left, self.bterm()))
+        return left
 
     # Parses the string in the language generated by the rule
     # <bnot> { (`*`|`\`|`%`) <bnot> }
     def bterm(self):
-        print("Enter <bterm>")
-        self.bnot()
-        while self.currentToken.type == MUL or self.currentToken.type == DIV or self.currentToken.type == MOD:
+        left = self.bnot()
+        while self.currentType == MUL or self.currentType == DIV or self.currentType == MOD:
+            token = self.idx
             self.getNextToken()
-            self.bnot()
-        print("Exit <bterm>")
+            left = self.ast.add(NODE_BINARY, token, (left, self.bnot()))
+        return left
 
     # Parses the string in the language generated by the rule
     # [!!]<bfactor>
     def bnot(self):
-        print("Enter <bnot>")
-        self.bfactor()
-        while self.currentToken.type == NOT:
+        if self.currentType == NOT:
+            token = self.idx
             self.getNextToken()
-            self.bfactor()
-        print("Exit <bnot>")
-        pass
+            return self.ast.add(NODE_NOT, token, (self.bfactor(),))
+        return self.bfactor()
 
     # Parses the string in the language generated by the rule
     # <bfactor> --> `id` | `int_lit` | `float_lit` | `bool_lit` | `(` <bexpr> `)`
     def bfactor(self):
-        print("Enter <bfactor>")
-        if self.currentToken.type == IDENTIFIER or self.currentToken.type == INT or self.currentToken.type == FLOAT or self.currentToken.type == BOOL:
+        if self.currentType == IDENTIFIER or self.currentType == INT or self.currentType == FLOAT or self.currentType == BOOL:
+            node = self.ast.add(LEAVES[self.currentType], self.idx)
             self.getNextToken()
-        elif self.currentToken.type == LPRN:
+            return node
+        elif self.currentType == LPRN:
             self.getNextToken()
-            self.bexpr()
-            if self.currentToken.type == RPRN:
+            node = self.bexpr()
+            if self.currentType == RPRN:
                 self.getNextToken()
-            else:
-                self.error()
+                return node
+            self.error("Expected )")
         else:
-            self.error
-
-        print("Exit <bfactor>")
+            self.error("From bfactor")
+        return -1
 
     # Parses strings in the language generated by the rule:
     # <while_stmt> --> `span``(`<bool_expr>`)` <block> 
     def while_stmt(self):
-        print("Enter <while_stmt>")
-        if self.currentToken.type == SPAN:
-            self.getNextToken()
-            if self.currentToken.type == LPRN:
-                self.getNextToken()
-                self.bexpr()
-                if self.currentToken.type == RPRN:
-                    self.getNextToken()
-                    self.block()
-                else:
-                    self.error("Expected )")
-            else:
-                self.error("Expected (")
-        else:
+        if self.currentType != SPAN:
             self.error("Expected SPAN")
+            return -1
+        token = self.idx
+        self.getNextToken()
+        if self.currentType != LPRN:
+            self.error("Expected (")
+            return -1
+        self.getNextToken()
+        condition = self.bool_expr()
+        if self.currentType != RPRN:
+            self.error("Expected )")
+            return -1
+        self.getNextToken()
+        return self.ast.add(NODE_WHILE, token, (condition, self.block()))
 
-        print("Exit <while_stmt>")
-    
     # Parses strings in the language generated by the rule:
-    # <assign_stmt> --> `id` `=` <expr> 
+    # <assign_stmt> --> `id` {`=` <expr>} `;`
     def assign_stmt(self):
-        print("Enter <assign_stmt>")
-        if self.currentToken.type == IDENTIFIER:
-            self.getNextToken()
-            if self.currentToken.type == SEMI:
-                self.getNextToken()
-            else:
-                if self.currentToken.type != EQ:
-                    self.error("Expected =")
-                else:
-                    self.getNextToken()
-                    self.expr()
-                    if self.currentToken.type != SEMI:
-                        self.error("Expected ;")
-                        return
-                        # return Error(pos = 0, details ="Expected SEMI token", errorName = "IllegalSyntaxError", fn = self.fn, ln = 1)
-        else:
+        if self.currentType != IDENTIFIER:
             self.error("Error from assign_stmt")
-        
-        print("Exit <assign_stmt>")
-    
+            return -1
+        token = self.idx
+        name = self.ast.add(NODE_NAME, token)
+        self.getNextToken()
+        if self.currentType == SEMI:
+            self.getNextToken()
+            return self.ast.add(NODE_ASSIGN, token, (name,))
+        if self.currentType != EQ:
+            self.error("Expected =")
+            return -1
+        self.getNextToken()
+        value = self.expr()
+        if self.currentType != SEMI:
+            self.error("Expected ;")
+            return -1
+        self.getNextToken()
+        return self.ast.add(NODE_ASSIGN, token, (name, value))
+
     # Parses strings in the language generated by the rule:
     # <declare_stmt> --> `data_type` <assign_stmt> 
     def declare_stmt(self):
-        if self.currentToken.type == DT:
-            print("Enter <declare_stmt>")
-            self.getNextToken()
-            self.assign_stmt()
-        else:
+        if self.currentType != DT:
             self.error("Expected DT token")
+            return -1
+        token = self.idx
+        self.getNextToken()
+        return self.ast.add(NODE_DECLARE, token, (self.assign_stmt(),))
 
-        print("Exit <declare_stmt>")
-
-
+    # Parses <expr> by precedence climbing, see climb
+    def expr(self):
+        return self.climb(False, 1)
 
     # Parses strings in the language generated by the rule:
     # <expr> --> <term> { (`*`|`\`|`%`)  <term> }
-    def expr(self):
-        print("Enter <expr>")
-        self.term()
-        while self.currentToken.type == MUL or self.currentToken.type == DIV or self.currentToken.type == MOD:
+    # Recursive descent form of expr, one call per grammar rule, kept for the parse trace
+    def descendExpr(self):
+        left = self.term()
+        while self.currentType == MUL or self.currentType == DIV or self.currentType == MOD:
+            token = self.idx
             self.getNextToken()
-            self.term()
-        print("Exit <expr>")
-    
+            left = self.ast.add(NODE_BINARY, token, (left, self.term()))
+        return left
+
     # Parses strings in the language generated by the rule:
     # <term> --> <factor> { (`+`|`-`) <factor> }
     def term(self):
-        print("Enter <term>")
-        self.factor()
-        while self.currentToken.type == PLUS  or self.currentToken.type == MINUS:
+        left = self.factor()
+        while self.currentType == PLUS  or self.currentType == MINUS:
+            token = self.idx
             self.getNextToken()
-            self.factor()
-        print("Exit <term>")
-    
+            left = self.ast.add(NODE_BINARY, token, (left, self.factor()))
+        return left
+
     # Parses strings in the language generated by the rule:
     # <factor> --> `id` | `int_lit` | `float_lit` | `(` <expr> `)`
     def factor(self):
-        print("Enter <factor>")
-        if self.currentToken.type == IDENTIFIER or self.currentToken.type == INT or self.currentToken.type == FLOAT:
+        if self.currentType == IDENTIFIER or self.currentType == INT or self.currentType == FLOAT:
+            node = self.ast.add(LEAVES[self.currentType], self.idx)
             self.getNextToken()
-        elif self.currentToken.type == LPRN:
+            return node
+        elif self.currentType == LPRN:
             self.getNextToken()
-            self.expr()
-            if self.currentToken.type == RPRN:
+            node = self.expr()
+            if self.currentType == RPRN:
                 self.getNextToken()
-            else:
-                self.error("Expected }")
+                return node
+            self.error("Expected )")
         else:
             self.error("From factor")
+        return -1
+
+    # Parses a <bool_expr> (boolean=True) or <expr> (boolean=False) in one loop
+    # using the PRECEDENCE column of that family, and builds the same nodes as the
+    # recursive rules. Operands and pending operators are kept on explicit stacks,
+    # only parenthesized expressions recurse.
+    # minimum is the lowest precedence accepted, parentheses in <bfactor> hold a <bexpr>
+    def climb(self, boolean, minimum):
+        precedence = BOOLPRECEDENCE if boolean else EXPRPRECEDENCE
+        node = self.operand(boolean)
+        level = precedence.get(self.currentType, 0)
+        if level < minimum:
+            return node
+
+        add = self.ast.add
+        operands = [node]
+        levels = []
+        operators = []
+        while True:
+            levels.append(level)
+            operators.append(self.idx)
+            self.getNextToken()
+            operands.append(self.operand(boolean))
+            level = precedence.get(self.currentType, 0)
+            if level < minimum:
+                level = 0
+            # Reduce operators binding at least as tight, operators are left associative
+            while levels and levels[-1] >= level:
+                levels.pop()
+                right = operands.pop()
+                operands[-1] = add(NODE_BINARY, operators.pop(), (operands[-1], right))
+            if not level:
+                return operands[0]
 
-        print("Exit <factor>")
+    # Operand for climb, [!!]<bfactor> when boolean else <factor>
+    def operand(self, boolean):
+        currentType = self.currentType
+        if currentType == IDENTIFIER or currentType == INT or currentType == FLOAT or (boolean and currentType == BOOL):
+            node = self.ast.add(LEAVES[currentType], self.idx)
+            self.getNextToken()
+            return node
+        elif currentType == LPRN:
+            self.getNextToken()
+            node = self.climb(boolean, BEXPRLEVEL if boolean else 1)
+            if self.currentType == RPRN:
+                self.getNextToken()
+                return node
+            self.error("Expected )")
+        elif boolean and currentType == NOT:
+            token = self.idx
+            self.getNextToken()
+            if self.currentType == NOT:
+                # A second !! fails bfactor, bnot still builds the NOT over it
+                self.error("From bfactor")
+                return self.ast.add(NODE_NOT, token, (-1,))
+            return self.ast.add(NODE_NOT, token, (self.operand(boolean),))
+        else:
+            self.error("From bfactor" if boolean else "From factor")
+        return -1
 
+    # Records a syntax error, run prints them once parsing is done
+    # Errors cascading from it are dropped until recover resynchronizes
     def error(self, details):
-        print("InvalidSyntaxError: "+details)
+        if self.Error:
+            return
+        self.errors.append(details)
+        self.errorTokens.append(self.idx)
         self.Error = True
-        return
 
-# Method to execute lexer and parser on text file.
-def run(fn):
-    print("\nRunning file: "+fn+'\n')
-    fileObj = open(fn, "r")
-    text = fileObj.read()
-
-	# Generate tokens
-    lexer = Lexer(fn, text)
-    tokens, error = lexer.lex()
-    if error: print(error)
-    else: 
-        print(*tokens, sep="\n")
-        print("Lexeme count: "+ str(len(tokens))+'\n')
-        
-        # Generate Parse Trace
-        Parser(fn, tokens).parse()
+    # Panic mode recovery after an error in the statement starting at token first
+    # Skips to just past the next `;` or to the next `}`, CHECK, SPAN or data type
+    # unless the statement already ended at one. Blocks, including those the
+    # statement opened, are skipped whole and at least one token is skipped
+    # Once maxErrors errors were found Error stays set and parsing stops
+    def recover(self, first):
+        if len(self.errors) >= self.maxErrors:
+            return
+        self.Error = False
+        kinds = self.kinds
+        depth = 0
+        for kind in kinds[first:self.idx]:
+            if kind == LBR:
+                depth += 1
+            elif kind == RBR and depth:
+                depth -= 1
+        while self.currentType != EOF:
+            currentType = self.currentType
+            # A PSYCH block still belongs to the failed CHECK
+            if depth == 0 and self.idx > first and currentType != PSYCH and (kinds[self.idx - 1] == SEMI or kinds[self.idx - 1] == RBR or currentType in SYNCTOKENS):
+                return
+            if currentType == LBR:
+                depth += 1
+            elif currentType == RBR and depth:
+                depth -= 1
+            elif currentType == SEMI and depth == 0:
+                self.getNextToken()
+                return
+            self.getNextToken()
+
+    # Error objects for the recorded syntax errors, tokens must be a TokenStream
+    def diagnostics(self):
+        stream = self.tokens
+        sourceMap = stream.sourceMap()
+        errors = []
+        for details, idx in zip(self.errors, self.errorTokens):
+            line, col = sourceMap.location(stream.starts[idx])
+            errors.append(Error(stream.pos(idx), "InvalidSyntaxError", details, self.fn, line, col))
+        return errors
+
+# Parser that reports every rule it enters and exits and every token it reads to a trace sink
+# Kept apart from Parser so parsing without a trace pays nothing for it
+class TracingParser(Parser):
+    def __init__(self, fn, tokens, sink, maxErrors = 1):
+        self.sink = sink
+        Parser.__init__(self, fn, tokens, maxErrors)
+
+    def getNextToken(self):
+        if self.idx < len(self.kinds) - 1:
+            Parser.getNextToken(self)
+            self.sink.token(self.tokens, self.idx)
+
+    def stmt(self):
+        self.sink.enter('stmt')
+        node = Parser.stmt(self)
+        self.sink.exit('stmt')
+        return node
+
+    def block(self):
+        self.sink.enter('block_stmt')
+        node = Parser.block(self)
+        self.sink.exit('block_stmt')
+        return node
+
+    def if_stmt(self):
+        self.sink.enter('if_stmt')
+        node = Parser.if_stmt(self)
+        self.sink.exit('if_stmt')
+        return node
+
+    def bool_expr(self):
+        self.sink.enter('bool_expr')
+        node = Parser.descendBoolExpr(self)
+        self.sink.exit('bool_expr')
+        return node
+
+    def band(self):
+        self.sink.enter('band')
+        node = Parser.band(self)
+        self.sink.exit('band')
+        return node
+
+    def beq(self):
+        self.sink.enter('beq')
+        node = Parser.beq(self)
+        self.sink.exit('beq')
+        return node
+
+    def brel(self):
+        self.sink.enter('brel')
+        node = Parser.brel(self)
+        self.sink.exit('brel')
+        return node
+
+    def bexpr(self):
+        self.sink.enter('bexpr')
+        node = Parser.bexpr(self)
+        self.sink.exit('bexpr')
+        return node
+
+    def bterm(self):
+        self.sink.enter('bterm')
+        node = Parser.bterm(self)
+        self.sink.exit('bterm')
+        return node
+
+    def bnot(self):
+        self.sink.enter('bnot')
+        node = Parser.bnot(self)
+        self.sink.exit('bnot')
+        return node
+
+    def bfactor(self):
+        self.sink.enter('bfactor')
+        node = Parser.bfactor(self)
+        self.sink.exit('bfactor')
+        return node
+
+    def while_stmt(self):
+        self.sink.enter('while_stmt')
+        node = Parser.while_stmt(self)
+        self.sink.exit('while_stmt')
+        return node
+
+    def assign_stmt(self):
+        self.sink.enter('assign_stmt')
+        node = Parser.assign_stmt(self)
+        self.sink.exit('assign_stmt')
+        return node
+
+    def declare_stmt(self):
+        self.sink.enter('declare_stmt')
+        node = Parser.declare_stmt(self)
+        self.sink.exit('declare_stmt')
+        return node
+
+    def expr(self):
+        self.sink.enter('expr')
+        node = Parser.descendExpr(self)
+        self.sink.exit('expr')
+        return node
+
+    def term(self):
+        self.sink.enter('term')
+        node = Parser.term(self)
+        self.sink.exit('term')
+        return node
+
+    def factor(self):
+        self.sink.enter('factor')
+        node = Parser.factor(self)
+        self.sink.exit('factor')
+        return node
+
+    def error(self, details):
+        if not self.Error:
+            self.sink.error("InvalidSyntaxError: "+details)
+        Parser.error(self, details)
+
+# Trace sink writing the original text trace to a stream in batches
+class TextTrace:
+    def __init__(self, stream = None, size = TRACEBUFFER):
+        self.stream = stream if stream is not None else sys.stdout
+        self.size = size
+        self.chunks = []
+
+    # Adds raw text, used by run for the lines around the parse trace
+    def write(self, text):
+        self.chunks.append(text)
+        if len(self.chunks) >= self.size:
+            self.flush()
+
+    def enter(self, rule):
+        self.write("Enter <"+rule+">\n")
+
+    def exit(self, rule):
+        self.write("Exit <"+rule+">\n")
+
+    def token(self, tokens, idx):
+        self.write(repr(tokens[idx])+"\n")
+
+    def error(self, message):
+        self.write(message+"\n")
+
+    def flush(self):
+        if self.chunks:
+            self.stream.write(''.join(self.chunks))
+            self.chunks = []
+        self.stream.flush()
+
+# Trace sink passing batches of (event, value) tuples to callback
+# value is the rule name for TRACE_ENTER/TRACE_EXIT, the token index for TRACE_TOKEN
+# and the message for TRACE_ERROR
+class EventTrace:
+    def __init__(self, callback, size = TRACEBUFFER):
+        self.callback = callback
+        self.size = size
+        self.events = []
+
+    # Free text is only part of the text trace
+    def write(self, text):
+        pass
+
+    def enter(self, rule):
+        self.events.append((TRACE_ENTER, rule))
+        if len(self.events) >= self.size:
+            self.flush()
+
+    def exit(self, rule):
+        self.events.append((TRACE_EXIT, rule))
+        if len(self.events) >= self.size:
+            self.flush()
+
+    def token(self, tokens, idx):
+        self.events.append((TRACE_TOKEN, idx))
+        if len(self.events) >= self.size:
+            self.flush()
+
+    def error(self, message):
+        self.events.append((TRACE_ERROR, message))
+        self.flush()
+
+    def flush(self):
+        if self.events:
+            self.callback(self.events)
+            self.events = []
+
+# Trace sink writing TRACERECORD records to a binary file, read back with readTrace
+# Errors are a record holding the message length followed by the UTF-8 message
+class BinaryTrace:
+    def __init__(self, fileObj, size = TRACEBUFFER):
+        self.fileObj = fileObj
+        self.limit = size * TRACERECORD.size
+        self.buffer = bytearray()
+
+    def write(self, text):
+        pass
+
+    def enter(self, rule):
+        self.buffer += TRACERECORD.pack(TRACE_ENTER, RULEIDS[rule], 0)
+        if len(self.buffer) >= self.limit:
+            self.flush()
+
+    def exit(self, rule):
+        self.buffer += TRACERECORD.pack(TRACE_EXIT, RULEIDS[rule], 0)
+        if len(self.buffer) >= self.limit:
+            self.flush()
+
+    def token(self, tokens, idx):
+        kinds = tokens.kinds if isinstance(tokens, TokenStream) else None
+        kind = kinds[idx] if kinds is not None else tokens[idx].type
+        self.buffer += TRACERECORD.pack(TRACE_TOKEN, kind, idx)
+        if len(self.buffer) >= self.limit:
+            self.flush()
+
+    def error(self, message):
+        data = message.encode()
+        self.buffer += TRACERECORD.pack(TRACE_ERROR, 0, len(data)) + data
+        if len(self.buffer) >= self.limit:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.fileObj.write(self.buffer)
+            self.buffer = bytearray()
+        self.fileObj.flush()
+
+# Reads a log written by BinaryTrace back as the (event, value) tuples EventTrace produces
+# TRACE_TOKEN values are (token kind, token index) pairs
+def readTrace(fileObj):
+    data = fileObj.read()
+    offset = 0
+    while offset < len(data):
+        event, rule, value = TRACERECORD.unpack_from(data, offset)
+        offset += TRACERECORD.size
+        if event == TRACE_TOKEN:
+            yield event, (rule, value)
+        elif event == TRACE_ERROR:
+            yield event, data[offset:offset + value].decode()
+            offset += value
+        else:
+            yield event, RULES[rule]
+
+# Trace sink counting, for every rule, the calls, the time spent with and without
+# the rules it calls, and the tokens read while it was active
+# The same counters are kept for the Lexer helpers by ProfilingLexer
+# Time under a rule that calls itself is counted once in total, at its outermost call
+class Profile:
+    def __init__(self, clock = time.perf_counter):
+        self.clock = clock
+        self.stats = {} # Rule -> [calls, total seconds, self seconds, tokens]
+        self.stacks = {} # Semicolon joined rule stack -> self seconds
+        self.frames = [] # [rule, stack, start time, time in callees, tokens at start]
+        self.active = {} # Rule -> calls of it in frames
+        self.consumed = 0 # Tokens read or created so far
+
+    def write(self, text):
+        pass
+
+    def enter(self, rule):
+        frames = self.frames
+        stack = frames[-1][1] + ';' + rule if frames else rule
+        frames.append([rule, stack, self.clock(), 0.0, self.consumed])
+        self.active[rule] = self.active.get(rule, 0) + 1
+
+    def exit(self, rule):
+        now = self.clock()
+        rule, stack, started, callees, consumed = self.frames.pop()
+        elapsed = now - started
+        stats = self.stats.get(rule)
+        if stats is None:
+            stats = self.stats[rule] = [0, 0.0, 0.0, 0]
+        depth = self.active[rule] - 1
+        self.active[rule] = depth
+        stats[0] += 1
+        stats[2] += elapsed - callees
+        if not depth:
+            stats[1] += elapsed
+            stats[3] += self.consumed - consumed
+        self.stacks[stack] = self.stacks.get(stack, 0.0) + elapsed - callees
+        if self.frames:
+            self.frames[-1][3] += elapsed
+
+    def token(self, tokens, idx):
+        self.consumed += 1
+
+    def error(self, message):
+        pass
+
+    def flush(self):
+        pass
+
+    # Text table of the rules, most self time first
+    def table(self):
+        lines = ['rule'.ljust(18)+'calls'.rjust(10)+'total ms'.rjust(12)+'self ms'.rjust(12)+'tokens'.rjust(10)]
+        for rule, (calls, total, own, tokens) in sorted(self.stats.items(), key=lambda item: -item[1][2]):
+            lines.append(rule.ljust(18)+str(calls).rjust(10)+('%.3f' % (total * 1000)).rjust(12)+('%.3f' % (own * 1000)).rjust(12)+str(tokens).rjust(10))
+        return '\n'.join(lines)
+
+    # Collapsed stacks for flamegraph.pl and compatible viewers, one
+    # "rule;rule;rule microseconds" line per stack, self time only
+    def collapsed(self):
+        return ''.join(stack+' '+str(int(round(seconds * 1e6)))+'\n' for stack, seconds in sorted(self.stacks.items()))
+
+# Lexer reporting its create helpers to a Profile, under a lex rule
+# Helpers count the tokens they create, lex all of its tokens
+# The single pass tokenize does not use the helpers and shows as one rule
+class ProfilingLexer(Lexer):
+    def __init__(self, fn, text, profile):
+        self.profile = profile
+        Lexer.__init__(self, fn, text)
+
+    def lex(self, maxErrors = 1):
+        profile = self.profile
+        consumed = profile.consumed
+        profile.enter('lex')
+        tokens, error = Lexer.lex(self, maxErrors)
+        profile.consumed = consumed + len(tokens)
+        profile.exit('lex')
+        return tokens, error
+
+    def tokenize(self, position = 0, maxErrors = 1):
+        self.profile.enter('tokenize')
+        stream, error = Lexer.tokenize(self, position, maxErrors)
+        self.profile.consumed += len(stream)
+        self.profile.exit('tokenize')
+        return stream, error
+
+    def helper(self, name, create):
+        self.profile.enter(name)
+        token = create(self)
+        if token is not None:
+            self.profile.consumed += 1
+        self.profile.exit(name)
+        return token
+
+    def createNumber(self):
+        return self.helper('createNumber', Lexer.createNumber)
+
+    def createIdentifier(self):
+        return self.helper('createIdentifier', Lexer.createIdentifier)
+
+    def createEquals(self):
+        return self.helper('createEquals', Lexer.createEquals)
+
+    def createLts(self):
+        return self.helper('createLts', Lexer.createLts)
+
+    def createGts(self):
+        return self.helper('createGts', Lexer.createGts)
+
+    def createBoolOps(self):
+        return self.helper('createBoolOps', Lexer.createBoolOps)
+
+# Lexes and parses fn with every rule and lexer helper profiled
+# scan=True lexes with tokenize over a memory map instead of lex
+# Returns the Profile, plain Lexer and Parser runs are not slowed down by it
+def profileFile(fn, scan = False, maxErrors = MAXERRORS, profile = None):
+    profile = profile or Profile()
+    source = openSource(fn) if scan else open(fn, "r").read()
+    try:
+        lexer = ProfilingLexer(fn, source, profile)
+        tokens, error = lexer.tokenize(maxErrors=maxErrors) if scan else lexer.lex(maxErrors)
+        if len(lexer.errors) < maxErrors:
+            parser = TracingParser(fn, tokens, profile, maxErrors - len(lexer.errors))
+            profile.enter('parse')
+            parser.parse()
+            profile.exit('parse')
+    finally:
+        if isinstance(source, mmap.mmap):
+            source.close()
+    return profile
+
+# Builds the sink for a trace level
+# target is the stream for TRACE_TEXT, and a callback or binary file for TRACE_EVENTS
+def makeTrace(level, target = None):
+    if level == TRACE_TEXT:
+        return TextTrace(target)
+    elif level == TRACE_EVENTS:
+        return EventTrace(target) if callable(target) else BinaryTrace(target)
+    return None
+
+# Returns a plain Parser when sink is None, a TracingParser otherwise
+def makeParser(fn, tokens, sink = None, maxErrors = 1):
+    if sink is None:
+        return Parser(fn, tokens, maxErrors)
+    return TracingParser(fn, tokens, sink, maxErrors)
+
+# Node kind of a literal computed by the Optimizer, bool is checked before int
+def literalKind(value):
+    if isinstance(value, bool):
+        return NODE_BOOL
+    return NODE_INT if isinstance(value, int) else NODE_FLOAT
+
+# Integer division and remainder truncate toward zero, as in C
+def divide(left, right):
+    if isinstance(left, float) or isinstance(right, float):
+        return left / right
+    quotient = abs(left) // abs(right)
+    return -quotient if (left < 0) != (right < 0) else quotient
+
+def remainder(left, right):
+    if isinstance(left, float) or isinstance(right, float):
+        if not right:
+            raise ZeroDivisionError("float modulo")
+        return math.fmod(left, right)
+    return left - right * divide(left, right)
+
+# Operation of each binary operator token on constant operands
+OPERATIONS = {
+            PLUS: lambda left, right: left + right,
+            MINUS: lambda left, right: left - right,
+            MUL: lambda left, right: left * right,
+            DIV: divide,
+            MOD: remainder,
+            LT: lambda left, right: left < right,
+            GT: lambda left, right: left > right,
+            LTE: lambda left, right: left <= right,
+            GTE: lambda left, right: left >= right,
+            EE: lambda left, right: left == right,
+            NE: lambda left, right: left != right,
+            AND: lambda left, right: bool(left) and bool(right),
+            OR: lambda left, right: bool(left) or bool(right)
+        }
+
+# Operators whose result is a bool
+BOOLOPERATORS = {LT, GT, LTE, GTE, EE, NE, AND, OR}
+
+# Constant folding and simplification of the expressions of an error free AST
+# optimize returns a new AST where
+#   operators on constant operands are replaced by their result,
+#   x*1, 1*x, x/1 and x-0 with int 1 or 0 become x unless x is a bool, which arithmetic
+#   turns into an int, and x+0 and 0+x become x only when x is an int, as -0.0 + 0 is 0.0,
+#   && and || with a constant left operand are short circuited,
+#   x && true and x || false become x,
+#   names declared with a constant initializer and never assigned again
+#   become that constant after the declaration, inside the block holding it
+# Operations that fail, like division by a constant zero, are left for run time
+# Variables hold what assignments store, ints and floats, and reading an unassigned one
+# fails at the x that is kept as it did at the operator
+# The counters tell what was done, report sums them up
+class Optimizer:
+    def __init__(self, ast):
+        self.ast = ast
+        self.folded = 0 # Operators replaced by their result
+        self.simplified = 0 # Identities and short circuits removed
+        self.propagated = 0 # Names replaced by their constant
+        self.removed = 0 # Nodes in ast minus nodes in the result
+
+    # Returns the optimized AST, ast is left as it is
+    # Old nodes are visited in index order, so children come before their parents
+    def optimize(self):
+        ast = self.ast
+        result = AST(ast.tokens)
+        kinds = ast.kinds
+        tokenIdx = ast.tokenIdx
+        count = len(kinds)
+        nodes = [-1] * count # New node of each old node, -1 while only its constant exists
+        values = {} # Old node -> constant value
+        booleans = set() # Old nodes of bool type
+        integers = set() # Old nodes of int type, bools excluded
+        targets, constantNames, parents = self.assignments()
+        constants = {} # Name -> (value, token of the declaration, block holding it)
+
+        # Node in result for old node child, constants are only added once a parent needs them
+        def place(child):
+            node = nodes[child]
+            if node < 0:
+                value = values[child]
+                node = nodes[child] = result.add(literalKind(value), tokenIdx[child])
+                if kinds[child] not in LITERALNODES or child in changed:
+                    result.values[node] = value
+            return node
+        changed = set() # Old nodes whose constant is not the value of their own token
+
+        for node in range(count):
+            kind = kinds[node]
+            children = ast.childrenOf(node)
+            if kind in LITERALNODES:
+                values[node] = ast.value(node)
+                if kind == NODE_BOOL:
+                    booleans.add(node)
+                elif kind == NODE_INT:
+                    integers.add(node)
+                continue
+            if kind == NODE_NAME and node not in targets:
+                constant = constants.get(ast.symbol(node))
+                if constant is not None and tokenIdx[node] > constant[1] and self.inside(node, constant[2], parents):
+                    values[node] = constant[0]
+                    changed.add(node)
+                    if isinstance(constant[0], bool):
+                        booleans.add(node)
+                    elif isinstance(constant[0], int):
+                        integers.add(node)
+                    self.propagated += 1
+                    continue
+            elif kind == NODE_BINARY and len(children) == 2:
+                if self.binary(node, children, values, booleans, integers, changed, nodes):
+                    continue
+            elif kind == NODE_NOT and len(children) == 1:
+                booleans.add(node)
+                if children[0] in values:
+                    values[node] = not values[children[0]]
+                    changed.add(node)
+                    self.folded += 1
+                    continue
+            elif kind == NODE_ASSIGN and len(children) == 2 and node in constantNames and children[1] in values:
+                constants[constantNames[node]] = (values[children[1]], tokenIdx[node], parents[parents[node]])
+            nodes[node] = result.add(kind, tokenIdx[node], [place(child) for child in children])
+
+        result.root = place(ast.root) if ast.root >= 0 else -1
+        self.removed = len(ast) - len(result)
+        return result
+
+    # Folds or simplifies BINARY node with children left and right
+    # Returns True when node became a constant or one of its operands
+    def binary(self, node, children, values, booleans, integers, changed, nodes):
+        left, right = children
+        operator = self.ast.tokenType(node)
+        if operator in BOOLOPERATORS:
+            booleans.add(node)
+        elif (left in integers or left in booleans) and (right in integers or right in booleans):
+            # Arithmetic on ints and bools gives an int
+            integers.add(node)
+        if left in values and right in values:
+            try:
+                values[node] = OPERATIONS[operator](values[left], values[right])
+            except (ArithmeticError, ValueError):
+                return False
+            changed.add(node)
+            self.folded += 1
+            return True
+
+        keep = -1
+        if operator == AND or operator == OR:
+            if left in values:
+                # false && x and true || x never look at x, true && x and false || x are x when x is a bool
+                if bool(values[left]) == (operator == OR):
+                    values[node] = operator == OR
+                    changed.add(node)
+                    self.simplified += 1
+                    return True
+                if right in booleans:
+                    keep = right
+            # x && true and x || false are x when x is a bool
+            elif right in values and bool(values[right]) == (operator == AND) and left in booleans:
+                keep = left
+        elif right in values and type(values[right]) is int and left not in booleans:
+            if (values[right] == 1 and (operator == MUL or operator == DIV)
+                    or values[right] == 0 and (operator == MINUS or operator == PLUS and left in integers)):
+                keep = left
+        elif left in values and type(values[left]) is int and right not in booleans:
+            if values[left] == 1 and operator == MUL or values[left] == 0 and operator == PLUS and right in integers:
+                keep = right
+        if keep < 0:
+            return False
+        # The node stands for the operand it keeps
+        nodes[node] = nodes[keep]
+        if keep in values:
+            values[node] = values[keep]
+        if keep in booleans:
+            booleans.add(node)
+        if keep in integers:
+            integers.add(node)
+        self.simplified += 1
+        return True
+
+    # Old NAME nodes that are assignment targets, the declared name symbol of each declaring
+    # ASSIGN with an initializer whose name is never assigned again, and the parent of each node
+    def assignments(self):
+        ast = self.ast
+        kinds = ast.kinds
+        targets = set()
+        assigned = {}
+        declared = {}
+        parents = array('i', [-1]) * len(kinds)
+        for node in range(len(kinds)):
+            for child in ast.childrenOf(node):
+                parents[child] = node
+            kind = kinds[node]
+            if kind == NODE_ASSIGN:
+                name = ast.childrenOf(node)[0]
+                targets.add(name)
+                symbol = ast.symbol(name)
+                assigned[symbol] = assigned.get(symbol, 0) + 1
+            elif kind == NODE_DECLARE:
+                assign = ast.childrenOf(node)[0]
+                if ast.counts[assign] == 2:
+                    declared[assign] = ast.symbol(ast.childrenOf(assign)[0])
+        return targets, {assign: name for assign, name in declared.items() if assigned[name] == 1}, parents
+
+    # True when node lies inside block
+    def inside(self, node, block, parents):
+        while node >= 0:
+            if node == block:
+                return True
+            node = parents[node]
+        return False
+
+    # One line summary of what optimize did
+    def report(self):
+        return (str(self.removed)+' of '+str(len(self.ast))+' AST nodes removed: '+str(self.folded)+' folded, '
+                +str(self.simplified)+' simplified, '+str(self.propagated)+' names propagated')
+
+# SEMANTIC ANALYSIS
+
+# Name resolution over an error free AST, from Parser or Optimizer
+# The program and every block are scopes, a declaration is visible from the end of
+# its statement to the end of its block, and a name in an inner block may shadow one
+# declared outside it. Every declaration gets a dense slot with its data type, and
+# every NAME node is resolved to the slot it refers to
+#   slots     slot of each node, -1 for nodes that are not names and undeclared names
+#   names     variable name of each slot
+#   types     data type spelling of each slot
+#   declared  DECLARE node of each slot
+# All undeclared and duplicate names are counted, the first maxErrors are reported
+class Analyzer:
+    def __init__(self, fn, ast, maxErrors = MAXERRORS):
+        self.fn = fn
+        self.ast = ast
+        self.maxErrors = maxErrors
+        self.slots = array('i', [-1]) * len(ast)
+        self.names = []
+        self.types = []
+        self.declared = array('i')
+        self.scopes = 0 # Scopes opened
+        self.undeclared = 0
+        self.duplicates = 0
+        self.errors = []
+
+    # Resolves every name and returns the errors, Error objects in source order
+    def analyze(self):
+        ast = self.ast
+        kinds, firsts, counts, children, tokenIdx = ast.kinds, ast.firsts, ast.counts, ast.children, ast.tokenIdx
+        # Names compare as symbol ids, read straight from the column of a TokenStream
+        symbols = ast.tokens.symbols if isinstance(ast.tokens, TokenStream) else None
+        slots = self.slots
+        scopes = [] # Symbol id -> slot, innermost scope last
+        # Node n is visited, -1 closes the innermost scope and -2 - d declares the name of DECLARE node d
+        stack = [ast.root]
+        push = stack.append
+        while stack:
+            node = stack.pop()
+            if node < 0:
+                if node == -1:
+                    scopes.pop()
+                else:
+                    declaration = -2 - node
+                    name = children[firsts[children[firsts[declaration]]]]
+                    symbol = symbols[tokenIdx[name]] if symbols is not None else ast.symbol(name)
+                    slots[name] = self.declare(name, symbol, declaration, scopes[-1])
+                continue
+            kind = kinds[node]
+            if kind == NODE_NAME:
+                symbol = symbols[tokenIdx[node]] if symbols is not None else ast.symbol(node)
+                slots[node] = self.resolve(node, symbol, scopes)
+            elif kind == NODE_DECLARE:
+                assign = children[firsts[node]]
+                # The name is declared after its initializer, which cannot see it
+                push(-2 - node)
+                if counts[assign] == 2:
+                    push(children[firsts[assign] + 1])
+            else:
+                if kind == NODE_PROGRAM or kind == NODE_BLOCK:
+                    scopes.append({})
+                    self.scopes += 1
+                    push(-1)
+                first = firsts[node]
+                stack.extend(reversed(children[first:first + counts[node]]))
+        self.errors.sort(key=lambda error: error.pos)
+        return self.errors
+
+    # Slot of the name node in the innermost scope declaring symbol, -1 and an error when none does
+    def resolve(self, node, symbol, scopes):
+        for scope in reversed(scopes):
+            slot = scope.get(symbol)
+            if slot is not None:
+                return slot
+        self.undeclared += 1
+        self.error(node, "Undeclared variable "+str(self.ast.value(node)))
+        return -1
+
+    # New slot for the name node, holding symbol, declared by DECLARE node declaration in scope
+    # A second declaration in the same scope is reported and refers to the first slot
+    def declare(self, node, symbol, declaration, scope):
+        ast = self.ast
+        slot = scope.get(symbol)
+        if slot is not None:
+            self.duplicates += 1
+            line = self.location(ast.tokenIdx[self.declared[slot]])[1]
+            self.error(node, "Duplicate declaration of "+str(ast.value(node))+(", first declared on line "+str(line) if line else ''))
+            return slot
+        slot = scope[symbol] = len(self.names)
+        self.names.append(ast.value(node))
+        self.types.append(ast.value(declaration))
+        self.declared.append(declaration)
+        return slot
+
+    # (pos, line, column) of token idx, line and column are 0 and None for a Token list without its source
+    def location(self, idx):
+        tokens = self.ast.tokens
+        if isinstance(tokens, TokenStream):
+            sourceMap = tokens.sourceMap()
+            line, col = sourceMap.location(tokens.starts[idx])
+            return tokens.pos(idx), line, col
+        return tokens[idx].pos, 0, None
+
+    def error(self, node, details):
+        if len(self.errors) >= self.maxErrors:
+            return
+        pos, line, col = self.location(self.ast.tokenIdx[node])
+        self.errors.append(Error(pos, "SemanticError", details, self.fn, line, col))
+
+    # One line summary of what analyze found
+    def report(self):
+        return (str(len(self.names))+' variables in '+str(self.scopes)+' scopes: '+str(self.undeclared)+' undeclared, '
+                +str(self.duplicates)+' duplicate')
+
+# BYTECODE
+
+# Instructions are (opcode, argument) pairs in an array('i'), the argument is 0 when unused
+# The VM keeps the value being computed in an accumulator, binary operators take their
+# right operand from a slot and only operands that are themselves operations go through
+# the stack. Constants are kept in the slots after the variables, so LOAD reads both.
+OP_HALT = 0
+OP_LOAD = 1 # Accumulator = slot arg
+OP_STORE = 2 # Slot arg = accumulator
+OP_PUSH = 3 # Push the accumulator
+OP_ADD = 4 # Accumulator = accumulator + slot arg, same for OP_SUB to OP_NE
+OP_SUB = 5
+OP_MUL = 6
+OP_DIV = 7
+OP_MOD = 8
+OP_LT = 9
+OP_GT = 10
+OP_LTE = 11
+OP_GTE = 12
+OP_EE = 13
+OP_NE = 14
+OP_BINARY = 15 # Accumulator = popped value <operator token arg> accumulator
+OP_NOT = 16
+OP_BOOL = 17 # Accumulator = truth value of the accumulator
+OP_JUMP = 18 # Continue at instruction arg
+OP_JUMPFALSE = 19 # Continue at arg when the accumulator is false
+OP_JUMPTRUE = 20 # Continue at arg when the accumulator is true
+OP_AND = 21 # When the accumulator is false make it False and continue at arg
+OP_OR = 22 # When the accumulator is true make it True and continue at arg
+
+OPNAMES = ['HALT', 'LOAD', 'STORE', 'PUSH', 'ADD', 'SUB', 'MUL', 'DIV', 'MOD', 'LT', 'GT', 'LTE', 'GTE', 'EE', 'NE',
+           'BINARY', 'NOT', 'BOOL', 'JUMP', 'JUMPFALSE', 'JUMPTRUE', 'AND', 'OR']
+
+# Opcode of each binary operator token with a slot operand, && and || jump instead
+BINARYOPS = {
+            PLUS: OP_ADD,
+            MINUS: OP_SUB,
+            MUL: OP_MUL,
+            DIV: OP_DIV,
+            MOD: OP_MOD,
+            LT: OP_LT,
+            GT: OP_GT,
+            LTE: OP_LTE,
+            GTE: OP_GTE,
+            EE: OP_EE,
+            NE: OP_NE
+        }
+
+# Operator giving the same result with its operands exchanged
+SWAPPED = {
+            PLUS: PLUS,
+            MUL: MUL,
+            EE: EE,
+            NE: NE,
+            LT: GT,
+            GT: LT,
+            LTE: GTE,
+            GTE: LTE
+        }
+
+# Instructions VM.run executes before it stops a program
+BUDGET = 100000000
+
+# Compiled program
+#   code       array('i') of (opcode, argument) pairs, jump arguments are offsets into code
+#   names      variable name of each of the first slots
+#   constants  values of the slots after them
+#   tokens     token index of each instruction, for the location of run time errors
+class Program:
+    def __init__(self, fn, code, names, constants, tokens, source):
+        self.fn = fn
+        self.code = code
+        self.names = names
+        self.constants = constants
+        self.tokens = tokens
+        self.source = source # Token list or TokenStream the AST was built from
+
+    # Name or constant held by slot
+    def slotName(self, slot):
+        if slot < len(self.names):
+            return self.names[slot]
+        return repr(self.constants[slot - len(self.names)])
+
+    # One instruction per line
+    def dump(self):
+        lines = []
+        for pc in range(0, len(self.code), 2):
+            op, arg = self.code[pc], self.code[pc + 1]
+            line = str(pc).rjust(5) + ' ' + OPNAMES[op]
+            if OP_LOAD <= op <= OP_STORE or OP_ADD <= op <= OP_NE:
+                line += ' ' + self.slotName(arg)
+            elif op == OP_BINARY:
+                line += ' ' + TERMINALNAMES[arg]
+            elif op >= OP_JUMP:
+                line += ' ' + str(arg)
+            lines.append(line)
+        return '\n'.join(lines)
+
+# Compiles an error free AST, from Parser or Optimizer, to a Program
+# Every name gets one slot, CHECK/PSYCH become forward jumps and
+# SPAN tests its condition at the bottom of the loop and jumps back to its body
+# With an Analyzer that resolved ast without errors, names use its slots, so a
+# shadowing declaration gets a variable of its own
+class Compiler:
+    def __init__(self, fn, ast, analyzer = None):
+        self.fn = fn
+        self.ast = ast
+        self.analyzer = analyzer
+        self.code = array('i')
+        self.tokens = array('i')
+        self.slots = {} # Symbol id of a name -> its slot
+        self.names = list(analyzer.names) if analyzer is not None else []
+        self.constants = {} # (type, value) -> index in the constant slots
+
+    def compile(self):
+        self.stmt(self.ast.root)
+        self.emit(OP_HALT, 0, -1)
+        # Constant slots follow the variables, now that their number is known
+        base = len(self.names)
+        code = self.code
+        for pc in range(0, len(code), 2):
+            if code[pc + 1] < 0 and (OP_LOAD <= code[pc] <= OP_STORE or OP_ADD <= code[pc] <= OP_NE):
+                code[pc + 1] = base + ~code[pc + 1]
+        constants = [value for valueType, value in self.constants]
+        return Program(self.fn, code, self.names, constants, self.tokens, self.ast.tokens)
+
+    # Appends an instruction and returns its offset
+    def emit(self, op, arg, token):
+        self.code.append(op)
+        self.code.append(arg)
+        self.tokens.append(token)
+        return len(self.code) - 2
+
+    # Points the jump at offset to the next instruction
+    def patch(self, offset):
+        self.code[offset + 1] = len(self.code)
+
+    # Slot of a NAME or literal node, constants are numbered ~index until compile places them
+    def slot(self, node):
+        ast = self.ast
+        if ast.kinds[node] == NODE_NAME:
+            if self.analyzer is not None:
+                return self.analyzer.slots[node]
+            symbol = ast.symbol(node)
+            slot = self.slots.get(symbol)
+            if slot is None:
+                slot = self.slots[symbol] = len(self.slots)
+                self.names.append(ast.value(node))
+            return slot
+        value = ast.value(node)
+        # 1, 1.0 and True are kept apart
+        key = (type(value), value)
+        index = self.constants.get(key)
+        if index is None:
+            index = self.constants[key] = len(self.constants)
+        return ~index
+
+    def stmt(self, node):
+        ast = self.ast
+        kind = ast.kinds[node]
+        children = ast.childrenOf(node)
+        token = ast.tokenIdx[node]
+        if kind == NODE_PROGRAM or kind == NODE_BLOCK:
+            for child in children:
+                self.stmt(child)
+        elif kind == NODE_DECLARE:
+            self.stmt(children[0])
+        elif kind == NODE_ASSIGN:
+            slot = self.slot(children[0])
+            if len(children) == 2:
+                self.expr(children[1])
+                self.emit(OP_STORE, slot, token)
+        elif kind == NODE_IF:
+            skips = self.branch(children[0], False)
+            self.stmt(children[1])
+            if len(children) == 3:
+                end = self.emit(OP_JUMP, 0, token)
+                for offset in skips:
+                    self.patch(offset)
+                self.stmt(children[2])
+                self.patch(end)
+            else:
+                for offset in skips:
+                    self.patch(offset)
+        elif kind == NODE_WHILE:
+            test = self.emit(OP_JUMP, 0, token)
+            body = len(self.code)
+            self.stmt(children[1])
+            self.patch(test)
+            for offset in self.branch(children[0], True):
+                self.code[offset + 1] = body
+
+    # Compiles a CHECK or SPAN condition into jumps taken when its truth value is when
+    # && and || become jumps instead of bool values, NOT swaps when
+    # Returns the offsets of the jumps, the caller patches their target
+    def branch(self, node, when):
+        ast = self.ast
+        kind = ast.kinds[node]
+        if kind == NODE_NOT:
+            return self.branch(ast.childrenOf(node)[0], not when)
+        if kind == NODE_BINARY:
+            operator = ast.tokenType(node)
+            if operator == AND or operator == OR:
+                left, right = ast.childrenOf(node)
+                # a && b jumps when false as soon as one operand is false, a || b likewise when true
+                if (operator == OR) == when:
+                    return self.branch(left, when) + self.branch(right, when)
+                # Otherwise the left operand decides only when it skips the right one
+                skips = self.branch(left, not when)
+                jumps = self.branch(right, when)
+                for offset in skips:
+                    self.patch(offset)
+                return jumps
+        self.expr(node)
+        return [self.emit(OP_JUMPTRUE if when else OP_JUMPFALSE, 0, ast.tokenIdx[node])]
+
+    # True for the NAME and literal nodes that binary operators read straight from a slot
+    def leaf(self, node):
+        kind = self.ast.kinds[node]
+        return kind == NODE_NAME or kind in LITERALNODES
+
+    # Leaves the value of expression node in the accumulator
+    def expr(self, node):
+        ast = self.ast
+        kind = ast.kinds[node]
+        token = ast.tokenIdx[node]
+        if self.leaf(node):
+            self.emit(OP_LOAD, self.slot(node), token)
+        elif kind == NODE_NOT:
+            self.expr(ast.childrenOf(node)[0])
+            self.emit(OP_NOT, 0, token)
+        else:
+            left, right = ast.childrenOf(node)
+            operator = ast.tokenType(node)
+            if self.leaf(left) and not self.leaf(right) and operator in SWAPPED:
+                # a + (b * c) runs as (b * c) + a, operands have no side effects
+                self.expr(right)
+                self.emit(BINARYOPS[SWAPPED[operator]], self.slot(left), token)
+                return
+            self.expr(left)
+            if operator == AND or operator == OR:
+                jump = self.emit(OP_AND if operator == AND else OP_OR, 0, token)
+                self.expr(right)
+                self.emit(OP_BOOL, 0, token)
+                self.patch(jump)
+            elif self.leaf(right):
+                self.emit(BINARYOPS[operator], self.slot(right), token)
+            else:
+                self.emit(OP_PUSH, 0, token)
+                self.expr(right)
+                self.emit(OP_BINARY, operator, token)
+
+# Accumulator and stack machine running a Program
+# Variables live in a list indexed by slot, unassigned ones hold None and reading
+# one is the run time error "Variable used before it was assigned"
+# The instruction budget is charged whenever control jumps, so straight runs
+# of instructions pay nothing for it, and checked on the conditional jumps SPAN loops with
+class VM:
+    def __init__(self, program, budget = BUDGET):
+        self.program = program
+        self.budget = budget
+        self.slots = [None] * len(program.names) + program.constants
+        self.executed = 0 # Instructions run by run
+
+    # Runs the program to its end or to the first run time error
+    # Returns a dict of the assigned variables and an Error or None
+    def run(self):
+        # Lists index faster than arrays, the opcodes are bound to locals for the same reason
+        code = self.program.code.tolist()
+        slots = self.slots
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        LOAD, STORE, PUSH, ADD, SUB, MUL, MOD = OP_LOAD, OP_STORE, OP_PUSH, OP_ADD, OP_SUB, OP_MUL, OP_MOD
+        LT, GT, LTE, GTE, EE, NE = OP_LT, OP_GT, OP_LTE, OP_GTE, OP_EE, OP_NE
+        JUMP, JUMPFALSE, JUMPTRUE, HALT = OP_JUMP, OP_JUMPFALSE, OP_JUMPTRUE, OP_HALT
+        budget = self.budget
+        accumulator = None
+        pc = 0
+        mark = 0 # Start of the straight run of instructions being executed
+        error = None
+        try:
+            while True:
+                op = code[pc]
+                arg = code[pc + 1]
+                pc += 2
+                if op == LOAD:
+                    accumulator = slots[arg]
+                    if accumulator is None:
+                        raise TypeError
+                elif op == STORE:
+                    slots[arg] = accumulator
+                elif op == ADD:
+                    accumulator = accumulator + slots[arg]
+                elif op == JUMPTRUE:
+                    if accumulator:
+                        budget -= (pc - mark) >> 1
+                        if budget < 0:
+                            break
+                        pc = mark = arg
+                elif op == JUMPFALSE:
+                    if not accumulator:
+                        budget -= (pc - mark) >> 1
+                        if budget < 0:
+                            break
+                        pc = mark = arg
+                elif op == LT:
+                    accumulator = accumulator < slots[arg]
+                elif op == SUB:
+                    accumulator = accumulator - slots[arg]
+                elif op == MUL:
+                    accumulator = accumulator * slots[arg]
+                elif op == GT:
+                    accumulator = accumulator > slots[arg]
+                elif op == EE:
+                    # == and != are the only operators that take None without a TypeError
+                    right = slots[arg]
+                    if right is None:
+                        raise TypeError
+                    accumulator = accumulator == right
+                elif op == MOD:
+                    right = slots[arg]
+                    # Python and C agree on the remainder of non negative ints
+                    if type(accumulator) is int and type(right) is int and accumulator >= 0 and right > 0:
+                        accumulator %= right
+                    else:
+                        accumulator = remainder(accumulator, right)
+                elif op == JUMP:
+                    budget -= (pc - mark) >> 1
+                    pc = mark = arg
+                elif op == PUSH:
+                    push(accumulator)
+                elif op == LTE:
+                    accumulator = accumulator <= slots[arg]
+                elif op == GTE:
+                    accumulator = accumulator >= slots[arg]
+                elif op == NE:
+                    right = slots[arg]
+                    if right is None:
+                        raise TypeError
+                    accumulator = accumulator != right
+                elif op == OP_DIV:
+                    accumulator = divide(accumulator, slots[arg])
+                elif op == OP_BINARY:
+                    accumulator = OPERATIONS[arg](pop(), accumulator)
+                elif op == OP_NOT:
+                    accumulator = not accumulator
+                elif op == OP_AND:
+                    if not accumulator:
+                        accumulator = False
+                        budget -= (pc - mark) >> 1
+                        pc = mark = arg
+                elif op == OP_OR:
+                    if accumulator:
+                        accumulator = True
+                        budget -= (pc - mark) >> 1
+                        pc = mark = arg
+                elif op == OP_BOOL:
+                    accumulator = bool(accumulator)
+                elif op == HALT:
+                    break
+            if op != HALT:
+                error = self.error(pc - 2, "Instruction budget of "+str(self.budget)+" exceeded")
+                budget += (pc - mark) >> 1
+        except ZeroDivisionError:
+            error = self.error(pc - 2, "Division by zero")
+        except TypeError:
+            error = self.error(pc - 2, "Variable used before it was assigned")
+        except (OverflowError, ValueError):
+            error = self.error(pc - 2, "Numeric overflow")
+        budget -= (pc - mark) >> 1
+        self.executed = self.budget - budget
+        return self.variables(), error
+
+    # Assigned variables by name, a name declared again in an inner block shows its first variable
+    def variables(self):
+        variables = {}
+        for name, value in zip(self.program.names, self.slots):
+            if value is not None and name not in variables:
+                variables[name] = value
+        return variables
+
+    # RuntimeError located at the token of the instruction at offset pc
+    def error(self, pc, details):
+        program = self.program
+        token = program.tokens[pc >> 1]
+        source = program.source
+        if isinstance(source, TokenStream):
+            sourceMap = source.sourceMap()
+            line, col = sourceMap.location(source.starts[token])
+            return Error(source.pos(token), "RuntimeError", details, program.fn, line, col)
+        return Error(source[token].pos, "RuntimeError", details, program.fn, 0)
+
+# BATCH EVALUATION
+
+# Active lanes at or below which a SPAN loop hands its lanes to the VM, one record each
+BATCHTAIL = 8
+
+# Ints of this size or more do not convert to float exactly, comparisons with them go to the VM
+EXACTFLOAT = 1 << 53
+
+# Runs an error free AST, from Parser or Optimizer, over a batch of input records at once
+# Inputs are columns, one value per record for some of the variables, and every variable
+# is a NumPy column of int64, float64 or bool values with the records in lanes
+# Expressions are computed for all lanes with NumPy, CHECK/PSYCH assign under the mask of
+# the lanes taking each branch and a SPAN loop goes on with the lanes whose condition still
+# holds, compacted into a smaller batch once half of them are done
+# The results are those of VM.run with the inputs in the variables' slots, one record at
+# a time. Lanes where the columns could differ, on a run time error, an int64 overflow,
+# a variable taking another type or possibly running out of the instruction budget, are
+# rerun that way, as are the lanes of a loop once no more than tail of them are left
+# Without NumPy every record is run on the VM and the columns are lists
+class BatchEvaluator:
+    def __init__(self, fn, ast, budget = BUDGET, tail = BATCHTAIL):
+        self.fn = fn
+        self.ast = ast
+        self.budget = budget
+        self.tail = tail
+        self.program = Compiler(fn, ast).compile()
+        self.slots = {name: slot for slot, name in enumerate(self.program.names)}
+        self.sizes = {} # SPAN node -> instructions compiled for it
+
+    # Evaluates the program for count records, count defaults to the length of the inputs
+    # inputs maps variable names to a column or a single value for every record
+    # Returns a BatchResult
+    def run(self, inputs, count = None):
+        if count is None:
+            lengths = {len(values) for values in inputs.values() if hasattr(values, '__len__')}
+            if len(lengths) > 1:
+                raise ValueError('input columns differ in length')
+            count = lengths.pop() if lengths else 1
+        if np is None:
+            return self.runRecords(inputs, count)
+        lanes = BatchLanes(count)
+        for name, values in inputs.items():
+            values = np.asarray(values)
+            if values.dtype.kind == 'u' and values.size and values.max() >= 1 << 63 or values.dtype.kind not in 'biuf':
+                raise TypeError('input column '+name+' is not bool, int64 or float64')
+            dtype = np.bool_ if values.dtype.kind == 'b' else np.float64 if values.dtype.kind == 'f' else np.int64
+            lanes.values[name] = np.array(np.broadcast_to(values.astype(dtype), (count,)))
+            lanes.assigned[name] = np.ones(count, np.bool_)
+        with np.errstate(all='ignore'):
+            self.stmt(lanes, self.ast.root, np.ones(count, np.bool_))
+        columns = {}
+        assigned = {}
+        for name in self.program.names:
+            if name in lanes.values:
+                columns[name] = lanes.values[name]
+                assigned[name] = lanes.assigned[name]
+        errors = {}
+        for lane in np.flatnonzero(lanes.failed).tolist():
+            variables, error = self.record(inputs, lane)
+            if error is not None:
+                errors[lane] = error
+            for name in self.program.names:
+                if name not in columns:
+                    if name not in variables:
+                        continue
+                    columns[name] = np.zeros(count, type(variables[name]) if isinstance(variables[name], (bool, float)) else np.int64)
+                    assigned[name] = np.zeros(count, np.bool_)
+                column = columns[name]
+                value = variables.get(name, 0)
+                if name in variables and column.dtype != object and np.asarray(value).dtype.kind != column.dtype.kind:
+                    column = columns[name] = column.astype(object)
+                column[lane] = value
+                assigned[name][lane] = name in variables
+        for name in [name for name in columns if not assigned[name].any()]:
+            del columns[name], assigned[name]
+        return BatchResult(count, columns, assigned, errors)
+
+    # Runs record lane of inputs on the VM, returns VM.run's variables and error
+    def record(self, inputs, lane):
+        vm = VM(self.program, self.budget)
+        for name, values in inputs.items():
+            slot = self.slots.get(name)
+            if slot is not None:
+                value = values[lane] if hasattr(values, '__len__') else values
+                vm.slots[slot] = value.item() if hasattr(value, 'item') else value
+        return vm.run()
+
+    # run without NumPy, columns are lists holding None where a record did not assign the variable
+    def runRecords(self, inputs, count):
+        columns = {}
+        errors = {}
+        for lane in range(count):
+            variables, error = self.record(inputs, lane)
+            if error is not None:
+                errors[lane] = error
+            for name, value in variables.items():
+                columns.setdefault(name, [None] * count)[lane] = value
+        assigned = {name: [value is not None for value in column] for name, column in columns.items()}
+        return BatchResult(count, columns, assigned, errors)
+
+    # Runs statement node in the lanes of mask
+    def stmt(self, lanes, node, mask):
+        ast = self.ast
+        kind = ast.kinds[node]
+        children = ast.childrenOf(node)
+        if kind == NODE_PROGRAM or kind == NODE_BLOCK:
+            for child in children:
+                self.stmt(lanes, child, mask)
+        elif kind == NODE_DECLARE:
+            self.stmt(lanes, children[0], mask)
+        elif kind == NODE_ASSIGN:
+            if len(children) == 2:
+                lanes.assign(ast.value(children[0]), self.expr(lanes, children[1], mask), mask)
+        elif kind == NODE_IF:
+            truth = self.truth(lanes, children[0], mask)
+            taken = mask & truth
+            if taken.any():
+                self.stmt(lanes, children[1], taken)
+            skipped = mask & ~truth & ~lanes.failed
+            if len(children) == 3 and skipped.any():
+                self.stmt(lanes, children[2], skipped)
+        elif kind == NODE_WHILE:
+            self.loop(lanes, node, mask & self.truth(lanes, children[0], mask))
+
+    # Runs the body of SPAN node while its condition holds, active are the lanes where it held first
+    def loop(self, lanes, node, active):
+        condition, body = self.ast.childrenOf(node)
+        while True:
+            active = active & ~lanes.failed
+            count = int(np.count_nonzero(active))
+            if count <= self.tail:
+                lanes.failed |= active
+                return
+            if count * 2 <= lanes.count:
+                lanes.gather(np.flatnonzero(active), lambda part: self.loop(part, node, np.ones(part.count, np.bool_)))
+                return
+            self.stmt(lanes, body, active)
+            # A pass runs each instruction of the loop at most once, besides the passes of inner loops
+            lanes.spent += active * self.size(node)
+            lanes.failed |= active & (lanes.spent > self.budget - (len(self.program.code) >> 1))
+            active = active & self.truth(lanes, condition, active & ~lanes.failed)
+
+    # Instructions compiled for SPAN node
+    def size(self, node):
+        size = self.sizes.get(node)
+        if size is None:
+            compiler = Compiler(self.fn, self.ast)
+            compiler.stmt(node)
+            size = self.sizes[node] = len(compiler.code) >> 1
+        return size
+
+    # Truth value of expression node in every lane
+    def truth(self, lanes, node, mask):
+        values = self.expr(lanes, node, mask)
+        return values if values.dtype == np.bool_ else values != 0
+
+    # Value of expression node in every lane, only the lanes of mask count
+    def expr(self, lanes, node, mask):
+        ast = self.ast
+        kind = ast.kinds[node]
+        if kind == NODE_NAME:
+            return lanes.read(ast.value(node), mask)
+        if kind in LITERALNODES:
+            value = ast.value(node)
+            if isinstance(value, int) and not isinstance(value, bool) and not -1 << 63 <= value < 1 << 63:
+                lanes.failed |= mask
+                return np.asarray(0)
+            return np.asarray(value)
+        children = ast.childrenOf(node)
+        if kind == NODE_NOT:
+            return ~self.truth(lanes, children[0], mask)
+        operator = ast.tokenType(node)
+        left = self.expr(lanes, children[0], mask)
+        if operator == AND or operator == OR:
+            truth = left if left.dtype == np.bool_ else left != 0
+            # The right operand runs only where the left one does not decide
+            right = self.truth(lanes, children[1], mask & (truth if operator == AND else ~truth))
+            return truth & right if operator == AND else truth | right
+        right = self.expr(lanes, children[1], mask)
+        if left.dtype == np.bool_:
+            left = left.astype(np.int64)
+        if right.dtype == np.bool_:
+            right = right.astype(np.int64)
+        floating = left.dtype.kind == 'f' or right.dtype.kind == 'f'
+        if operator in BOOLOPERATORS:
+            if floating and left.dtype != right.dtype:
+                integer = right if left.dtype.kind == 'f' else left
+                lanes.failed |= mask & (np.abs(integer) >= EXACTFLOAT)
+            return OPERATIONS[operator](left, right)
+        if floating:
+            left = left.astype(np.float64)
+            right = right.astype(np.float64)
+            if operator == DIV:
+                lanes.failed |= mask & (right == 0)
+                return left / right
+            if operator == MOD:
+                # math.fmod rejects an infinite dividend
+                lanes.failed |= mask & ((right == 0) | np.isinf(left))
+                return np.fmod(left, right)
+            return OPERATIONS[operator](left, right)
+        if operator == PLUS:
+            result = left + right
+            lanes.failed |= mask & (((left ^ result) & (right ^ result)) < 0)
+        elif operator == MINUS:
+            result = left - right
+            lanes.failed |= mask & (((left ^ right) & (left ^ result)) < 0)
+        elif operator == MUL:
+            result = left * right
+            lanes.failed |= mask & (np.abs(left.astype(np.float64) * right) >= 1 << 62)
+        else:
+            # The absolute value of the most negative int64 overflows
+            lanes.failed |= mask & ((right == 0) | (left == -1 << 63) | (right == -1 << 63))
+            right = np.where(right == 0, 1, right)
+            if operator == DIV:
+                result = np.abs(left) // np.abs(right)
+                result = np.where((left < 0) != (right < 0), -result, result)
+            else:
+                result = np.fmod(left, right)
+        return result
+
+# Lexes and parses fn and, when it has no errors, runs it with a BatchEvaluator over the
+# input columns inputs, writing the output columns to the .npz file output when it is given,
+# with the records where each holds a value under its name plus .assigned
+# The first maxErrors records stopping at a run time error are reported, with their index
+def batchFile(fn, inputs, maxErrors = MAXERRORS, output = None):
+    try:
+        source = openSource(fn)
+    except OSError as exception:
+        return FileReport(fn, 0, 0, [Error(0, "FileError", exception.strerror, fn, 0)])
+    try:
+        stream, ast, errors = lexAndParse(fn, source, maxErrors)
+        if ast is None or errors:
+            return FileReport(fn, len(source), len(stream) if ast is not None else 0, errors)
+        result = BatchEvaluator(fn, ast).run(inputs)
+        for lane in sorted(result.errors)[:maxErrors]:
+            error = result.errors[lane]
+            errors.append(Error(error.pos, error.errorName, 'Record '+str(lane)+': '+error.details, fn, error.ln, error.col))
+        if output is not None:
+            masks = {name+'.assigned': assigned for name, assigned in result.assigned.items()}
+            np.savez(output, **result.columns, **masks)
+        executed = ('Ran '+str(result.count)+' records, '+str(len(result.errors))+' failed: '
+                    +', '.join(name+' '+str(column.dtype) for name, column in result.columns.items()))
+        return FileReport(fn, len(source), len(stream), errors, executed=executed)
+    finally:
+        if isinstance(source, mmap.mmap):
+            source.close()
+
+# Variables of the records a BatchEvaluator runs, one lane per record
+#   values    name -> column of the variable, int64, float64 or bool
+#   assigned  name -> lanes where it holds a value
+#   failed    lanes left for the VM
+#   spent     instructions each lane ran in loops at most, the VM's budget counts them
+class BatchLanes:
+    def __init__(self, count):
+        self.count = count
+        self.values = {}
+        self.assigned = {}
+        self.failed = np.zeros(count, np.bool_)
+        self.spent = np.zeros(count, np.int64)
+
+    # Column of variable name, failing the lanes of mask where it was never assigned
+    def read(self, name, mask):
+        assigned = self.assigned.get(name)
+        if assigned is None:
+            self.failed |= mask
+            return np.zeros(self.count, np.int64)
+        self.failed |= mask & ~assigned
+        return self.values[name]
+
+    # Assigns values to variable name in the lanes of mask
+    # A variable keeps its type while other lanes hold it, lanes assigning it another one fail
+    def assign(self, name, values, mask):
+        mask = mask & ~self.failed
+        column = self.values.get(name)
+        if column is not None and column.dtype != values.dtype and (self.assigned[name] & ~mask & ~self.failed).any():
+            self.failed |= mask
+            return
+        if column is None or column.dtype != values.dtype:
+            column = np.zeros(self.count, values.dtype)
+            self.assigned[name] = np.zeros(self.count, np.bool_)
+        self.values[name] = np.where(mask, values, column)
+        self.assigned[name] = self.assigned[name] | mask
+
+    # Runs run over a batch of the lanes at indices and copies their variables back
+    def gather(self, indices, run):
+        part = BatchLanes(len(indices))
+        for name, column in self.values.items():
+            part.values[name] = column[indices]
+            part.assigned[name] = self.assigned[name][indices]
+        part.failed = self.failed[indices]
+        part.spent = self.spent[indices]
+        run(part)
+        for name, column in part.values.items():
+            if name in self.values and self.values[name].dtype != column.dtype:
+                outside = self.assigned[name] & ~self.failed
+                outside[indices] = False
+                if outside.any():
+                    # Lanes outside the batch hold another type, see assign
+                    part.failed |= part.assigned[name]
+                    continue
+                del self.values[name]
+            if name not in self.values:
+                self.values[name] = np.zeros(self.count, column.dtype)
+                self.assigned[name] = np.zeros(self.count, np.bool_)
+            self.values[name][indices] = column
+            self.assigned[name][indices] = part.assigned[name]
+        self.failed[indices] = part.failed
+        self.spent[indices] = part.spent
+
+# Columns of the variables after a BatchEvaluator run
+#   columns   name -> value of the variable in every record, an object array where records
+#             disagree on its type, lists without NumPy
+#   assigned  name -> records where the variable holds a value, its column holds 0 elsewhere
+#   errors    record -> the run time Error the record stopped at
+class BatchResult:
+    def __init__(self, count, columns, assigned, errors):
+        self.count = count
+        self.columns = columns
+        self.assigned = assigned
+        self.errors = errors
+
+    # Variables of record lane, as VM.run returns them
+    def variables(self, lane):
+        return {name: column[lane].item() if hasattr(column[lane], 'item') else column[lane]
+                for name, column in self.columns.items() if self.assigned[name][lane]}
+
+# Decodes the UTF-8 character starting at position pos of a bytes buffer
+def firstChar(text, pos):
+    head = text[pos:pos + 4]
+    for size in range(1, len(head) + 1):
+        try:
+            return head[:size].decode('utf-8')
+        except UnicodeDecodeError:
+            pass
+    return head[:1].decode('latin-1')
+
+# Opens fn as a read only memory map so the lexer reads pages on demand
+# instead of loading the whole file into a str
+# Falls back to reading bytes for files that cannot be mapped (empty files, pipes)
+def openSource(fn):
+    with open(fn, "rb") as fileObj:
+        try:
+            return mmap.mmap(fileObj.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            return fileObj.read()
+
+# Method to execute lexer and parser on text file.
+# scan=True lexes with the single pass Lexer.scan straight over a memory map of the file
+# trace picks the trace level, target is passed to makeTrace
+# TRACE_TEXT reproduces the printed token list and parse trace, TRACE_OFF prints only errors
+# Lexing and parsing recover from errors until maxErrors were reported
+def run(fn, scan=False, trace=TRACE_TEXT, target=None, maxErrors=MAXERRORS):
+    sink = makeTrace(trace, target)
+    out = sink if sink is not None else TextTrace()
+    try:
+        if sink is not None:
+            sink.write("\nRunning file: "+fn+'\n\n')
+        if scan:
+            source = openSource(fn)
+            lexer = Lexer(fn, source)
+            tokens, error = lexer.tokenize(maxErrors=maxErrors)
+        else:
+            fileObj = open(fn, "r")
+            text = fileObj.read()
+
+            # Generate tokens
+            lexer = Lexer(fn, text)
+            tokens, error = lexer.lex(maxErrors)
+        for error in lexer.errors:
+            out.error(repr(error))
+        if len(lexer.errors) < maxErrors:
+            if sink is not None:
+                sink.write("\n".join(map(repr, tokens))+"\n")
+                sink.write("Lexeme count: "+ str(len(tokens))+'\n\n')
+
+            # Generate Parse Trace
+            parser = makeParser(fn, tokens, sink, maxErrors - len(lexer.errors))
+            try:
+                parser.parse()
+            finally:
+                if sink is None:
+                    for details in parser.errors:
+                        out.error("InvalidSyntaxError: "+details)
+
+        # Tokens from tokenize read their lexemes from the map, so it is closed last
+        if scan and isinstance(source, mmap.mmap):
+            source.close()
+    finally:
+        out.flush()
+
+# One top-level statement of a Document with the whitespace before it
+# Positions in stream and errors are relative to the start of text
+class Segment:
+    __slots__ = ('text', 'stream', 'ast', 'errors', 'closed')
+
+    def __init__(self, text, stream, ast, errors, closed):
+        self.text = text
+        self.stream = stream # TokenStream ending in EOF, None when lexing failed
+        self.ast = ast
+        self.errors = errors # (errorName, details, pos, lexeme start) tuples
+        self.closed = closed # False when the text ends inside a statement
+
+# Lex and parse result of a buffer that is edited in place
+# The text is split into one Segment per top-level statement, each lexed and parsed on its own,
+# so edit re-lexes and re-parses only the statements around the edit
+# and nothing after them is shifted, their offsets are moved lazily, see settle
+class Document:
+    def __init__(self, fn, text):
+        self.fn = fn
+        self.symbols = SymbolTable() # Shared by every segment, so a name keeps its id across edits
+        self.segments = self.split(text)
+        # Offsets where the segments start, then the length of the text
+        # The entries from stale on are shift short of their offsets
+        self.starts = array('i', accumulate((len(segment.text) for segment in self.segments), initial=0))
+        self.stale = len(self.starts)
+        self.shift = 0
+
+    # Current text of the buffer
+    @property
+    def text(self):
+        return ''.join(segment.text for segment in self.segments)
+
+    # Replaces deleted characters at offset with inserted and updates the affected statements
+    # Returns (first segment, segments removed, segments added)
+    def edit(self, offset, deleted, inserted):
+        last = len(self.segments) - 1
+        if offset < 0 or offset + deleted > self.start(last + 1):
+            raise ValueError("Edit outside of the document")
+        # The segment before the edit is redone too, the edit may continue its statement (PSYCH)
+        first = max(min(self.find(offset), last) - 1, 0)
+        end = min(self.find(offset + deleted), last)
+        start = self.start(first)
+        local = offset - start
+
+        extra = 1
+        while True:
+            text = ''.join(segment.text for segment in self.segments[first:end + 1])
+            text = text[:local] + inserted + text[local + deleted:]
+            segments = self.split(text)
+            # Stop once the new statements end where an old one ended and nothing continues them
+            if end == last or (segments[-1].closed and not self.continues(segments[-1], self.segments[end + 1])):
+                break
+            end = min(end + extra, last)
+            extra *= 2
+
+        # The offsets after the statements take the change in length through shift
+        self.settle(end + 1)
+        self.shift += len(text) - (self.start(end + 1) - start)
+        self.segments[first:end + 1] = segments
+        self.starts[first:end + 1] = array('i', accumulate((len(segment.text) for segment in segments[:-1]), initial=start))
+        self.stale = first + len(segments)
+        return first, end + 1 - first, len(segments)
+
+    # Offset where segment i starts, or the length of the text for i past the last segment
+    def start(self, i):
+        return self.starts[i] + self.shift if i >= self.stale else self.starts[i]
+
+    # Index of the last segment starting at or before offset
+    def find(self, offset):
+        starts, stale = self.starts, self.stale
+        if stale < len(starts) and offset >= starts[stale] + self.shift:
+            return bisect_right(starts, offset - self.shift, stale) - 1
+        return bisect_right(starts, offset, 0, stale) - 1
+
+    # Makes the entries from index on the stale ones, the entries between index and stale
+    # are corrected, or every stale entry when they are fewer and shift starts over
+    # Edits close to each other correct few entries, instead of every one after the edit
+    def settle(self, index):
+        starts, stale, shift = self.starts, self.stale, self.shift
+        if not shift:
+            pass
+        elif abs(index - stale) > len(starts) - stale:
+            starts[stale:] = array('i', [position + shift for position in starts[stale:]])
+            self.shift = 0
+        elif stale < index:
+            starts[stale:index] = array('i', [position + shift for position in starts[stale:index]])
+        else:
+            starts[index:stale] = array('i', [position - shift for position in starts[index:stale]])
+        self.stale = index
+
+    # True when the statement after segment would join it, a PSYCH after a CHECK block
+    def continues(self, segment, following):
+        stream = following.stream
+        if stream is None or len(stream) < 2 or stream.kinds[0] != PSYCH:
+            return False
+        return segment.stream is not None and len(segment.stream) > 1 and segment.stream.kinds[-2] == RBR
+
+    # Lexes text and splits it into segments at `;` or `}` tokens outside of any block
+    # After a lexer error lexing resumes at the next whitespace, so only the statement
+    # holding the illegal lexeme is left without tokens
+    def split(self, text):
+        segments = []
+        start = 0
+        position = 0
+        depth = 0
+        broken = None
+        while True:
+            lexer = Lexer(self.fn, text, self.symbols)
+            stream, error = lexer.tokenize(position)
+            kinds = stream.kinds
+            ends = stream.ends
+            count = len(kinds) - (0 if error else 1)
+            first = 0
+            for i in range(count):
+                kind = kinds[i]
+                if kind == LBR:
+                    depth += 1
+                elif kind == RBR:
+                    depth -= 1
+                if depth <= 0 and (kind == SEMI or kind == RBR) and not (i + 1 < count and kinds[i + 1] == PSYCH):
+                    if broken:
+                        segments.append(Segment(text[start:ends[i]], None, None, [broken], True))
+                        broken = None
+                    else:
+                        segments.append(self.segment(text, start, ends[i], stream, first, i + 1, True))
+                    start = ends[i]
+                    first = i + 1
+                    depth = 0
+            if not error:
+                break
+            if broken is None:
+                lexeme = lexer.map.lineStarts[error.ln - 1] + error.col - 1
+                broken = (error.errorName, error.details, error.pos - start, lexeme - start)
+            position = lexer.resume(error.pos)
+
+        if broken:
+            # The last statement waits for the lexer error to be fixed
+            segments.append(Segment(text[start:], None, None, [broken], False))
+        elif start < len(text) or not segments:
+            segments.append(self.segment(text, start, len(text), stream, first, count, first == count))
+        return segments
+
+    # Builds the Segment for text[start:end] holding tokens first to last of stream
+    def segment(self, text, start, end, stream, first, last, closed):
+        source = text[start:end]
+        tokens = TokenStream(self.fn, source, stream.table)
+        tokens.kinds = stream.kinds[first:last]
+        tokens.starts = array('i', [position - start for position in stream.starts[first:last]])
+        tokens.ends = array('i', [position - start for position in stream.ends[first:last]])
+        tokens.symbols = stream.symbols[first:last]
+        tokens.kinds.append(EOF)
+        tokens.starts.append(len(source))
+        tokens.ends.append(len(source))
+        tokens.symbols.append(-1)
+        parser = Parser(self.fn, tokens)
+        ast = parser.parse()
+        errors = [("InvalidSyntaxError", details, tokens.pos(idx), tokens.starts[idx]) for details, idx in zip(parser.errors, parser.errorTokens)]
+        return Segment(source, tokens, ast, errors, closed)
+
+    # Error objects for every segment, with positions, lines and columns in the whole text
+    def diagnostics(self):
+        errors = []
+        offset = 0
+        line = 1
+        column = 0 # Characters before the segment on its first line
+        for segment in self.segments:
+            text = segment.text
+            for errorName, details, pos, start in segment.errors:
+                lineStart = text.rfind('\n', 0, start) + 1
+                col = start - lineStart + 1 + (column if lineStart == 0 else 0)
+                errors.append(Error(offset + pos, errorName, details, self.fn, line + text.count('\n', 0, start), col))
+            offset += len(text)
+            line += text.count('\n')
+            lineStart = text.rfind('\n') + 1
+            column = len(text) - lineStart + (column if lineStart == 0 else 0)
+        return errors
+
+    # Number of tokens in the buffer, not counting EOF
+    def tokenCount(self):
+        return sum(len(segment.stream) - 1 for segment in self.segments if segment.stream is not None)
+
+# PARSE CACHE
+
+# Cache entry header: magic, layout version, token count, node count, child count,
+# AST root (-2 when lexing reached the error cap and nothing was parsed),
+# length of the marshalled diagnostics and identifiers, source size
+# The columns follow as native int arrays, the cache is not meant to move between machines
+CACHEHEADER = struct.Struct('=4sIiiiiii')
+CACHEMAGIC = b'LXPC'
+CACHEVERSION = 2 # Bump when the entry layout changes
+CACHESIZE = 256 << 20 # Bytes kept by ParseCache.prune
+
+# On disk cache of the tokens, diagnostics and AST of checked sources
+# Entries are keyed by a hash of the source, the error cap, grammar.txt and this
+# module, so a changed lexer, parser or grammar never reads stale entries
+# Entries are written under a temporary name and renamed, so parallel workers
+# never see half an entry, and loaded with mmap, the arrays point into the map
+# A hit touches the entry, prune evicts the least recently used ones
+class ParseCache:
+    def __init__(self, cacheDir, limit = CACHESIZE, grammarFn = GRAMMAR):
+        self.cacheDir = cacheDir
+        self.limit = limit
+        digest = hashlib.blake2b(str(CACHEVERSION).encode(), digest_size=16)
+        for fn in (grammarFn, os.path.abspath(__file__)):
+            try:
+                with open(fn, "rb") as fileObj:
+                    digest.update(fileObj.read())
+            except OSError:
+                pass
+        self.toolKey = digest.digest()
+
+    # Key of the entry for source lexed and parsed with maxErrors
+    def key(self, source, maxErrors):
+        digest = hashlib.blake2b(self.toolKey, digest_size=20)
+        digest.update(str(maxErrors).encode())
+        digest.update(source if not isinstance(source, str) else source.encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cacheDir, key[:2], key+'.lxc')
+
+    # Returns (stream, ast, errors) stored under key for source, None on a miss
+    # ast is None when the stored run reached the error cap while lexing
+    def load(self, key, fn, source):
+        cacheFn = self.path(key)
+        try:
+            with open(cacheFn, "rb") as fileObj:
+                data = mmap.mmap(fileObj.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(cacheFn)
+        except OSError:
+            pass
+        if len(data) < CACHEHEADER.size:
+            return None
+        magic, version, tokenCount, nodeCount, childCount, root, errorLength, size = CACHEHEADER.unpack_from(data)
+        columns = (4 * tokenCount + 4 * nodeCount + childCount) * 4
+        if magic != CACHEMAGIC or version != CACHEVERSION or size != len(source) or len(data) != CACHEHEADER.size + columns + errorLength:
+            return None
+
+        view = memoryview(data)
+        offset = CACHEHEADER.size
+        def column(count):
+            nonlocal offset
+            part = view[offset:offset + count * 4].cast('i')
+            offset += count * 4
+            return part
+
+        stream = TokenStream(fn, source, SymbolTable())
+        stream.kinds, stream.starts, stream.ends, stream.symbols = column(tokenCount), column(tokenCount), column(tokenCount), column(tokenCount)
+        ast = None
+        if root != -2:
+            ast = AST(stream)
+            ast.kinds, ast.tokenIdx, ast.firsts, ast.counts = column(nodeCount), column(nodeCount), column(nodeCount), column(nodeCount)
+            ast.children = column(childCount)
+            ast.root = root
+        else:
+            offset += (4 * nodeCount + childCount) * 4
+        diagnostics, identifiers = marshal.loads(view[offset:])
+        for name in identifiers:
+            stream.table.add(name, IDENTIFIER)
+        errors = [Error(pos, errorName, details, fn, ln, col) for pos, errorName, details, ln, col in diagnostics]
+        return stream, ast, errors
+
+    # Stores the result of lexing and parsing a source under key, ast None when nothing was parsed
+    # Failing to write only means the next run misses
+    def store(self, key, stream, ast, errors):
+        # The symbol table is stored as the identifiers after the keywords, in id order
+        diagnostics = marshal.dumps(([(error.pos, error.errorName, error.details, error.ln, error.col) for error in errors],
+                                     stream.table.names[len(KEYWORDS):]))
+        nodes = (ast.kinds, ast.tokenIdx, ast.firsts, ast.counts) if ast is not None else ()
+        children = ast.children if ast is not None else array('i')
+        header = CACHEHEADER.pack(CACHEMAGIC, CACHEVERSION, len(stream), len(ast) if ast is not None else 0,
+                                  len(children), ast.root if ast is not None else -2, len(diagnostics), len(stream.source))
+        cacheFn = self.path(key)
+        tempFn = cacheFn+'.'+str(os.getpid())
+        try:
+            os.makedirs(os.path.dirname(cacheFn), exist_ok=True)
+            with open(tempFn, "wb") as fileObj:
+                fileObj.write(header)
+                for part in (stream.kinds, stream.starts, stream.ends, stream.symbols) + nodes + (children,):
+                    fileObj.write(part)
+                fileObj.write(diagnostics)
+            os.replace(tempFn, cacheFn)
+        except OSError:
+            try:
+                os.remove(tempFn)
+            except OSError:
+                pass
+
+    # Removes the least recently used entries until the cache holds at most limit bytes
+    # Returns the number of entries removed
+    def prune(self, limit = None):
+        limit = self.limit if limit is None else limit
+        entries = []
+        total = 0
+        try:
+            folders = list(os.scandir(self.cacheDir))
+        except OSError:
+            return 0
+        for folder in folders:
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                try:
+                    info = entry.stat()
+                except OSError:
+                    continue # Removed by another process
+                entries.append((info.st_mtime, info.st_size, entry.path))
+                total += info.st_size
+        removed = 0
+        entries.sort()
+        for mtime, size, cacheFn in entries:
+            if total <= limit:
+                break
+            try:
+                os.remove(cacheFn)
+                removed += 1
+            except OSError:
+                pass
+            total -= size
+        return removed
+
+# TREE FILES
+
+# Binary form of the tokens, line starts, diagnostics and AST of one file, for tools that
+# would otherwise scrape the text trace. Every number is little endian
+#
+#   header   TREEHEADER: magic, version, flags (0)
+#   tokens   TOKENRECORD per token: kind, start, end, text id
+#            Offsets in the file, here and in lines, count characters
+#            Text ids are symbol ids for keywords and identifiers, string ids for the
+#            lexemes of INT and FLOAT tokens and -1 for other tokens
+#   lines    int32 offset of the start of every line
+#   nodes    NODERECORD per node: kind, token (-1 for none), first slot in children, child count
+#   children int32 node in every slot
+#   values   int32 pairs of node and string id, repr of the literals the Optimizer computed
+#   errors   ERRORRECORD per error: pos, line, column (-1 when unknown), name and details string ids
+#   names    string table of the SymbolTable, indexed by symbol id
+#   strings  string table of the file name (id 0), lexemes, error texts and computed values
+#   footer   TREEFOOTER: offset and count of each section in this order, AST root (-2 when
+#            nothing was parsed), source size, CRC-32 of all bytes before it, magic
+#
+# A string table holds count + 1 int32 end offsets, the first is 0, then the UTF-8 data
+# Sections are written in order as they become known and the footer last, so a file is
+# written in one pass without seeking. Readers find the sections from the footer
+TREEHEADER = struct.Struct('<4sHH')
+TREEMAGIC = b'LXTR'
+TREEVERSION = 2 # Bump when the layout changes
+TOKENRECORD = struct.Struct('<iiii')
+NODERECORD = struct.Struct('<iiii')
+ERRORRECORD = struct.Struct('<iiiii')
+TREESECTIONS = ['tokens', 'lines', 'nodes', 'children', 'values', 'errors', 'names', 'strings']
+TREEFOOTER = struct.Struct('<' + 'QI' * len(TREESECTIONS) + 'iQI4s')
+TREEEND = b'LXTE'
+TREESUFFIX = '.lxt'
+
+# The int arrays are written as they are on little endian machines
+LITTLEENDIAN = sys.byteorder == 'little'
+
+# values as an int array, int memoryviews like the columns ParseCache loads are copied
+def intArray(values):
+    return values if isinstance(values, array) else array('i', bytes(values))
+
+# Int array values in little endian order, for writing
+def littleEndian(values):
+    values = intArray(values)
+    if not LITTLEENDIAN:
+        values = array('i', values)
+        values.byteswap()
+    return values
+
+# Value of the repr of a literal the Optimizer computed
+def literalValue(text):
+    if text in ('True', 'False'):
+        return text == 'True'
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+# Writes a tree file section by section, see TREE FILES
+# Tokens and lines can be added in parts while they are lexed, as a StreamParser does,
+# then the tree, and close adds the errors, the string tables and the footer
+# Only the strings are kept until close
+class TreeWriter:
+    def __init__(self, fileObj, fn, table):
+        self.fileObj = fileObj
+        self.table = table # SymbolTable the symbol ids of the tokens refer to
+        self.strings = [fn]
+        self.stringIds = {fn: 0}
+        self.lexemeIds = {} # String id of each literal lexeme as sliced from a source
+        self.offsets = [0] * len(TREESECTIONS)
+        self.counts = [0] * len(TREESECTIONS)
+        self.root = -2
+        self.position = 0
+        self.crc = 0
+        self.write(TREEHEADER.pack(TREEMAGIC, TREEVERSION, 0))
+        self.section = 0
+        self.offsets[0] = self.position
+
+    def write(self, data):
+        self.fileObj.write(data)
+        self.crc = zlib.crc32(data, self.crc)
+        self.position += memoryview(data).nbytes
+
+    # Moves on to section, the ones before it are complete
+    def enter(self, section):
+        if section < self.section:
+            raise ValueError(TREESECTIONS[section]+' written after '+TREESECTIONS[self.section])
+        while self.section < section:
+            self.section += 1
+            self.offsets[self.section] = self.position
+
+    # Id of text in the strings table
+    def string(self, text):
+        stringId = self.stringIds.get(text)
+        if stringId is None:
+            stringId = self.stringIds[text] = len(self.strings)
+            self.strings.append(text)
+        return stringId
+
+    # Appends the tokens of stream, whose offsets are base bytes into the file
+    # sourceMap turns the offsets in the file into character offsets
+    def addTokens(self, stream, sourceMap, base = 0):
+        self.enter(0)
+        count = len(stream)
+        records = array('i', bytes(TOKENRECORD.size * count))
+        for field, column in enumerate((stream.kinds, stream.starts, stream.ends, stream.symbols)):
+            if field in (1, 2):
+                records[field::4] = sourceMap.charArray(shiftArray(column, base) if base else column)
+            else:
+                records[field::4] = intArray(column)
+        kinds = records[0::4]
+        if np is not None:
+            literals = np.flatnonzero(np.isin(np.frombuffer(kinds, dtype=np.int32), (INT, FLOAT))).tolist()
+        else:
+            literals = [i for i, kind in enumerate(kinds) if kind == INT or kind == FLOAT]
+        source = stream.source
+        if source is not None:
+            starts, ends = stream.starts, stream.ends
+            lexemes = [source[starts[i]:ends[i]] for i in literals]
+        else:
+            lexemes = [stream.lexeme(i) for i in literals]
+        lexemeIds = self.lexemeIds
+        for i, lexeme in zip(literals, lexemes):
+            stringId = lexemeIds.get(lexeme)
+            if stringId is None:
+                stringId = lexemeIds[lexeme] = self.string(lexeme if isinstance(lexeme, str) else lexeme.decode())
+            records[4 * i + 3] = stringId
+        self.write(littleEndian(records))
+        self.counts[0] += count
+
+    # Appends the line starts of sourceMap
+    def addLines(self, sourceMap):
+        self.enter(1)
+        lineStarts = sourceMap.charArray(sourceMap.lineStarts)
+        self.write(littleEndian(lineStarts))
+        self.counts[1] += len(lineStarts)
+
+    # Writes the nodes of ast, whose token indices are mapped through tokenIndices when given,
+    # as for the TreeTokens of a StreamParser
+    def addTree(self, ast, tokenIndices = None):
+        self.enter(2)
+        count = len(ast)
+        tokenIdx = ast.tokenIdx
+        if tokenIndices is not None:
+            tokenIdx = array('i', [tokenIndices[token] if token >= 0 else -1 for token in tokenIdx])
+        records = array('i', bytes(NODERECORD.size * count))
+        for field, column in enumerate((ast.kinds, tokenIdx, ast.firsts, ast.counts)):
+            records[field::4] = intArray(column)
+        self.write(littleEndian(records))
+        self.counts[2] = count
+        self.enter(3)
+        self.write(littleEndian(ast.children))
+        self.counts[3] = len(ast.children)
+        self.enter(4)
+        values = array('i')
+        for node, value in ast.values.items():
+            values.extend((node, self.string(repr(value))))
+        self.write(littleEndian(values))
+        self.counts[4] = len(ast.values)
+        self.root = ast.root
+
+    # Writes errors, the string tables and the footer
+    def close(self, errors, size):
+        self.enter(5)
+        string = self.string
+        for error in errors:
+            col = error.col if error.col is not None else -1
+            self.write(ERRORRECORD.pack(error.pos, error.ln, col, string(error.errorName), string(error.details)))
+        self.counts[5] = len(errors)
+        for section, strings in ((6, self.table.names), (7, self.strings)):
+            self.enter(section)
+            data = [text.encode() for text in strings]
+            ends = array('i', [0])
+            ends.extend(accumulate(len(part) for part in data))
+            self.write(littleEndian(ends))
+            self.write(b''.join(data))
+            self.counts[section] = len(strings)
+        fields = [field for section in zip(self.offsets, self.counts) for field in section]
+        footer = TREEFOOTER.pack(*fields, self.root, size, 0, TREEEND)[:-8]
+        self.write(footer)
+        self.fileObj.write(struct.pack('<I4s', self.crc, TREEEND))
+
+# Writes the result of lexAndParse for a source of size bytes to the tree file treeFn
+def writeTree(treeFn, stream, ast, errors, size):
+    with open(treeFn, "wb") as fileObj:
+        writer = TreeWriter(fileObj, stream.fn, stream.table)
+        sourceMap = stream.sourceMap()
+        writer.addTokens(stream, sourceMap)
+        writer.addLines(sourceMap)
+        if ast is not None:
+            writer.addTree(ast)
+        writer.close(errors, size)
+
+# File for the source file fn under the folder folder, at the same path as fn from the root plus suffix
+def treePath(folder, fn, suffix = TREESUFFIX):
+    return os.path.join(folder, os.path.splitdrive(os.path.abspath(fn))[1].lstrip(os.sep) + suffix)
+
+# Random access reader of a tree file, see TREE FILES
+# The file is mapped and records are decoded when asked for, tokenStream and ast
+# wrap the sections without copying them on little endian machines
+# verify=True checks the CRC-32 first, which reads the file once without decoding it
+# Raises ValueError when the file is not a tree file of this version or fails the check
+class TreeFile:
+    def __init__(self, fn, verify = True):
+        with open(fn, "rb") as fileObj:
+            try:
+                self.data = data = mmap.mmap(fileObj.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(fn+' is not a tree file')
+        if len(data) < TREEHEADER.size + TREEFOOTER.size:
+            raise ValueError(fn+' is not a tree file')
+        magic, version, flags = TREEHEADER.unpack_from(data)
+        fields = TREEFOOTER.unpack_from(data, len(data) - TREEFOOTER.size)
+        if magic != TREEMAGIC or fields[-1] != TREEEND:
+            raise ValueError(fn+' is not a tree file')
+        if version != TREEVERSION:
+            raise ValueError(fn+' is a version '+str(version)+' tree file, expected version '+str(TREEVERSION))
+        if verify and zlib.crc32(memoryview(data)[:len(data) - 8]) != fields[-2]:
+            raise ValueError(fn+' fails its checksum')
+        self.sections = {name: (fields[2 * i], fields[2 * i + 1]) for i, name in enumerate(TREESECTIONS)}
+        self.root = fields[-4]
+        self.size = fields[-3] # Bytes of the source
+        self.fn = self.string(0)
+
+    # Number of entries of section
+    def count(self, section):
+        return self.sections[section][1]
+
+    # Field field of the records of section, each width ints long
+    def column(self, section, width = 1, field = 0):
+        offset, count = self.sections[section]
+        part = memoryview(self.data)[offset:offset + count * width * 4]
+        if LITTLEENDIAN:
+            ints = part.cast('i')
+        else:
+            ints = array('i', bytes(part))
+            ints.byteswap()
+        return ints[field::width] if width > 1 else ints
+
+    # Record i of section, read with record
+    def record(self, section, record, i):
+        offset, count = self.sections[section]
+        if i < 0:
+            i += count
+        if not 0 <= i < count:
+            raise IndexError(section+' index out of range')
+        return record.unpack_from(self.data, offset + i * record.size)
+
+    # Entry i of the string table section
+    def text(self, section, i):
+        offset, count = self.sections[section]
+        if not 0 <= i < count:
+            raise IndexError(section+' index out of range')
+        start, end = struct.unpack_from('<ii', self.data, offset + i * 4)
+        base = offset + (count + 1) * 4
+        return self.data[base + start:base + end].decode()
+
+    def string(self, i):
+        return self.text('strings', i)
+
+    # Interned word of symbol id i
+    def name(self, i):
+        return self.text('names', i)
+
+    # Text of token i
+    def lexeme(self, i):
+        kind, start, end, text = self.record('tokens', TOKENRECORD, i)
+        if kind == EOF:
+            return 'EOF'
+        if kind == INT or kind == FLOAT:
+            return self.string(text)
+        return self.name(text) if text >= 0 else SPELLINGS[kind]
+
+    # Token i, as Lexer.lex would have made it
+    def token(self, i):
+        kind, start, end, text = self.record('tokens', TOKENRECORD, i)
+        if kind == INT:
+            value = int(self.string(text))
+        elif kind == FLOAT:
+            value = float(self.string(text))
+        elif kind == EOF:
+            value = 'EOF'
+        else:
+            value = self.name(text) if text >= 0 else SPELLINGS[kind]
+        return Token(kind, start if kind in STARTPOS else end, value, text if kind in WORDKINDS else -1)
+
+    # (kind, token, children) of node i
+    def node(self, i):
+        kind, token, first, count = self.record('nodes', NODERECORD, i)
+        offset = self.sections['children'][0] + first * 4
+        return kind, token, list(struct.unpack_from('<'+str(count)+'i', self.data, offset))
+
+    def errors(self):
+        return [Error(pos, self.string(name), self.string(details), self.fn, ln, col if col >= 0 else None)
+                for pos, ln, col, name, details in (self.record('errors', ERRORRECORD, i) for i in range(self.count('errors')))]
+
+    def sourceMap(self):
+        return SourceMap(None, self.column('lines'))
+
+    def tokenStream(self):
+        return FileTokens(self)
+
+    # AST over the nodes, None when nothing was parsed
+    def ast(self):
+        if self.root == -2:
+            return None
+        ast = AST(self.tokenStream())
+        ast.kinds, ast.tokenIdx, ast.firsts, ast.counts = (self.column('nodes', 4, field) for field in range(4))
+        ast.children = self.column('children')
+        for node, value in zip(self.column('values', 2, 0), self.column('values', 2, 1)):
+            ast.values[node] = literalValue(self.string(value))
+        ast.root = self.root
+        return ast
+
+# TokenStream over the tokens of a TreeFile, symbols holds their text ids
+class FileTokens(TokenStream):
+    def __init__(self, treeFile):
+        TokenStream.__init__(self, treeFile.fn, None)
+        self.file = treeFile
+        self.kinds, self.starts, self.ends, self.symbolIds = (treeFile.column('tokens', 4, field) for field in range(4))
+        self.map = treeFile.sourceMap()
+
+    def __getitem__(self, i):
+        return self.file.token(i)
+
+    def lexeme(self, i):
+        return self.file.lexeme(i)
+
+    def value(self, i):
+        return self.file.token(i).value
+
+    def tokens(self):
+        return [self.file.token(i) for i in range(len(self))]
+
+# Result of checking one file in a batch
+class FileReport:
+    def __init__(self, fn, size, tokens, errors, optimized = None, executed = None, analyzed = None):
+        self.fn = fn
+        self.size = size
+        self.tokens = tokens # Token count, 0 when lexing reached the error cap
+        self.errors = errors # Error objects, lexer and syntax errors, and the run time error of an executed file
+        self.optimized = optimized # Optimizer.report of an error free file, when asked for
+        self.executed = executed # Instructions run and final variables of an error free file, when asked for
+        self.analyzed = analyzed # Analyzer.report of a file without syntax errors, when asked for
+
+    # Lines of the report before the errors
+    def summary(self):
+        lines = [self.fn+': '+str(self.tokens)+' tokens, '+str(len(self.errors))+' errors']
+        if self.analyzed:
+            lines.append(self.analyzed)
+        if self.optimized:
+            lines.append(self.optimized)
+        if self.executed:
+            lines.append(self.executed)
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return '\n'.join([self.summary()] + [repr(error) for error in self.errors])
+
+# Lexes and parses one file without any trace output, run in the batch workers
+# Reports up to maxErrors lexer and syntax errors, in the order of their positions
+# optimize=True also runs the Optimizer over files without errors
+# execute=True also compiles them and runs them on the VM, from the optimized AST with optimize
+# With a ParseCache an unchanged file is loaded from it instead of being lexed and parsed
+# analyze=True also resolves the names of files without errors, reporting undeclared and
+# duplicate ones, and the VM then runs with the Analyzer's slots
+# A large file is lexed and parsed in chunks over jobs processes, see lexAndParseChunks
+# With emit, a folder, the tokens, AST and errors are written to the tree file treePath(emit, fn)
+def checkFile(fn, maxErrors = MAXERRORS, optimize = False, execute = False, cache = None, analyze = False, jobs = 1, emit = None):
+    try:
+        source = openSource(fn)
+    except OSError as exception:
+        return FileReport(fn, 0, 0, [Error(0, "FileError", exception.strerror, fn, 0)])
+    try:
+        stream, ast, errors = lexAndParse(fn, source, maxErrors, cache, jobs)
+        if ast is None:
+            emitTree(emit, stream, ast, errors, len(source))
+            return FileReport(fn, len(source), 0, errors)
+        optimized = None
+        if optimize and not errors:
+            optimizer = Optimizer(ast)
+            ast = optimizer.optimize()
+            optimized = optimizer.report()
+        analyzer = analyzed = None
+        if analyze and not errors:
+            analyzer = Analyzer(fn, ast, maxErrors)
+            errors.extend(analyzer.analyze())
+            analyzed = analyzer.report()
+        executed = None
+        if execute and not errors:
+            vm = VM(Compiler(fn, ast, analyzer).compile())
+            variables, error = vm.run()
+            if error is not None:
+                errors.append(error)
+            executed = 'Ran '+str(vm.executed)+' instructions: '+', '.join(name+' = '+str(value) for name, value in variables.items())
+        emitTree(emit, stream, ast, errors, len(source))
+        return FileReport(fn, len(source), len(stream), errors, optimized, executed, analyzed)
+    finally:
+        if isinstance(source, mmap.mmap):
+            source.close()
+
+# Writes the tree file of a checked file under the folder emit, when it is given
+# A failed write is added to errors
+def emitTree(emit, stream, ast, errors, size):
+    if emit is None:
+        return
+    treeFn = treePath(emit, stream.fn)
+    try:
+        os.makedirs(os.path.dirname(treeFn), exist_ok=True)
+        writeTree(treeFn, stream, ast, errors, size)
+    except OSError as exception:
+        errors.append(Error(0, "FileError", exception.strerror, stream.fn, 0))
+
+# Lexes and parses source with tokenize, or vectorize for a large one, and Parser,
+# or loads the result from cache
+# With jobs > 1 a file of SPLITSOURCE bytes or more is split over that many processes
+# Returns (stream, ast, errors), ast is None when lexing reached the error cap
+def lexAndParse(fn, source, maxErrors, cache = None, jobs = 1):
+    assert maxErrors >= 1, "maxErrors must be at least 1"
+    if cache is not None:
+        key = cache.key(source, maxErrors)
+        cached = cache.load(key, fn, source)
+        if cached is not None:
+            return cached
+        stream, ast, errors = lexAndParse(fn, source, maxErrors, None, jobs)
+        cache.store(key, stream, ast, errors)
+        return stream, ast, errors
+    if jobs > 1 and len(source) >= SPLITSOURCE:
+        return lexAndParseChunks(fn, source, maxErrors, jobs)
+    lexer = Lexer(fn, source)
+    if len(source) >= VECTORSOURCE:
+        stream, error = lexer.vectorize(maxErrors)
+    else:
+        stream, error = lexer.tokenize(maxErrors=maxErrors)
+    errors = list(lexer.errors)
+    if len(errors) >= maxErrors:
+        return stream, None, errors
+    parser = Parser(fn, stream, maxErrors - len(errors))
+    ast = parser.parse()
+    errors.extend(parser.diagnostics())
+    errors.sort(key=lambda error: error.pos)
+    return stream, ast, errors
+
+# Expands file names and glob patterns, keeping the first occurrence of each file
+def expandFiles(patterns):
+    files = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for fn in matches:
+            if fn not in seen and not os.path.isdir(fn):
+                seen.add(fn)
+                files.append(fn)
+    return files
+
+# Checks every file matched by patterns and returns their FileReports in input order
+# Files are spread over jobs worker processes, largest first so a big file
+# started last does not hold up the batch. jobs=1 checks in this process.
+# Files of SPLITSOURCE bytes or more are checked one at a time first, each split over the jobs
+# A ParseCache is shared by the workers and pruned once the batch is done
+def checkFiles(patterns, jobs = None, maxErrors = MAXERRORS, optimize = False, execute = False, cache = None, analyze = False, emit = None):
+    files = expandFiles(patterns)
+    jobs = jobs or os.cpu_count() or 1
+    split = [fn for fn in files if fileSize(fn) >= SPLITSOURCE] if jobs > 1 else []
+    reports = {fn: checkFile(fn, maxErrors, optimize, execute, cache, analyze, jobs, emit) for fn in split}
+    rest = [fn for fn in files if fn not in reports]
+    if jobs == 1 or len(rest) < 2:
+        reports.update((fn, checkFile(fn, maxErrors, optimize, execute, cache, analyze, 1, emit)) for fn in rest)
+    else:
+        order = sorted(rest, key=fileSize, reverse=True)
+        with ProcessPoolExecutor(max_workers=min(jobs, len(rest))) as pool:
+            futures = {fn: pool.submit(checkFile, fn, maxErrors, optimize, execute, cache, analyze, 1, emit) for fn in order}
+            reports.update((fn, futures[fn].result()) for fn in rest)
+    if cache is not None:
+        cache.prune()
+    return [reports[fn] for fn in files]
+
+# Size used to schedule fn, missing files sort last and fail in checkFile
+def fileSize(fn):
+    try:
+        return os.path.getsize(fn)
+    except OSError:
+        return -1
+
+# PARALLEL PARSING
+
+# Files at least this long are split into chunks lexed and parsed in parallel
+SPLITSOURCE = 8 << 20
+
+# Chunks per worker, so a worker that finishes early picks up another one
+CHUNKSPERJOB = 4
+
+# Bytes the split point pre-scan stops at, and the PSYCH that continues a CHECK after its `}`
+BOUNDARIES = re.compile(b'[{};]')
+ELSEAHEAD = re.compile(b'[ \t\n]*PSYCH')
+
+# Offsets cutting source into about count chunks, 0 and len(source) included
+# A chunk ends at a `;` or `}` at brace depth 0, where the parser is between two
+# top-level statements, unless a PSYCH follows the `}`. Braces are counted in bytes, a
+# wrong count only leads to a chunk with a syntax error, see lexAndParseChunks
+def splitPoints(source, count):
+    size = len(source)
+    points = [0]
+    depth = 0
+    scanned = 0 # depth is the brace depth at scanned
+    for chunk in range(1, count):
+        target = size * chunk // count
+        if target <= scanned:
+            continue
+        prefix = source[scanned:target]
+        depth += prefix.count(b'{') - prefix.count(b'}')
+        scanned = target
+        for match in BOUNDARIES.finditer(source, target):
+            char = match[0]
+            scanned = match.end()
+            if char == b'{':
+                depth += 1
+                continue
+            if char == b'}':
+                depth -= 1
+                if depth != 0 or ELSEAHEAD.match(source, scanned):
+                    continue
+            elif depth != 0:
+                continue
+            points.append(scanned)
+            break
+        else:
+            break
+    if points[-1] < size:
+        points.append(size)
+    return points
+
+# Lexes and parses the bytes start to end of the file fn as a program of its own, run in the workers
+# Returns None when the chunk has an error, otherwise the token columns, the words the chunk interned and the AST without its PROGRAM node, with the statements
+# that node had. The EOF token is kept for the chunk at the end of the file only
+def parseChunk(fn, start, end):
+    with open(fn, "rb") as fileObj:
+        fileObj.seek(start)
+        source = fileObj.read(end - start)
+        last = not fileObj.read(1)
+    lexer = Lexer(fn, source)
+    stream, error = lexer.vectorize() if len(source) >= VECTORSOURCE else lexer.tokenize()
+    if error is not None:
+        return None
+    parser = Parser(fn, stream)
+    ast = parser.parse()
+    if parser.errors:
+        return None
+    keep = len(stream) if last else len(stream) - 1
+    root = ast.root
+    first = ast.firsts[root]
+    return (stream.kinds[:keep], shiftArray(stream.starts[:keep], start), shiftArray(stream.ends[:keep], start), lexer.symbols.names[len(KEYWORDS):],
+            ast.kinds[:root], ast.tokenIdx[:root], ast.firsts[:root], ast.counts[:root], ast.children[:first],
+            ast.children[first:])
+
+# Copy of the int array values with offset added, entries of -1 stay -1 when missing is set
+def shiftArray(values, offset, missing = False):
+    if np is not None:
+        shifted = np.frombuffer(values, np.int32)
+        shifted = np.where(shifted < 0, shifted, shifted + offset) if missing else shifted + offset
+        return array('i', shifted.astype(np.int32).tobytes())
+    if missing:
+        return array('i', [value + offset if value >= 0 else value for value in values])
+    return array('i', [value + offset for value in values])
+
+# Lexes and parses the file fn, whose contents are source, in chunks spread over jobs worker
+# processes and stitches them into one TokenStream and AST
+# The result is the one of lexAndParse. From the first chunk with an error on, the rest of the
+# source is lexed and parsed in this process, so the errors are found in sequence
+def lexAndParseChunks(fn, source, maxErrors, jobs):
+    points = splitPoints(source, jobs * CHUNKSPERJOB)
+    symbols = SymbolTable()
+    stream = TokenStream(fn, source, symbols)
+    ast = AST(stream)
+    statements = []
+    # Appends the tokens and nodes of a chunk
+    def stitch(kinds, starts, ends, names, nodeKinds, tokenIdx, firsts, counts, children, chunkStatements):
+        tokenBase, nodeBase, childBase = len(stream.kinds), len(ast.kinds), len(ast.children)
+        stream.kinds.extend(kinds)
+        stream.starts.extend(starts)
+        stream.ends.extend(ends)
+        for name in names:
+            symbols.intern(name)
+        ast.kinds.extend(nodeKinds)
+        ast.tokenIdx.extend(shiftArray(tokenIdx, tokenBase, True))
+        ast.firsts.extend(shiftArray(firsts, childBase))
+        ast.counts.extend(counts)
+        ast.children.extend(shiftArray(children, nodeBase))
+        statements.extend(statement + nodeBase for statement in chunkStatements)
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(parseChunk, fn, start, end) for start, end in zip(points, points[1:])]
+        for start, future in zip(points, futures):
+            result = future.result()
+            if result is None:
+                for pending in futures:
+                    pending.cancel()
+                break
+            stitch(*result)
+        else:
+            ast.root = ast.add(NODE_PROGRAM, -1, statements)
+            return stream, ast, []
+
+    lexer = Lexer(fn, source, symbols)
+    rest, error = lexer.tokenize(start, maxErrors)
+    errors = list(lexer.errors)
+    if len(errors) >= maxErrors:
+        stream.kinds.extend(rest.kinds)
+        stream.starts.extend(rest.starts)
+        stream.ends.extend(rest.ends)
+        stream.map = lexer.map
+        return stream, None, errors
+    parser = Parser(fn, rest, maxErrors - len(errors))
+    restAst = parser.parse()
+    root = restAst.root
+    first = restAst.firsts[root]
+    stitch(rest.kinds, rest.starts, rest.ends, (), restAst.kinds[:root], restAst.tokenIdx[:root], restAst.firsts[:root],
+           restAst.counts[:root], restAst.children[:first], restAst.children[first:])
+    ast.root = ast.add(NODE_PROGRAM, -1, statements)
+    errors.extend(parser.diagnostics())
+    errors.sort(key=lambda error: error.pos)
+    stream.map = rest.map
+    return stream, ast, errors
+
+# STREAMING
+
+# Bytes a StreamLexer reads at a time
+STREAMBLOCK = 64 << 10
+
+# Longest stretch without whitespace a StreamLexer holds, a longer one is reported and skipped
+STREAMRUN = 1 << 20
+
+# Tokens a StreamParser has parsed before it drops them at the end of a top-level statement
+STREAMHOLD = 4096
+
+# Lexeme of each operator and punctuation token type
+SPELLINGS = {tokenType: lexeme for lexeme, tokenType in list(PUNCTUATION.items()) + list(OPERATORS.items())}
+
+# Lexes a binary file object while it is read, for a StreamParser
+# Blocks are cut after their last space, no lexeme goes on past a space, and every window
+# up to a cut is lexed with tokenize or vectorize. Operators go on past tabs and newlines,
+# so a block without spaces is cut before its last token instead. The tokens and errors
+# are the ones tokenize finds in the whole file, with file offsets and lines
+# A stretch of more than STREAMRUN bytes without a cut is reported as an IllegalCharError
+# and skipped up to its next whitespace, so at most STREAMRUN plus a block are held, and
+# only there the result differs from tokenize's
+# lineStarts grows with the lines read and map locates any offset of the file
+class StreamLexer:
+    def __init__(self, fn, fileObj, symbols = None, blockSize = STREAMBLOCK):
+        self.fn = fn
+        self.fileObj = fileObj
+        self.symbols = symbols if symbols is not None else SymbolTable()
+        self.blockSize = blockSize
+        self.errors = []
+        self.size = 0 # Bytes lexed so far
+        self.lineStarts = array('i', [0])
+        self.wide = array('i') # Offsets of the UTF-8 continuation bytes lexed so far
+        self.map = SourceMap(None, self.lineStarts, self.wide)
+
+    # Generator of (base, stream) for each window, stream holds its tokens with offsets
+    # into the window, which starts base bytes into the file
+    # Errors are added to errors before their window is yielded. The last window ends
+    # in EOF, unless lexing stopped after maxErrors errors
+    def stream(self, maxErrors = 1):
+        pending = b''
+        skipping = False # Dropping the rest of a stretch longer than STREAMRUN
+        while True:
+            block = self.fileObj.read(self.blockSize)
+            if skipping and block:
+                space = BYTES_SPACES.search(block)
+                skipped = space.start() if space is not None else len(block)
+                self.advance(block[:skipped])
+                block = block[skipped:]
+                skipping = space is None
+                if skipping:
+                    continue
+            text = pending + block
+            cut = text.rfind(b' ') + 1 if block else len(text)
+            if cut <= 0 and block:
+                # Without a space the cut goes before the last token, the ones before it and
+                # their errors do not change with what follows
+                probe, error = Lexer(self.fn, text).tokenize(maxErrors=len(text))
+                cut = probe.starts[-2] if len(probe) > 1 else 0
+            if cut <= 0 and block:
+                if len(text) <= STREAMRUN:
+                    pending = text
+                    continue
+                line, col = self.map.location(self.size)
+                self.errors.append(Error(self.map.chars(self.size), "IllegalCharError", "Over "+str(STREAMRUN)+" bytes without a space or a token",
+                                         self.fn, line, col))
+                self.advance(text)
+                pending = text = b''
+                skipping = True
+                if len(self.errors) < maxErrors:
+                    continue
+            window, pending = text[:cut], text[cut:]
+            base = self.size
+            line = len(self.lineStarts)
+            offset = self.map.chars(base) # Characters before the window
+            column = offset - self.map.chars(self.lineStarts[-1]) # Characters before the window on its first line
+            lexer = Lexer(self.fn, window, self.symbols)
+            budget = maxErrors - len(self.errors)
+            stream, error = lexer.vectorize(budget) if len(window) >= VECTORSOURCE else lexer.tokenize(maxErrors=budget)
+            for error in lexer.errors:
+                col = error.col + column if error.ln == 1 else error.col
+                self.errors.append(Error(error.pos + offset, error.errorName, error.details, self.fn, error.ln + line - 1, col))
+            final = not block or len(self.errors) >= maxErrors
+            if not final:
+                del stream.kinds[-1], stream.starts[-1], stream.ends[-1]
+                if stream.symbolIds is not None:
+                    del stream.symbolIds[-1]
+            self.advance(window)
+            yield base, stream
+            if final:
+                return
+
+    # Counts text, the next bytes of the file, as lexed and adds its lines and continuation bytes
+    def advance(self, text):
+        find = text.find
+        pos = find(b'\n')
+        while pos >= 0:
+            self.lineStarts.append(self.size + pos + 1)
+            pos = find(b'\n', pos + 1)
+        for match in CONTINUATION.finditer(text):
+            self.wide.append(self.size + match.start())
+        self.size += len(text)
+
+# Tokens of a tree parsed by a StreamParser, the ones its nodes refer to
+# Offsets are file offsets, and without the source the text of literals is kept
+class TreeTokens(TokenStream):
+    def __init__(self, fn, table, sourceMap):
+        TokenStream.__init__(self, fn, None, table)
+        self.symbolIds = array('i')
+        self.literals = {} # Token index -> lexeme of INT and FLOAT tokens
+        self.indices = array('i') # Index of every token among the tokens of the file
+        self.map = sourceMap
+
+    def lexeme(self, i):
+        kind = self.kinds[i]
+        if kind == EOF:
+            return 'EOF'
+        if kind == INT or kind == FLOAT:
+            return self.literals[i]
+        symbol = self.symbolIds[i]
+        return self.table.names[symbol] if symbol >= 0 else SPELLINGS[kind]
+
+    def value(self, i):
+        kind = self.kinds[i]
+        if kind == INT:
+            return int(self.literals[i])
+        elif kind == FLOAT:
+            return float(self.literals[i])
+        return self.lexeme(i)
+
+    def tokens(self):
+        return [self[i] for i in range(len(self))]
+
+# Parser pulling its tokens from a StreamLexer, so parsing overlaps reading the file
+# Tokens are held from the windows the lexer yields, in kinds and held, and are dropped
+# at the end of a top-level statement once STREAMHOLD were parsed. With keepTree the
+# tokens the nodes refer to move to tokens first, a TreeTokens, otherwise the nodes go
+# too and the tree is left with the last statements. Memory for tokens is bounded by
+# the longest statement and the window instead of the file
+# Lexer and syntax errors share maxErrors. They are passed to report as soon as no
+# earlier one can turn up, and are the ones of lexAndParse while fewer than maxErrors
+# A TreeWriter gets the tokens of every window as it is read
+class StreamParser(Parser):
+    def __init__(self, fn, lexer, maxErrors = 1, keepTree = False, report = None, writer = None):
+        assert maxErrors >= 1, "maxErrors must be at least 1"
+        self.Error = False
+        self.limit = maxErrors
+        self.maxErrors = maxErrors # Left for syntax errors, see fetch
+        self.errors = []
+        self.errorTokens = []
+        self.fn = fn
+        self.lexer = lexer
+        self.windows = lexer.stream(maxErrors)
+        self.keepTree = keepTree
+        self.report = report
+        self.writer = writer
+        self.found = [] # Lexer and syntax errors in position order
+        self.reported = 0 # Lexer errors already in found
+        self.held = [] # (index of its first token, base, stream) of each window tokens are held from
+        self.kinds = array('i')
+        self.count = 0 # Tokens read from the lexer
+        self.dropped = 0 # Tokens released, the file index of kinds[i] is dropped + i
+        self.tokens = TreeTokens(fn, lexer.symbols, lexer.map)
+        self.ast = AST(self.tokens)
+        self.released = 0 # Nodes whose tokens are in tokens
+        self.idx = -1
+        self.currentType = None
+        self.getNextToken()
+
+    def getNextToken(self):
+        if self.idx < len(self.kinds) - 1:
+            self.idx += 1
+            self.currentType = self.kinds[self.idx]
+        elif self.currentType != EOF:
+            if self.fetch():
+                self.idx += 1
+                self.currentType = self.kinds[self.idx]
+            else:
+                # The lexer stopped at the error cap, parsing ends like at the end of the file
+                self.stop()
+                self.currentType = EOF
+
+    # Appends the tokens of the next window with any tokens, False once the lexer has none left
+    # The errors of the windows before it are reported first, all their tokens were parsed
+    def fetch(self):
+        while True:
+            self.flush()
+            window = next(self.windows, None)
+            if window is None:
+                return False
+            base, stream = window
+            self.maxErrors = self.limit - len(self.lexer.errors)
+            if len(stream):
+                break
+        if self.writer is not None:
+            self.writer.addTokens(stream, self.lexer.map, base)
+        self.held.append((len(self.kinds), base, stream))
+        self.kinds.extend(stream.kinds)
+        self.count += len(stream)
+        return True
+
+    # (index of its first token, base, stream) of the held window with token i
+    def window(self, i):
+        for first, base, stream in reversed(self.held):
+            if first <= i:
+                return first, base, stream
+
+    def error(self, details):
+        if self.Error:
+            return
+        Parser.error(self, details)
+        first, base, stream = self.window(self.idx)
+        local = self.idx - first
+        line, col = self.lexer.map.location(stream.starts[local] + base)
+        error = Error(self.lexer.map.chars(stream.offset(local) + base), "InvalidSyntaxError", details, self.fn, line, col)
+        self.flush(error.pos)
+        self.emit(error)
+
+    # Reports the lexer errors found so far, up to position pos
+    def flush(self, pos = None):
+        errors = self.lexer.errors
+        while self.reported < len(errors) and (pos is None or errors[self.reported].pos <= pos):
+            self.emit(errors[self.reported])
+            self.reported += 1
+
+    def emit(self, error):
+        if len(self.found) >= self.limit:
+            return
+        self.found.append(error)
+        if self.report is not None:
+            self.report(error)
+        if len(self.found) >= self.limit:
+            self.stop()
+
+    # Ends parsing, the errors reached the cap
+    def stop(self):
+        self.Error = True
+        self.maxErrors = 0
+
+    # Same as Parser.start, dropping the tokens of the statements parsed
+    def start(self):
+        statements = []
+        while self.currentType != EOF and not self.Error:
+            first = self.idx
+            statements.append(self.stmt())
+            if self.Error:
+                self.recover(first)
+            if self.idx >= STREAMHOLD:
+                self.release()
+                if not self.keepTree:
+                    statements = []
+        self.flush()
+        if self.keepTree:
+            self.release()
+        return self.ast.add(NODE_PROGRAM, -1, statements)
+
+    # Drops the tokens before the current one, and the windows left without tokens
+    # With keepTree the tokens the new nodes refer to are copied to tokens first
+    def release(self):
+        ast = self.ast
+        if self.keepTree:
+            tokenIdx = ast.tokenIdx
+            kept = {}
+            for node in range(self.released, len(ast.kinds)):
+                token = tokenIdx[node]
+                if token >= 0:
+                    if token not in kept:
+                        kept[token] = self.keep(token)
+                    tokenIdx[node] = kept[token]
+            self.released = len(ast.kinds)
+        else:
+            for column in (ast.kinds, ast.tokenIdx, ast.firsts, ast.counts, ast.children):
+                del column[:]
+        done = self.idx
+        del self.kinds[:done]
+        self.dropped += done
+        self.idx = 0
+        held = [(first - done, base, stream) for first, base, stream in self.held]
+        while len(held) > 1 and held[1][0] <= 0:
+            held.pop(0)
+        self.held = held
+
+    # Copies token i to tokens and returns its index there
+    def keep(self, i):
+        first, base, stream = self.window(i)
+        local = i - first
+        tokens = self.tokens
+        kind = stream.kinds[local]
+        tokens.kinds.append(kind)
+        tokens.starts.append(stream.starts[local] + base)
+        tokens.ends.append(stream.ends[local] + base)
+        tokens.symbolIds.append(stream.symbols[local])
+        tokens.indices.append(self.dropped + i)
+        if kind == INT or kind == FLOAT:
+            tokens.literals[len(tokens.kinds) - 1] = stream.lexeme(local)
+        return len(tokens.kinds) - 1
+
+    # Lexer and syntax errors, in position order
+    def diagnostics(self):
+        return list(self.found)
+
+# Lexes and parses fn while it is read with a StreamParser, passing every lexer and syntax
+# error to report as soon as it is known
+# analyze=True keeps the tree and resolves its names once the file was parsed
+# With emit, a folder, the tree file treePath(emit, fn) is written while the file is read
+# Returns the FileReport checkFile would while fewer than maxErrors errors are found
+def streamFile(fn, maxErrors = MAXERRORS, report = None, analyze = False, emit = None):
+    try:
+        fileObj = open(fn, "rb")
+    except OSError as exception:
+        return FileReport(fn, 0, 0, [Error(0, "FileError", exception.strerror, fn, 0)])
+    treeObj = writer = None
+    failed = []
+    with fileObj:
+        lexer = StreamLexer(fn, fileObj)
+        if emit is not None:
+            treeFn = treePath(emit, fn)
+            try:
+                os.makedirs(os.path.dirname(treeFn), exist_ok=True)
+                treeObj = open(treeFn, "wb")
+                writer = TreeWriter(treeObj, fn, lexer.symbols)
+            except OSError as exception:
+                failed.append(Error(0, "FileError", exception.strerror, fn, 0))
+        parser = StreamParser(fn, lexer, maxErrors, analyze or writer is not None, report, writer)
+        ast = parser.parse()
+        errors = parser.diagnostics()
+        size = os.fstat(fileObj.fileno()).st_size
+    capped = len(lexer.errors) >= maxErrors
+    analyzed = None
+    if analyze and not errors:
+        analyzer = Analyzer(fn, ast, maxErrors)
+        for error in analyzer.analyze():
+            errors.append(error)
+            if report is not None:
+                report(error)
+        analyzed = analyzer.report()
+    if writer is not None:
+        with treeObj:
+            writer.addLines(lexer.map)
+            if not capped:
+                writer.addTree(ast, ast.tokens.indices)
+            writer.close(errors, size)
+    errors.extend(failed)
+    if capped:
+        return FileReport(fn, size, 0, errors)
+    return FileReport(fn, size, parser.count, errors, analyzed=analyzed)
+
+# SERVICE
+
+# Sources at least this long are lexed and parsed in the worker pool, smaller ones
+# on the event loop, where they finish faster than a round trip to a worker
+HEAVYSOURCE = 256 << 10
+
+# Tokens sent per response line when a request asks for them
+TOKENCHUNK = 4096
+
+# Message for a request field of the wrong type, None when they are all right
+def requestError(request):
+    for field in ('source', 'path', 'fn'):
+        if field in request and not isinstance(request[field], str):
+            return '"'+field+'" is not a string'
+    maxErrors = request.get('maxErrors', MAXERRORS)
+    if type(maxErrors) is not int or maxErrors < 1:
+        return '"maxErrors" is not a positive integer'
+    return None
+
+# Answers one request of the parse service
+# request is a dict with the source as "path" or as "source" (named by "fn"), and
+# optionally "id", "tokens" to stream the tokens back, "analyze" and "maxErrors"
+# Returns the response dicts in order, the last one has "done" set
+def serveRequest(request, cache = None):
+    started = time.perf_counter()
+    ident = request.get('id')
+    error = requestError(request)
+    if error is not None:
+        return [{'id': ident, 'done': True, 'error': error}]
+    maxErrors = request.get('maxErrors', MAXERRORS)
+    if 'source' in request:
+        fn = request.get('fn', '<source>')
+        source = request['source']
+    else:
+        fn = request.get('path', '')
+        try:
+            source = openSource(fn)
+        except OSError as exception:
+            return [{'id': ident, 'done': True, 'error': exception.strerror}]
+    try:
+        stream, ast, errors = lexAndParse(fn, source, maxErrors, cache)
+        if request.get('analyze') and ast is not None and not errors:
+            errors.extend(Analyzer(fn, ast, maxErrors).analyze())
+        responses = []
+        if request.get('tokens'):
+            for first in range(0, len(stream), TOKENCHUNK):
+                last = min(first + TOKENCHUNK, len(stream))
+                responses.append({'id': ident, 'tokens': [[kind, start, end] for kind, start, end in
+                                                          zip(stream.kinds[first:last], stream.starts[first:last], stream.ends[first:last])]})
+        diagnostics = [{'pos': error.pos, 'name': error.errorName, 'details': error.details, 'line': error.ln, 'column': error.col}
+                       for error in errors]
+        responses.append({'id': ident, 'done': True, 'tokenCount': len(stream) if ast is not None else 0,
+                          'diagnostics': diagnostics, 'ms': round((time.perf_counter() - started) * 1000, 3)})
+        return responses
+    finally:
+        if isinstance(source, mmap.mmap):
+            source.close()
+
+# Long running parse service answering JSON lines requests, see serveRequest
+# Every request runs as a task of its own and its response lines are written as
+# soon as they are ready, so a heavy request does not hold up the light ones
+# behind it. Heavy requests go to a pool of warm worker processes.
+class ParseServer:
+    def __init__(self, jobs = None, cache = None):
+        self.jobs = jobs
+        self.cache = cache
+        self.pool = None # Started on the first heavy request
+
+    # Size of the source a valid request names, to pick where it runs
+    def heavy(self, request):
+        if 'source' in request:
+            return len(request['source']) >= HEAVYSOURCE
+        return fileSize(request.get('path', '')) >= HEAVYSOURCE
+
+    async def answer(self, line, write):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("Request is not an object")
+        except ValueError as exception:
+            await write({'done': True, 'error': str(exception)})
+            return
+        try:
+            # serveRequest answers an invalid request with its error
+            if requestError(request) is None and self.heavy(request):
+                if self.pool is None:
+                    self.pool = ProcessPoolExecutor(max_workers=self.jobs)
+                responses = await asyncio.get_running_loop().run_in_executor(self.pool, serveRequest, request, self.cache)
+            else:
+                responses = serveRequest(request, self.cache)
+        except Exception as exception:
+            # Whatever failed, in a worker or here, the request still gets its done line
+            responses = [{'id': request.get('id'), 'done': True, 'error': type(exception).__name__+': '+str(exception)}]
+        for response in responses:
+            await write(response)
+
+    # Answers the lines readline returns until it returns b'', write sends one response
+    async def serve(self, readline, write):
+        tasks = set()
+        while True:
+            line = await readline()
+            if not line:
+                break
+            if line.strip():
+                task = asyncio.ensure_future(self.answer(line, write))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+
+    # Serves stdin and stdout until stdin is closed
+    async def serveStdio(self):
+        loop = asyncio.get_running_loop()
+        stdin = sys.stdin.buffer
+        stdout = sys.stdout.buffer
+        async def write(response):
+            stdout.write(json.dumps(response).encode() + b'\n')
+            stdout.flush()
+        # Read in a thread, stdin may be a file or terminal the event loop cannot watch
+        await self.serve(lambda: loop.run_in_executor(None, stdin.readline), write)
+
+    # Serves every connection to the Unix socket at path until cancelled or terminated
+    async def serveSocket(self, path):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        async def connection(reader, writer):
+            async def write(response):
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+            try:
+                await self.serve(reader.readline, write)
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+        server = await asyncio.start_unix_server(connection, path, limit=1 << 30)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+# Runs a ParseServer on stdin, or on the Unix socket at path
+def serve(path = None, jobs = None, cache = None):
+    server = ParseServer(jobs, cache)
+    try:
+        if path is None:
+            asyncio.run(server.serveStdio())
+        else:
+            asyncio.run(server.serveSocket(path))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        server.close()
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+# BENCHMARK
+
+# Statement mixes of the generated benchmark programs
+#   weights  relative share of each statement kind
+#   depth    deepest nesting of blocks, CHECK/PSYCH and SPAN
+#   chain    most comparisons joined by && and || in one condition
+BENCHMIXES = {
+            'balanced': {'weights': {'declare': 3, 'assign': 3, 'check': 2, 'span': 1, 'block': 1}, 'depth': 8, 'chain': 3},
+            'nested': {'weights': {'declare': 1, 'assign': 1, 'check': 3, 'span': 3, 'block': 2}, 'depth': 60, 'chain': 2},
+            'chains': {'weights': {'declare': 1, 'assign': 1, 'check': 4, 'span': 2, 'block': 0}, 'depth': 4, 'chain': 40},
+            'declarations': {'weights': {'declare': 9, 'assign': 1, 'check': 0, 'span': 0, 'block': 0}, 'depth': 1, 'chain': 1}
+        }
+
+# Benchmark phases, each measured in a fresh worker process
+#   lex       Lexer.lex over the file read as a str, building Token objects
+#   scan      Lexer.scan over the file read as a str, building the same Token objects
+#   tokenize  Lexer.tokenize over a memory map of the file, building a TokenStream
+#   vectorize Lexer.vectorize over a memory map of the file, the same TokenStream
+#   parse     Parser over the TokenStream from tokenize, which is not timed
+#   chunked   lexAndParseChunks over a memory map of the file, lexing and parsing its chunks
+#             in jobs worker processes and stitching them together
+BENCHPHASES = ['lex', 'scan', 'tokenize', 'vectorize', 'parse', 'chunked']
+
+# File the baselines are kept in, and the slowdown against them counted as a regression
+BASELINES = 'benchmarks.json'
+THRESHOLD = 0.10
+
+# Writes random programs with the statement mix of BENCHMIXES[mix]
+# invalid is the share of simple statements broken with a lexer or syntax error
+# The same seed writes the same programs
+class ProgramGenerator:
+    def __init__(self, mix = 'balanced', invalid = 0.0, seed = 0):
+        settings = BENCHMIXES[mix]
+        self.random = random.Random(seed)
+        self.kinds = [kind for kind, weight in settings['weights'].items() if weight]
+        self.weights = list(accumulate(settings['weights'][kind] for kind in self.kinds))
+        self.depth = settings['depth']
+        self.chain = settings['chain']
+        self.invalid = invalid
+        self.statements = 0 # Statements written so far, nested ones included
+        self.names = [''.join(self.random.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(self.random.randint(6, 8))) for _ in range(64)]
+
+    # Writes top-level statements to the text file fileObj until size characters were written
+    # Returns the number of characters written
+    def write(self, fileObj, size):
+        written = 0
+        while written < size:
+            lines = []
+            buffered = 0
+            while buffered < WRITECHUNK and written + buffered < size:
+                line = self.stmt(0) + '\n'
+                lines.append(line)
+                buffered += len(line)
+            fileObj.write(''.join(lines))
+            written += buffered
+        return written
+
+    def stmt(self, depth):
+        kind = self.random.choices(self.kinds, cum_weights=self.weights)[0]
+        if depth >= self.depth and kind in ('check', 'span', 'block'):
+            kind = 'assign'
+        self.statements += 1
+        if kind == 'declare' or kind == 'assign':
+            if self.invalid and self.random.random() < self.invalid:
+                return self.broken()
+            text = self.name() + ' = ' + self.expr() + ' ;'
+            if kind == 'declare':
+                if self.random.random() < 0.3:
+                    text = self.name() + ' ;'
+                text = self.random.choice(DATATYPES) + ' ' + text
+            return text
+        if kind == 'check':
+            text = 'CHECK ( ' + self.condition() + ' ) ' + self.block(depth + 1)
+            if self.random.random() < 0.5:
+                text += ' PSYCH ' + self.block(depth + 1)
+            return text
+        if kind == 'span':
+            return 'SPAN ( ' + self.condition() + ' ) ' + self.block(depth + 1)
+        return self.block(depth + 1)
+
+    # Only the first statement of a block may open another one, so nesting grows deep, not wide
+    def block(self, depth):
+        statements = [self.stmt(depth)]
+        for _ in range(self.random.randint(0, 2)):
+            statements.append(self.simple())
+        return '{ ' + ' '.join(statements) + ' }'
+
+    def simple(self):
+        self.statements += 1
+        if self.invalid and self.random.random() < self.invalid:
+            return self.broken()
+        return self.name() + ' = ' + self.expr() + ' ;'
+
+    # Statement with one lexer or syntax error
+    def broken(self):
+        kind = self.random.randrange(4)
+        if kind == 0:
+            return self.name() + ' = ' + self.expr() # Missing ;
+        if kind == 1:
+            return self.name() + ' = ' + self.factor() + ' $ ' + self.factor() + ' ;'
+        if kind == 2:
+            return self.name()[:3] + ' = ' + self.expr() + ' ;' # Name too short
+        return 'CHECK ( ' + self.condition() + ' { ' + self.simple() + ' }' # Missing )
+
+    def name(self):
+        return self.random.choice(self.names)
+
+    def factor(self):
+        choice = self.random.random()
+        if choice < 0.6:
+            return self.name()
+        if choice < 0.9:
+            return str(self.random.randint(0, 1000))
+        return str(self.random.randint(0, 100)) + '.' + str(self.random.randint(0, 99))
+
+    def expr(self):
+        terms = [self.factor()]
+        for _ in range(self.random.randint(0, 3)):
+            terms.append(self.random.choice('+-*/%'))
+            terms.append(self.factor())
+        if len(terms) > 3 and self.random.random() < 0.3:
+            return '( ' + ' '.join(terms[:3]) + ' ) ' + ' '.join(terms[3:])
+        return ' '.join(terms)
+
+    def condition(self):
+        comparisons = [self.comparison()]
+        for _ in range(self.random.randint(0, self.chain - 1)):
+            comparisons.append(self.random.choice(('&&', '&&', '||')))
+            comparisons.append(self.comparison())
+        return ' '.join(comparisons)
+
+    def comparison(self):
+        if self.random.random() < 0.1:
+            return '!! ' + self.name()
+        operator = self.random.choice(('<', '>', '<=', '>=', '==', '!='))
+        return self.factor() + ' ' + self.random.choice('+-') + ' ' + self.factor() + ' ' + operator + ' ' + self.factor()
+
+# Characters ProgramGenerator.write buffers before writing them out
+WRITECHUNK = 1 << 20
+
+# Reads sizes like 4096, 64K, 10M or 1G
+def parseSize(text):
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+# Reads a count of at least one, like --max-errors
+def parseCount(text):
+    count = int(text)
+    if count < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, not "+text)
+    return count
+
+# Peak resident set size of this process in bytes, None where the resource module is missing
+def peakRSS():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+# Runs one benchmark phase over fn, in a worker process of its own
+# The phase is timed repeat times without tracing, keeping the fastest, then run
+# again under tracemalloc for the peak of the memory it allocates
+# Returns a dict of seconds, tokens, peak RSS and allocated bytes
+def benchPhase(phase, fn, allocations = True, repeat = 1, jobs = None):
+    maxErrors = sys.maxsize
+    source = text = stream = None
+    if phase == 'lex' or phase == 'scan':
+        with open(fn, "r") as fileObj:
+            text = fileObj.read()
+        if phase == 'lex':
+            work = lambda: Lexer(fn, text).lex(maxErrors)[0]
+        else:
+            work = lambda: Lexer(fn, text).scan(maxErrors)[0]
+    else:
+        source = openSource(fn)
+        if phase == 'vectorize':
+            work = lambda: Lexer(fn, source).vectorize(maxErrors)[0]
+        elif phase == 'chunked':
+            work = lambda: lexAndParseChunks(fn, source, maxErrors, jobs or os.cpu_count())[0]
+        else:
+            work = lambda: Lexer(fn, source).tokenize(maxErrors=maxErrors)[0]
+        if phase == 'parse':
+            stream = work()
+            work = lambda: Parser(fn, stream, maxErrors).parse()
+    try:
+        seconds = None
+        for _ in range(repeat):
+            result = None
+            started = time.perf_counter()
+            result = work()
+            elapsed = time.perf_counter() - started
+            seconds = elapsed if seconds is None else min(seconds, elapsed)
+        tokens = len(stream if stream is not None else result) - 1
+        rss = peakRSS()
+        result = None
+        allocated = None
+        if allocations:
+            tracemalloc.start()
+            work()
+            allocated = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return {'seconds': seconds, 'tokens': tokens, 'rss': rss, 'allocated': allocated}
+    finally:
+        stream = None
+        if isinstance(source, mmap.mmap):
+            source.close()
+
+# Generates a program for every mix, runs the phases over it and compares the
+# tokens per second with the baselines kept in the JSON file baselines
+# Each phase is timed repeat times and the fastest run counts
+# Baselines are per machine, save=True replaces them with this run's numbers
+# Returns the number of phases that ran slower than threshold allows
+def benchmark(size, mixes = None, phases = None, invalid = 0.0, seed = 0, baselines = BASELINES,
+              threshold = THRESHOLD, save = False, allocations = True, repeat = 3, out = None, jobs = None):
+    mixes = mixes or list(BENCHMIXES)
+    phases = phases or BENCHPHASES
+    out = out or TextTrace()
+    try:
+        with open(baselines, "r") as fileObj:
+            previous = json.load(fileObj)
+    except (OSError, ValueError):
+        previous = {}
+    current = {}
+    regressions = 0
+    with tempfile.TemporaryDirectory() as directory:
+        for mix in mixes:
+            fn = os.path.join(directory, mix+'.txt')
+            generator = ProgramGenerator(mix, invalid, seed)
+            with open(fn, "w") as fileObj:
+                written = generator.write(fileObj, size)
+            scenario = mix+'/'+str(size)+'/'+str(invalid)
+            out.write(scenario+': '+str(written)+' bytes, '+str(generator.statements)+' statements\n')
+            current[scenario] = {}
+            for phase in phases:
+                # A fresh process per phase, so peak RSS belongs to that phase alone
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    result = pool.submit(benchPhase, phase, fn, allocations, repeat, jobs).result()
+                seconds = max(result['seconds'], 1e-9)
+                rate = result['tokens'] / seconds
+                current[scenario][phase] = rate
+                line = '  '+phase.ljust(9)+' %8.3f s %12.0f tokens/s %12.0f statements/s %8.1f MB/s' % (seconds, rate, generator.statements / seconds,
+                                                                                                  written / seconds / (1 << 20))
+                if result['rss'] is not None:
+                    line += '  peak RSS %.1f MB' % (result['rss'] / (1 << 20))
+                if result['allocated'] is not None:
+                    line += '  allocated %.1f MB' % (result['allocated'] / (1 << 20))
+                # Speedup over lex when it was timed first, as with the default phases
+                if phase != 'lex' and 'lex' in current[scenario]:
+                    line += '  %.1fx lex' % (rate / current[scenario]['lex'])
+                baseline = previous.get(scenario, {}).get(phase)
+                if baseline:
+                    line += '  %+.1f%%' % ((rate / baseline - 1) * 100)
+                    if rate < baseline * (1 - threshold):
+                        line += ' REGRESSION'
+                        regressions += 1
+                out.write(line+'\n')
+            out.flush()
+    if save:
+        previous.update(current)
+        with open(baselines, "w") as fileObj:
+            json.dump(previous, fileObj, indent=1, sort_keys=True)
+    return regressions
+
+# Options honored in each mode of main, besides the flag of the mode
+# Without a mode flag files are checked, and without files the samples are traced
+MODEOPTIONS = {
+            'bench': {'mix', 'phase', 'invalid', 'seed', 'baselines', 'save_baselines', 'threshold', 'repeat', 'no_allocations', 'jobs'},
+            'serve': {'jobs', 'cache', 'cache_size'},
+            'samples': {'trace'},
+            'trace': {'files', 'scan', 'max_errors'},
+            'profile': {'files', 'scan', 'max_errors', 'flamegraph'},
+            'batch': {'files', 'max_errors', 'batch_output'},
+            'stream': {'files', 'max_errors', 'analyze', 'emit'},
+            'check': {'files', 'jobs', 'max_errors', 'optimize', 'analyze', 'run', 'cache', 'cache_size', 'emit'}
+        }
+
+# Command line entry point
+# With no files the four sample programs are run with the text trace
+# An option the mode does not honor is an error rather than ignored
+def main(argv = None):
+    arguments = argparse.ArgumentParser(description="Lex and parse source files")
+    modes = arguments.add_mutually_exclusive_group()
+    arguments.add_argument('files', nargs='*', help="source files or glob patterns")
+    arguments.add_argument('-j', '--jobs', type=int, default=None, help="worker processes, defaults to the CPU count")
+    modes.add_argument('--trace', action='store_true', help="print the token list and parse trace of each file")
+    arguments.add_argument('--scan', action='store_true', help="lex with the single pass scanner (with --trace or --profile)")
+    arguments.add_argument('--max-errors', type=parseCount, default=MAXERRORS, help="errors reported per file before giving up")
+    arguments.add_argument('--optimize', action='store_true', help="report what constant folding removes from each file")
+    arguments.add_argument('--analyze', action='store_true', help="report undeclared and duplicate variables")
+    arguments.add_argument('--run', action='store_true', help="compile error free files to bytecode and run them")
+    arguments.add_argument('--cache', metavar='DIR', help="reuse the tokens, diagnostics and AST of unchanged files from DIR")
+    arguments.add_argument('--cache-size', type=parseSize, default=CACHESIZE, help="bytes the cache keeps, least recently used entries go first")
+    modes.add_argument('--stream', action='store_true', help="print the errors of each file while it is read (with --analyze)")
+    modes.add_argument('--batch', metavar='NPZ', help="run error free files over the input columns of the NumPy .npz file NPZ")
+    arguments.add_argument('--batch-output', metavar='DIR', help="write the output columns of every file run with --batch to a .npz file under DIR")
+    arguments.add_argument('--emit', metavar='DIR', help="write the tokens, AST and errors of every file to a tree file under DIR")
+    modes.add_argument('--serve', nargs='?', const='-', metavar='SOCKET', help="answer JSON lines requests on stdin, or on the Unix socket SOCKET")
+    modes.add_argument('--profile', action='store_true', help="print calls, time and tokens of every rule and lexer helper")
+    arguments.add_argument('--flamegraph', metavar='FILE', help="write the profile as collapsed stacks to FILE (with --profile)")
+    bench = arguments.add_argument_group('benchmark')
+    bench.add_argument('--bench', type=parseSize, metavar='SIZE', help="time lexing and parsing of generated programs of SIZE bytes, like 10M")
+    bench.add_argument('--mix', action='append', choices=list(BENCHMIXES), help="statement mix to generate, may be repeated, defaults to all")
+    bench.add_argument('--phase', action='append', choices=BENCHPHASES, help="phase to time, may be repeated, defaults to all")
+    bench.add_argument('--invalid', type=float, default=0.0, help="share of statements generated with an error")
+    bench.add_argument('--seed', type=int, default=0, help="seed of the program generator")
+    bench.add_argument('--baselines', default=BASELINES, help="JSON file of the baseline tokens/s")
+    bench.add_argument('--save-baselines', action='store_true', help="store this run as the baselines")
+    bench.add_argument('--threshold', type=float, default=THRESHOLD, help="slowdown against a baseline counted as a regression")
+    bench.add_argument('--repeat', type=int, default=3, help="timed runs of each phase, the fastest counts")
+    bench.add_argument('--no-allocations', action='store_true', help="skip the tracemalloc run of each phase")
+    options = arguments.parse_args(argv)
+    mode = next((name for name in ('bench', 'serve', 'trace', 'profile', 'batch', 'stream') if getattr(options, name)), 'check')
+    if not options.files and mode in ('check', 'trace'):
+        mode = 'samples'
+    for name, value in vars(options).items():
+        if name != mode and name not in MODEOPTIONS[mode] and value not in ([], arguments.get_default(name)):
+            option = 'files' if name == 'files' else '--'+name.replace('_', '-')
+            if mode == 'check':
+                arguments.error(option+" needs "+" or ".join('--'+other for other in MODEOPTIONS if name in MODEOPTIONS[other]))
+            arguments.error(option+(" needs files" if mode == 'samples' else " cannot be used with --"+mode))
+    if options.cache_size != CACHESIZE and not options.cache:
+        arguments.error("--cache-size needs --cache")
+
+    if options.bench:
+        regressions = benchmark(options.bench, options.mix, options.phase, options.invalid, options.seed, options.baselines,
+                                options.threshold, options.save_baselines, not options.no_allocations, options.repeat, jobs=options.jobs)
+        return 1 if regressions else 0
+
+    if options.serve:
+        cache = ParseCache(options.cache, options.cache_size) if options.cache else None
+        serve(None if options.serve == '-' else options.serve, options.jobs, cache)
+        return 0
+    if not options.files:
+        for fn in ('sample1.txt', 'sample2.txt', 'sample3.txt', 'sample4.txt'):
+            run(fn)
+        return 0
+    if options.trace:
+        for fn in expandFiles(options.files):
+            run(fn, scan=options.scan, maxErrors=options.max_errors)
+        return 0
+    if options.profile:
+        profile = Profile()
+        for fn in expandFiles(options.files):
+            profileFile(fn, options.scan, options.max_errors, profile)
+        out = TextTrace()
+        out.write(profile.table()+'\n')
+        out.flush()
+        if options.flamegraph:
+            with open(options.flamegraph, "w") as fileObj:
+                fileObj.write(profile.collapsed())
+        return 0
+    if options.batch:
+        if np is None:
+            arguments.error("--batch needs NumPy")
+        with np.load(options.batch) as columns:
+            inputs = dict(columns)
+        out = TextTrace()
+        reports = []
+        for fn in expandFiles(options.files):
+            output = treePath(options.batch_output, fn, '.npz') if options.batch_output else None
+            if output is not None:
+                os.makedirs(os.path.dirname(output), exist_ok=True)
+            reports.append(batchFile(fn, inputs, options.max_errors, output))
+            out.write(repr(reports[-1])+'\n')
+        errorCount = sum(len(report.errors) for report in reports)
+        out.write('Checked '+str(len(reports))+' files, '+str(sum(report.tokens for report in reports))+' tokens, '+str(errorCount)+' errors\n')
+        out.flush()
+        return 1 if errorCount else 0
+    if options.stream:
+        out = TextTrace()
+        def report(error):
+            out.write(repr(error)+'\n')
+            out.flush()
+        tokens = errorCount = files = 0
+        for fn in expandFiles(options.files):
+            fileReport = streamFile(fn, options.max_errors, report, options.analyze, options.emit)
+            out.write(fileReport.summary()+'\n')
+            tokens += fileReport.tokens
+            errorCount += len(fileReport.errors)
+            files += 1
+        out.write('Checked '+str(files)+' files, '+str(tokens)+' tokens, '+str(errorCount)+' errors\n')
+        out.flush()
+        return 1 if errorCount else 0
+
+    cache = ParseCache(options.cache, options.cache_size) if options.cache else None
+    reports = checkFiles(options.files, options.jobs, options.max_errors, options.optimize, options.run, cache, options.analyze, options.emit)
+    out = TextTrace()
+    errorCount = 0
+    for report in reports:
+        out.write(repr(report)+'\n')
+        errorCount += len(report.errors)
+    out.write('Checked '+str(len(reports))+' files, '+str(sum(report.tokens for report in reports))+' tokens, '+str(errorCount)+' errors\n')
+    out.flush()
+    return 1 if errorCount else 0
 
-run('sample1.txt')
-run('sample2.txt')
-run('sample3.txt')
-run('sample4.txt')
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# test2.py lives at the top of the repository, next to the samples
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
@@ -0,0 +1,42 @@
+import pytest
+
+import test2
+
+
+def analyzed(text, maxErrors = 100):
+    stream, error = test2.Lexer('f', text).tokenize()
+    assert error is None
+    parser = test2.Parser('f', stream)
+    ast = parser.parse()
+    assert not parser.errors
+    analyzer = test2.Analyzer('f', ast, maxErrors)
+    return analyzer, [(error.details, error.ln, error.col) for error in analyzer.analyze()]
+
+
+@pytest.mark.parametrize('text, errors', [
+    ('SHODAI alphaa = 1 ;\nbetaaa = alphaa ;', [('Undeclared variable betaaa', 2, 1)]),
+    ('SHODAI alphaa = 1 ;\nNIDAIME alphaa = 2 ;', [('Duplicate declaration of alphaa, first declared on line 1', 2, 9)]),
+    # A declaration is visible from the end of its statement
+    ('SHODAI alphaa = alphaa ;', [('Undeclared variable alphaa', 1, 17)]),
+    # Names declared in a CHECK, PSYCH or SPAN block end with it
+    ('CHECK ( 1 > 0 ) { SHODAI gammaa = 1 ; gammaa = 2 ; } PSYCH { gammaa = 3 ; }', [('Undeclared variable gammaa', 1, 62)]),
+    ('SPAN ( 1 > 0 ) { SHODAI deltaa = 1 ; }\ndeltaa = 2 ;', [('Undeclared variable deltaa', 2, 1)]),
+    ('SPAN ( 1 > 0 ) { SHODAI deltaa = 1 ; NIDAIME deltaa = 2 ; }', [('Duplicate declaration of deltaa, first declared on line 1', 1, 46)]),
+    # An inner block may shadow a name declared outside it
+    ('SHODAI alphaa = 1 ;\nCHECK ( alphaa > 0 ) { NIDAIME alphaa = 2.5 ; alphaa = alphaa + 1 ; }\nalphaa = 3 ;', []),
+])
+def testNames(text, errors):
+    assert analyzed(text)[1] == errors
+
+
+def testShadowGetsSlotOfItsOwn():
+    analyzer, errors = analyzed('SHODAI alphaa = 1 ;\nCHECK ( alphaa > 0 ) { NIDAIME alphaa = 2.5 ; }')
+    assert analyzer.names == ['alphaa', 'alphaa'] and analyzer.types == ['SHODAI', 'NIDAIME']
+
+
+def testEveryErrorIsCountedFirstOnesReported():
+    text = 'SHODAI alphaa = 1 ;\nSHODAI alphaa = 2 ;\nbetaaa = 1 ;\ngammaa = 1 ;'
+    analyzer, errors = analyzed(text, 2)
+    assert [details for details, line, col in errors] == ['Duplicate declaration of alphaa, first declared on line 1',
+                                                          'Undeclared variable betaaa']
+    assert analyzer.report() == '1 variables in 1 scopes: 2 undeclared, 1 duplicate'
@@ -0,0 +1,113 @@
+import pytest
+
+import test2
+
+TEXT = ('SHODAI alphaa = 1 + 2 * betaaa ;\n'
+        'CHECK ( alphaa < 3 && !! betaaa ) { alphaa = 2.5 ; } PSYCH { SPAN ( alphaa > 0 ) { alphaa = alphaa - 1 ; } }')
+# <expr> binds * looser than +, as grammar.txt defines it
+DUMP = '''PROGRAM
+  DECLARE SHODAI
+    ASSIGN alphaa
+      NAME alphaa
+      BINARY *
+        BINARY +
+          INT 1
+          INT 2
+        NAME betaaa
+  IF CHECK
+    BINARY &&
+      BINARY <
+        NAME alphaa
+        INT 3
+      NOT !!
+        NAME betaaa
+    BLOCK {
+      ASSIGN alphaa
+        NAME alphaa
+        FLOAT 2.5
+    BLOCK {
+      WHILE SPAN
+        BINARY >
+          NAME alphaa
+          INT 0
+        BLOCK {
+          ASSIGN alphaa
+            NAME alphaa
+            BINARY -
+              NAME alphaa
+              INT 1'''
+
+
+def parsed(text = TEXT):
+    stream, error = test2.Lexer('f', text).tokenize()
+    assert error is None
+    parser = test2.Parser('f', stream)
+    ast = parser.parse()
+    assert not parser.errors
+    return stream, ast
+
+
+def testAddKeepsChildOrderAndDropsFailedChildren():
+    stream, error = test2.Lexer('f', 'alphaa + 1').tokenize()
+    ast = test2.AST(stream)
+    name = ast.add(test2.NODE_NAME, 0)
+    number = ast.add(test2.NODE_INT, 2)
+    binary = ast.add(test2.NODE_BINARY, 1, (name, -1, number))
+    assert list(ast.kinds) == [test2.NODE_NAME, test2.NODE_INT, test2.NODE_BINARY]
+    assert list(ast.childrenOf(binary)) == [name, number] and ast.counts[binary] == 2
+    assert ast.tokenType(binary) == test2.PLUS and ast.value(number) == 1 and ast.value(name) == 'alphaa'
+    assert ast.symbol(name) == stream.symbols[0]
+
+
+def testParsedTree():
+    stream, ast = parsed()
+    assert ast.dump() == DUMP
+    assert ast.root == len(ast) - 1 and ast.kinds[ast.root] == test2.NODE_PROGRAM and ast.tokenIdx[ast.root] == -1
+    # Children come before their parents, in source order
+    for node in range(len(ast)):
+        children = list(ast.childrenOf(node))
+        assert all(child < node for child in children) and children == sorted(children)
+    leaves = [ast.tokenIdx[node] for node, depth in ast.walk() if not ast.counts[node] and ast.tokenIdx[node] >= 0]
+    assert leaves == sorted(leaves)
+
+
+@pytest.mark.parametrize('optimize', [False, True])
+def testTreeWriterRoundTrip(tmp_path, optimize):
+    stream, ast = parsed()
+    if optimize:
+        # 1 + 2 folds to a literal whose value only the values section holds
+        ast = test2.Optimizer(ast).optimize()
+        assert ast.values
+    errors = [test2.Error(4, 'SemanticError', 'Something', 'f', 1, 5)]
+    treeFn = str(tmp_path / 'tree.lxt')
+    with open(treeFn, 'wb') as fileObj:
+        writer = test2.TreeWriter(fileObj, 'f', stream.table)
+        sourceMap = stream.sourceMap()
+        writer.addTokens(stream, sourceMap)
+        writer.addLines(sourceMap)
+        writer.addTree(ast)
+        writer.close(errors, len(TEXT))
+    treeFile = test2.TreeFile(treeFn)
+    assert (treeFile.fn, treeFile.size, treeFile.root) == ('f', len(TEXT), ast.root)
+    assert [treeFile.node(node) for node in range(len(ast))] == [(ast.kinds[node], ast.tokenIdx[node], list(ast.childrenOf(node)))
+                                                                 for node in range(len(ast))]
+    assert treeFile.ast().dump() == ast.dump()
+    assert [repr(error) for error in treeFile.errors()] == [repr(error) for error in errors]
+    assert [treeFile.lexeme(i) for i in range(len(stream))] == [stream.lexeme(i) for i in range(len(stream))]
+
+
+def testTreeFileChecks(tmp_path):
+    stream, ast = parsed()
+    treeFn = str(tmp_path / 'tree.lxt')
+    test2.writeTree(treeFn, stream, ast, [], len(TEXT))
+    with open(treeFn, 'r+b') as fileObj:
+        fileObj.seek(40)
+        byte = fileObj.read(1)
+        fileObj.seek(40)
+        fileObj.write(bytes([byte[0] ^ 1]))
+    with pytest.raises(ValueError, match='fails its checksum'):
+        test2.TreeFile(treeFn)
+    assert test2.TreeFile(treeFn, verify=False).root == ast.root
+    (tmp_path / 'other.lxt').write_bytes(b'not a tree file at all, not at all')
+    with pytest.raises(ValueError, match='is not a tree file'):
+        test2.TreeFile(str(tmp_path / 'other.lxt'))
@@ -0,0 +1,69 @@
+import pytest
+
+import test2
+
+np = test2.np
+
+# Records take both sides of CHECK/PSYCH and loop a different number of times
+BRANCHES = '''
+SHODAI result = 0 ;
+CHECK ( counter > 2 ) { result = counter * 2 ; } PSYCH { result = counter - 1 ; }
+CHECK ( result == 3 || scaled < 0 ) { flagged = 1.5 ; }
+SPAN ( counter < 20 ) { counter = counter + 1 ; CHECK ( counter % 3 == 0 ) { result = result + counter ; } }
+'''
+# Records with step 0 loop until the budget runs out, the others stop, scaled / counter fails at 0
+BUDGETED = '''
+SHODAI result = 0 ;
+SPAN ( result < 40 ) { result = result + stepped ; }
+NIDAIME ratioo = scaled / counter ;
+'''
+
+
+def inputs(count):
+    return {'counter': [value % 7 - 2 for value in range(count)],
+            'scaled': [(value % 5 - 2) * 0.5 for value in range(count)],
+            'stepped': [value % 3 for value in range(count)]}
+
+
+def parsed(text):
+    stream, error = test2.Lexer('f', text).tokenize()
+    assert error is None
+    parser = test2.Parser('f', stream)
+    ast = parser.parse()
+    assert not parser.errors
+    return ast
+
+
+# Variables and error of record lane run alone on a VM
+def single(ast, columns, lane, budget):
+    program = test2.Compiler('f', ast).compile()
+    vm = test2.VM(program, budget)
+    for slot, name in enumerate(program.names):
+        if name in columns:
+            vm.slots[slot] = columns[name][lane]
+    return vm.run()
+
+
+@pytest.mark.parametrize('text, budget', [(BRANCHES, test2.BUDGET), (BUDGETED, 2000)])
+@pytest.mark.parametrize('tail', [0, test2.BATCHTAIL])
+@pytest.mark.parametrize('optimize', [False, True])
+def testLanesMatchVM(text, budget, tail, optimize):
+    ast = parsed(text)
+    if optimize:
+        ast = test2.Optimizer(ast).optimize()
+    columns = inputs(60)
+    result = test2.BatchEvaluator('f', ast, budget, tail).run(columns if np is None else {name: np.array(values) for name, values in columns.items()})
+    for lane in range(60):
+        variables, error = single(ast, columns, lane, budget)
+        assert result.variables(lane) == variables
+        assert {name: type(value) for name, value in result.variables(lane).items()} == {name: type(value) for name, value in variables.items()}
+        assert repr(result.errors.get(lane)) == repr(error)
+
+
+def testBudgetRunsOut():
+    result = test2.BatchEvaluator('f', parsed(BUDGETED), 2000).run({name: np.array(values) if np is not None else values
+                                                                    for name, values in inputs(9).items()})
+    failed = {lane: error.details for lane, error in result.errors.items()}
+    # stepped is 0 in lanes 0, 3 and 6, counter is 0 in lane 2
+    budget = 'Instruction budget of 2000 exceeded'
+    assert failed == {0: budget, 2: 'Division by zero', 3: budget, 6: budget}
@@ -0,0 +1,63 @@
+import io
+import json
+
+import pytest
+
+import test2
+
+
+def generated(mix = 'balanced', invalid = 0.0, seed = 1, size = 64 << 10):
+    generator = test2.ProgramGenerator(mix, invalid, seed)
+    fileObj = io.StringIO()
+    written = generator.write(fileObj, size)
+    assert written == len(fileObj.getvalue()) >= size
+    return fileObj.getvalue(), generator
+
+
+@pytest.fixture
+def program(tmp_path):
+    fn = str(tmp_path / 'program.txt')
+    with open(fn, 'w') as fileObj:
+        fileObj.write(generated()[0])
+    return fn
+
+
+@pytest.mark.parametrize('mix', list(test2.BENCHMIXES))
+def testValidProgramsHaveNoErrors(mix):
+    text, generator = generated(mix)
+    stream, ast, errors = test2.lexAndParse('f', text, test2.MAXERRORS)
+    assert errors == [] and generator.statements > 0
+
+
+def testInvalidProgramsHaveErrors():
+    text, generator = generated(invalid=0.2)
+    stream, ast, errors = test2.lexAndParse('f', text, test2.MAXERRORS)
+    assert errors
+
+
+def testSeedGivesSameProgram():
+    assert generated(seed=7)[0] == generated(seed=7)[0] != generated(seed=8)[0]
+
+
+# Every phase counts the tokens of the same file, lex and scan included
+@pytest.mark.parametrize('phase', test2.BENCHPHASES)
+def testEveryPhaseRuns(program, phase):
+    expected = test2.benchPhase('tokenize', program, False)
+    result = test2.benchPhase(phase, program, False, jobs=2)
+    assert result['tokens'] == expected['tokens'] > 0 and result['seconds'] > 0
+
+
+def testBenchmarkComparesWithBaselines(tmp_path):
+    baselines = str(tmp_path / 'benchmarks.json')
+    out = io.StringIO()
+    assert test2.benchmark(16 << 10, ['balanced'], baselines=baselines, save=True, allocations=False, repeat=1, out=out) == 0
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith('balanced/16384/0.0: ')
+    assert [line.split()[0] for line in lines[1:]] == test2.BENCHPHASES
+    with open(baselines) as fileObj:
+        assert sorted(json.load(fileObj)['balanced/16384/0.0']) == sorted(test2.BENCHPHASES)
+    # A threshold of -10 counts every phase not eleven times faster than its baseline
+    out = io.StringIO()
+    phases = ['tokenize', 'parse']
+    assert test2.benchmark(16 << 10, ['balanced'], phases, baselines=baselines, threshold=-10, allocations=False, repeat=1, out=out) == 2
+    assert out.getvalue().count('REGRESSION') == 2
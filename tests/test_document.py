@@ -0,0 +1,34 @@
+import random
+
+import test2
+
+TEXT = 'SHODAI alphaa = 1 ;\n' * 20 + 'CHECK ( alphaa ) { alphaa = 2 ; } PSYCH { alphaa = 3 ; }\n' * 10
+
+
+def located(errors):
+    return [(error.errorName, error.details, error.pos, error.ln, error.col) for error in errors]
+
+
+def testEditsMatchFreshDocument():
+    rng = random.Random(3)
+    text = TEXT
+    document = test2.Document('f', text)
+    for step in range(200):
+        offset = rng.randint(0, len(text))
+        deleted = rng.randint(0, min(4, len(text) - offset))
+        inserted = rng.choice(['', ' ', ';', '}', '$', 'PSYCH { ', '\nSHODAI betaaa = 1 ; '])
+        text = text[:offset] + inserted + text[offset + deleted:]
+        document.edit(offset, deleted, inserted)
+        fresh = test2.Document('f', text)
+        assert document.text == text
+        assert [document.start(i) for i in range(len(document.segments) + 1)] == [fresh.start(i) for i in range(len(fresh.segments) + 1)]
+        assert located(document.diagnostics()) == located(fresh.diagnostics())
+
+
+def testTypingMovesFewOffsets():
+    document = test2.Document('f', TEXT)
+    for offset in range(40, 50):
+        document.edit(offset, 0, ' ')
+    # Only the offsets between the edits were corrected, the later ones wait in shift
+    assert document.shift == 10 and document.stale <= 4
+    assert document.start(len(document.segments)) == len(TEXT) + 10
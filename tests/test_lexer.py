@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+import test2
+
+# The name with é is an error, the lexer and the parser go on to the errors after it
+MULTIBYTE = 'SHODAI alphaa = 1 ;\nSHODAI cafébb = 1 ;\nSHODAI betaaa = 1 $ ;\nSHODAI gammaa = 1 1 ;\n'
+SAMPLE2 = os.path.join(os.path.dirname(test2.GRAMMAR), 'sample2.txt')
+
+
+def located(errors):
+    return [(error.errorName, error.pos, error.ln, error.col) for error in errors]
+
+
+@pytest.mark.parametrize('padding', [0, test2.VECTORSOURCE])
+def testBytesErrorsCountCharacters(padding):
+    text = ' ' * padding + MULTIBYTE
+    expected = test2.Lexer('f', text)
+    expected.tokenize(maxErrors=10)
+    assert [error.pos for error in expected.errors] == [padding + 30, padding + 58]
+    lexer = test2.Lexer('f', text.encode())
+    if padding:
+        lexer.vectorize(10)
+    else:
+        lexer.tokenize(maxErrors=10)
+    assert located(lexer.errors) == located(expected.errors)
+
+
+def testParseErrorsAfterMultibyteCharacter(tmp_path):
+    fn = str(tmp_path / 'source.txt')
+    with open(fn, 'wb') as fileObj:
+        fileObj.write(MULTIBYTE.encode())
+    expected = located(test2.lexAndParse(fn, MULTIBYTE, 10)[2])
+    # Error.pos of a number is its end, past the second 1 on line 4
+    assert expected[-1] == ('InvalidSyntaxError', MULTIBYTE.rindex('1') + 1, 4, 19)
+    assert located(test2.lexAndParse(fn, test2.openSource(fn), 10)[2]) == expected
+    with open(fn, 'rb') as fileObj:
+        parser = test2.StreamParser(fn, test2.StreamLexer(fn, fileObj, blockSize=32), 10)
+        parser.parse()
+    assert located(parser.diagnostics()) == expected
+
+
+@pytest.mark.parametrize('lex', [
+    lambda: test2.Lexer('f', 'x').lex(0),
+    lambda: test2.Lexer('f', 'x').tokenize(maxErrors=0),
+    lambda: test2.Lexer('f', b'x').vectorize(0),
+    lambda: test2.Parser('f', test2.Lexer('f', 'x').lex()[0], 0),
+    lambda: test2.lexAndParse('f', 'x', 0),
+])
+def testErrorCapBelowOne(lex):
+    with pytest.raises(AssertionError):
+        lex()
+
+
+def testWordAtEndOfSource():
+    tokens, error = test2.Lexer('f', 'SHODAI alphaOne = betaaa').lex()
+    assert error is None and [token.value for token in tokens] == ['SHODAI', 'alphaOne', '=', 'betaaa', 'EOF']
+    # A rejected word at the end is reported like any other
+    tokens, error = test2.Lexer('f', 'SHODAI alphaOne = beta').lex(10)
+    assert (error.errorName, error.pos, error.col) == ('IllegalCharError', 22, 19)
+
+
+def testCappedLexHasNoPlaceholder():
+    tokens, error = test2.Lexer('f', 'SHODAI alphaa =; 1 ;').lex()
+    assert error is not None and None not in tokens
+
+
+@pytest.mark.parametrize('text', [MULTIBYTE, SAMPLE2])
+def testScanMatchesLex(text):
+    if text == SAMPLE2:
+        with open(SAMPLE2) as fileObj:
+            text = fileObj.read()
+    tokens, error = test2.Lexer('f', text).lex(10)
+    lexer = test2.Lexer('f', text)
+    scanned, scanError = lexer.scan(10)
+    assert [(token.type, token.pos, token.value, token.symbol) for token in scanned] == [(token.type, token.pos, token.value, token.symbol)
+                                                                                        for token in tokens]
+    assert repr(scanError) == repr(error) and len(lexer.errors) == (2 if text == MULTIBYTE else 0)
+    # Building the tokens pauses the collector and turns it back on
+    assert test2.gc.isenabled()
@@ -0,0 +1,23 @@
+import pytest
+
+import test2
+
+
+@pytest.mark.parametrize('argv, message', [
+    (['--stream', '--optimize', 'x.txt'], '--optimize cannot be used with --stream'),
+    (['--trace', '--run', 'x.txt'], '--run cannot be used with --trace'),
+    (['--batch', 'a.npz', '--cache', 'dir', 'x.txt'], '--cache cannot be used with --batch'),
+    (['--bench', '1K', '--trace'], '--trace cannot be used with --bench'),
+    (['--serve', '--max-errors', '3'], '--max-errors cannot be used with --serve'),
+    (['--trace', '--stream', 'x.txt'], 'not allowed with argument --trace'),
+    (['--scan', 'x.txt'], '--scan needs --trace or --profile'),
+    (['--optimize'], '--optimize needs files'),
+    (['--cache-size', '1M', 'x.txt'], '--cache-size needs --cache'),
+    (['--max-errors', '0', 'sample4.txt'], 'argument --max-errors: must be at least 1, not 0'),
+    (['--stream', '--max-errors', '-1', 'sample3.txt'], 'argument --max-errors: must be at least 1, not -1'),
+])
+def testUnsupportedCombination(argv, message, capsys):
+    with pytest.raises(SystemExit) as exit:
+        test2.main(argv)
+    assert exit.value.code == 2
+    assert message in capsys.readouterr().err
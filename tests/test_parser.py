@@ -0,0 +1,24 @@
+import pytest
+
+import test2
+
+
+# Null sink for TracingParser, which parses by the rule-per-method descent
+class Silent:
+    def __getattr__(self, name):
+        return lambda *args: None
+
+
+def parsed(text, tracing):
+    stream, error = test2.Lexer('f', text).tokenize(maxErrors=100)
+    assert error is None
+    parser = test2.TracingParser('f', stream, Silent(), 100) if tracing else test2.Parser('f', stream, 100)
+    ast = parser.parse()
+    return list(ast.kinds), list(ast.tokenIdx), list(ast.children), parser.errors, parser.errorTokens
+
+
+@pytest.mark.parametrize('condition', ['!! !! alphaa', '!! ( !! !! alphaa )', 'alphaa && !! !! betaaa || 1',
+                                       '( alphaa + 1 ) * 2 < 3 == !! 1.5', '1 + ( 2', '!! )'])
+def testClimbBuildsDescentNodes(condition):
+    text = 'CHECK ( ' + condition + ' ) { SHODAI betaaa = 1 ; } alphaa = 2 ;'
+    assert parsed(text, False) == parsed(text, True)
@@ -0,0 +1,44 @@
+import itertools
+import os
+
+import test2
+
+SAMPLE2 = os.path.join(os.path.dirname(test2.GRAMMAR), 'sample2.txt')
+HELPERS = ('createBoolOps', 'createEquals', 'createIdentifier', 'createLts', 'createNumber')
+
+
+# Profile of sample2.txt with a clock that moves one second per reading
+def profiled(scan = False):
+    ticks = itertools.count()
+    return test2.profileFile(SAMPLE2, scan, profile=test2.Profile(lambda: float(next(ticks))))
+
+
+def testCountsCallsAndTokens():
+    stats = profiled().stats
+    calls = {rule: stats[rule][0] for rule in stats}
+    tokens = {rule: stats[rule][3] for rule in stats}
+    assert calls['parse'] == calls['if_stmt'] == calls['while_stmt'] == calls['lex'] == 1
+    assert (calls['stmt'], calls['assign_stmt'], calls['declare_stmt'], calls['factor'], calls['bfactor']) == (7, 5, 2, 9, 6)
+    assert {helper: calls[helper] for helper in HELPERS} == {'createBoolOps': 1, 'createEquals': 5, 'createIdentifier': 19,
+                                                            'createLts': 3, 'createNumber': 6}
+    # The 53 tokens before EOF are read by the parse, lex creates them and EOF
+    assert tokens['parse'] == tokens['stmt'] == 53 and tokens['lex'] == 54
+    assert all(tokens[helper] == calls[helper] for helper in HELPERS)
+
+
+def testTimesAddUp():
+    profile = profiled()
+    stats = profile.stats
+    assert all(total >= own for calls, total, own, tokens in stats.values())
+    # Every second under parse or lex is the self time of exactly one rule below it
+    parseRules = [rule for rule in stats if rule != 'lex' and rule not in HELPERS]
+    assert sum(stats[rule][2] for rule in parseRules) == stats['parse'][1]
+    assert stats['lex'][2] + sum(stats[helper][1] for helper in HELPERS) == stats['lex'][1]
+    collapsed = [line.rsplit(' ', 1) for line in profile.collapsed().splitlines()]
+    assert sum(int(micros) for stack, micros in collapsed) == (stats['parse'][1] + stats['lex'][1]) * 1e6
+
+
+def testTokenizeIsOneRule():
+    stats = profiled(True).stats
+    assert stats['tokenize'][0] == 1 and not any(helper in stats for helper in HELPERS)
+    assert stats['parse'][3] == 53
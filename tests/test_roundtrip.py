@@ -0,0 +1,112 @@
+import io
+import os
+
+import pytest
+
+import test2
+
+SAMPLES = [os.path.join(os.path.dirname(test2.GRAMMAR), 'sample'+str(number)+'.txt') for number in range(1, 5)]
+# Lexer and syntax errors after multibyte characters, positions count characters
+MULTIBYTE = 'é alphaOne = 5;\nSHODAI cafébb = 1 ;\nSHODAI alphaa = 1 € ;\nSHODAI betaaa = 2 2 ;\n'
+TEXTS = [open(fn).read() for fn in SAMPLES] + [MULTIBYTE]
+
+
+# Text of a random program of about size characters, invalid is the share of broken statements
+def program(size, invalid = 0.0, seed = 0):
+    buffer = io.StringIO()
+    test2.ProgramGenerator('balanced', invalid, seed).write(buffer, size)
+    return buffer.getvalue()
+
+
+def write(tmp_path, text):
+    fn = str(tmp_path / 'source.txt')
+    with open(fn, 'w') as fileObj:
+        fileObj.write(text)
+    return fn
+
+
+def tokens(stream):
+    return [(token.type, token.pos, token.value) for token in stream.tokens()]
+
+
+def located(errors):
+    return [(error.errorName, error.details, error.pos, error.ln, error.col) for error in errors]
+
+
+def columns(stream):
+    return list(stream.kinds), list(stream.starts), list(stream.ends)
+
+
+@pytest.mark.parametrize('text', TEXTS + [program(20000, 0.02, seed) for seed in range(3)] + [' ' * test2.VECTORSOURCE + MULTIBYTE])
+def testLexersAgree(text):
+    lexer = test2.Lexer('f', text)
+    expected, error = lexer.lex(100)
+    expected = [(token.type, token.pos, token.value) for token in expected]
+    for source, vectorize in ((text, False), (text.encode(), False), (text.encode(), True)):
+        other = test2.Lexer('f', source)
+        stream, error = other.vectorize(100) if vectorize else other.tokenize(maxErrors=100)
+        assert tokens(stream) == expected
+        assert located(other.errors) == located(lexer.errors)
+
+
+@pytest.mark.parametrize('invalid', [0.0, 0.05])
+def testChunksMatchWholeFile(tmp_path, monkeypatch, invalid):
+    monkeypatch.setattr(test2, 'SPLITSOURCE', 0)
+    fn = write(tmp_path, program(40000, invalid, 1))
+    stream, ast, errors = test2.lexAndParse(fn, test2.openSource(fn), 50)
+    chunked, chunkedAst, chunkedErrors = test2.lexAndParse(fn, test2.openSource(fn), 50, jobs=2)
+    assert columns(chunked) == columns(stream)
+    assert located(chunkedErrors) == located(errors)
+    assert chunkedAst.dump() == ast.dump()
+
+
+@pytest.mark.parametrize('blockSize', [7, 256, test2.STREAMBLOCK])
+@pytest.mark.parametrize('invalid', [0.0, 0.05, None])
+def testStreamMatchesWholeFile(tmp_path, blockSize, invalid):
+    fn = write(tmp_path, program(20000, invalid, 2) if invalid is not None else MULTIBYTE * 5)
+    stream, ast, errors = test2.lexAndParse(fn, test2.openSource(fn), 50)
+    with open(fn, 'rb') as fileObj:
+        parser = test2.StreamParser(fn, test2.StreamLexer(fn, fileObj, blockSize=blockSize), 50, keepTree=True)
+        streamed = parser.parse()
+    assert located(parser.diagnostics()) == located(errors)
+    assert parser.count == len(stream)
+    assert streamed.dump() == ast.dump()
+
+
+@pytest.mark.parametrize('text', TEXTS)
+def testTreeFileRoundTrip(tmp_path, text):
+    fn = write(tmp_path, text)
+    source = test2.openSource(fn)
+    stream, ast, errors = test2.lexAndParse(fn, source, 100)
+    # Offsets and columns are the ones of the text
+    assert tokens(stream) == tokens(test2.lexAndParse(fn, text, 100)[0])
+    treeFn = str(tmp_path / 'tree.lxt')
+    test2.writeTree(treeFn, stream, ast, errors, len(source))
+    emit = tmp_path / 'emit'
+    test2.streamFile(fn, 100, emit=str(emit))
+    for treeFile in (test2.TreeFile(treeFn), test2.TreeFile(test2.treePath(str(emit), fn))):
+        assert located(treeFile.errors()) == located(errors)
+        fileTokens = treeFile.tokenStream()
+        assert tokens(fileTokens) == tokens(stream)
+        assert [fileTokens.span(i) for i in range(len(stream))] == [stream.span(i) for i in range(len(stream))]
+        loaded = treeFile.ast()
+        assert (loaded is None) == (ast is None)
+        if ast is not None:
+            assert loaded.dump() == ast.dump()
+
+
+@pytest.mark.parametrize('text', TEXTS)
+def testCacheRoundTrip(tmp_path, text):
+    fn = write(tmp_path, text)
+    source = test2.openSource(fn)
+    cache = test2.ParseCache(str(tmp_path))
+    stream, ast, errors = test2.lexAndParse(fn, source, 100)
+    key = cache.key(source, 100)
+    assert cache.load(key, fn, source) is None
+    cache.store(key, stream, ast, errors)
+    cached, cachedAst, cachedErrors = cache.load(key, fn, source)
+    assert tokens(cached) == tokens(stream)
+    assert located(cachedErrors) == located(errors)
+    assert (cachedAst is None) == (ast is None)
+    if ast is not None:
+        assert cachedAst.dump() == ast.dump()
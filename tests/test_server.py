@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+import pytest
+
+import test2
+
+
+# Sends request lines to a ParseServer and returns its responses by id
+def serve(lines, server = None):
+    server = server or test2.ParseServer(jobs=1)
+    lines = [line if isinstance(line, str) else json.dumps(line) for line in lines]
+    pending = [(line+'\n').encode() for line in lines] + [b'']
+    responses = []
+
+    async def readline():
+        return pending.pop(0)
+
+    async def write(response):
+        responses.append(response)
+
+    try:
+        asyncio.run(server.serve(readline, write))
+    finally:
+        server.close()
+    return responses
+
+
+def testValidRequest():
+    responses = serve([{'id': 1, 'source': 'SHODAI alphaa = 1 ;', 'tokens': True}])
+    assert [response['id'] for response in responses] == [1, 1]
+    assert responses[-1]['done'] and responses[-1]['diagnostics'] == []
+    assert responses[-1]['tokenCount'] == len(responses[0]['tokens'])
+
+
+@pytest.mark.parametrize('query, field', [
+    ({'id': 1, 'source': 5}, 'source'),
+    ({'id': 2, 'path': 5}, 'path'),
+    ({'id': 3, 'source': 'SHODAI alphaa = 1 ;', 'maxErrors': 'x'}, 'maxErrors'),
+    ({'id': 4, 'source': 'SHODAI alphaa = 1 ;', 'maxErrors': 0}, 'maxErrors'),
+    ({'id': 5, 'source': 'SHODAI alphaa = 1 ;', 'fn': []}, 'fn'),
+])
+def testRequestWithBadFieldType(query, field):
+    responses = serve([query])
+    assert len(responses) == 1
+    assert responses[0]['id'] == query['id'] and responses[0]['done']
+    assert '"'+field+'"' in responses[0]['error']
+
+
+def testFailingRequestStillAnswered(monkeypatch):
+    def fail(request, cache = None):
+        raise MemoryError('out of memory')
+    monkeypatch.setattr(test2, 'serveRequest', fail)
+    responses = serve([{'id': 7, 'source': 'SHODAI alphaa = 1 ;'}, 'not json', '[1]'])
+    assert {'id': 7, 'done': True, 'error': 'MemoryError: out of memory'} in responses
+    assert sum(1 for response in responses if response['done']) == 3
+
+
+def testHeavyRequestRunsInPool(monkeypatch):
+    monkeypatch.setattr(test2, 'HEAVYSOURCE', 0)
+    responses = serve([{'id': 8, 'source': 'SHODAI alphaa = 1 ; alphaa = ;'}])
+    assert len(responses) == 1 and responses[0]['done']
+    assert [diagnostic['name'] for diagnostic in responses[0]['diagnostics']] == ['InvalidSyntaxError']
@@ -0,0 +1,41 @@
+import pytest
+
+import test2
+
+
+@pytest.mark.parametrize('encode', [False, True])
+def testCRLFLines(encode):
+    text = 'SHODAI alphaa = 1 ;\r\nalphaa = 2 ;\r\n\r\nalphaa = 3 ;'
+    sourceMap = test2.SourceMap(text.encode() if encode else text)
+    assert list(sourceMap.lineStarts) == [0, 21, 35, 37]
+    # \r ends the line it is on, the next line starts after \n
+    assert sourceMap.location(19) == (1, 20) and sourceMap.location(20) == (1, 21)
+    assert sourceMap.location(21) == (2, 1) and sourceMap.location(35) == (3, 1)
+
+
+@pytest.mark.parametrize('text', ['alphaa = 1 ;\nalphaa = 2 ;', 'alphaa = 1 ;\nalphaa = 2 ;\n'])
+def testLastLine(text):
+    sourceMap = test2.SourceMap(text)
+    # The end of the source is on the last line, a final newline starts an empty one
+    assert sourceMap.location(len(text)) == ((2, 13) if text[-1] == ';' else (3, 1))
+    assert sourceMap.location(len(text) - 1) == ((2, 12) if text[-1] == ';' else (2, 13))
+    assert sourceMap.line(len(text)) == len(sourceMap)
+
+
+def testMultibyteColumnsCountCharacters():
+    text = 'é € alphaa\n€€ betaaa'
+    data = text.encode()
+    sourceMap = test2.SourceMap(data)
+    # Byte offsets of alphaa and betaaa, columns and chars count characters
+    assert sourceMap.location(data.index(b'alphaa')) == (1, 5) == test2.SourceMap(text).location(text.index('alphaa'))
+    assert sourceMap.location(data.index(b'betaaa')) == (2, 4) == test2.SourceMap(text).location(text.index('betaaa'))
+    assert sourceMap.chars(len(data)) == len(text)
+    assert list(sourceMap.charArray(sourceMap.lineStarts)) == [0, text.index('\n') + 1]
+
+
+def testGivenLineStartsAndContinuationBytes():
+    data = 'é alphaa\nbetaaa'.encode()
+    whole = test2.SourceMap(data)
+    whole.chars(0)
+    sourceMap = test2.SourceMap(None, whole.lineStarts, whole.wide)
+    assert [sourceMap.location(offset) for offset in range(len(data))] == [whole.location(offset) for offset in range(len(data))]
@@ -0,0 +1,46 @@
+import test2
+
+
+# Streams file fn in blocks of blockSize bytes, returns the StreamLexer, the StreamParser and its AST
+def stream(fn, maxErrors = test2.MAXERRORS, blockSize = test2.STREAMBLOCK):
+    with open(fn, 'rb') as fileObj:
+        lexer = test2.StreamLexer(fn, fileObj, blockSize=blockSize)
+        parser = test2.StreamParser(fn, lexer, maxErrors, keepTree=True)
+        ast = parser.parse()
+    return lexer, parser, ast
+
+
+def write(tmp_path, text):
+    fn = str(tmp_path / 'source.txt')
+    with open(fn, 'wb') as fileObj:
+        fileObj.write(text.encode())
+    return fn
+
+
+def testWindowsWithoutSpaces(tmp_path):
+    fn = write(tmp_path, 'CHECK(alphaa){alphaa;}\n' * 400 + 'SPAN(betaaa){\t}' * 400)
+    expected, tree, errors = test2.lexAndParse(fn, test2.openSource(fn), test2.MAXERRORS)
+    with open(fn, 'rb') as fileObj:
+        bases = [base for base, window in test2.StreamLexer(fn, fileObj, blockSize=256).stream()]
+    # Every window is cut before its last token instead of holding the rest of the file
+    assert len(bases) > 1 and max(second - first for first, second in zip(bases, bases[1:])) <= 2 * 256
+    lexer, parser, ast = stream(fn, blockSize=256)
+    assert parser.diagnostics() == errors == []
+    assert parser.count == len(expected)
+    assert ast.dump() == tree.dump()
+
+
+def testStretchWithoutCutIsSkipped(tmp_path, monkeypatch):
+    monkeypatch.setattr(test2, 'STREAMRUN', 1000)
+    text = 'SHODAI alphaa = 1 ;\n' + 'a' * 2000 + '\n' + 'a' * 3000 + '\nalphaa = 2 ; SHODAI betaaa = 1 1 ;'
+    fn = write(tmp_path, text)
+    lexer, parser, ast = stream(fn, blockSize=256)
+    # The first stretch starts at the last token before it, ;, the second at the newline ending the first
+    second = text.index('\n', 20)
+    stretches = [('IllegalCharError', 18, 1, 19), ('IllegalCharError', second, 2, second - 19)]
+    assert [(error.errorName, error.pos, error.ln, error.col) for error in lexer.errors] == stretches
+    assert lexer.errors[0].details == 'Over 1000 bytes without a space or a token'
+    # Lines after the stretches are counted, the ; lost in the first one is missed on line 4
+    assert [(error.errorName, error.ln, error.col) for error in parser.diagnostics()[2:]] == [
+        ('InvalidSyntaxError', 4, 1), ('InvalidSyntaxError', 4, 32)]
+    assert lexer.size == len(text)
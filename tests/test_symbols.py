@@ -0,0 +1,26 @@
+import test2
+
+
+def testKeywordsComeFirst():
+    table = test2.SymbolTable()
+    assert table.names == test2.KEYWORDS
+    assert [table.intern(word) for word in test2.KEYWORDS] == list(range(len(test2.KEYWORDS)))
+    assert table.types[table.intern('SHODAI')] == test2.DT and table.types[table.intern('CHECK')] == test2.CHECK
+
+
+def testInternIsStable():
+    table = test2.SymbolTable()
+    first = table.intern('alphaa')
+    second = table.intern(b'betaaaa')
+    assert (first, second) == (len(test2.KEYWORDS), len(test2.KEYWORDS) + 1)
+    # str and bytes spellings share an id, later words do not move earlier ones
+    assert table.intern(b'alphaa') == table.intern('alphaa') == first
+    assert table.intern('betaaaa') == second and table.names[second] == 'betaaaa'
+    assert table.types[first] == test2.IDENTIFIER and len(table) == second + 1
+
+
+def testInternRejectsInvalidNames():
+    table = test2.SymbolTable()
+    for word in ('beta', 'alphabetsoup', 'alpha1', 'cafébb', 'cafébb'.encode()):
+        assert table.intern(word) == -1
+    assert len(table) == len(test2.KEYWORDS)
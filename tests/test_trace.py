@@ -0,0 +1,46 @@
+import io
+import os
+
+import pytest
+
+import test2
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLES = [os.path.join(os.path.dirname(test2.GRAMMAR), 'sample'+str(number)+'.txt') for number in range(1, 5)]
+
+
+# The expected traces are the text trace of the original parser, with the changes listed
+# in the commit building the AST: PSYCH is its own token and branch, blocks hold statements
+@pytest.mark.parametrize('fn', SAMPLES)
+def testTextTraceMatchesStoredTrace(fn, monkeypatch):
+    # The trace names the file as it was given
+    monkeypatch.chdir(os.path.dirname(fn))
+    trace = io.StringIO()
+    test2.run(os.path.basename(fn), target=trace)
+    with open(os.path.join(HERE, 'data', os.path.basename(fn)[:-4]+'.trace')) as fileObj:
+        assert trace.getvalue() == fileObj.read()
+
+
+@pytest.mark.parametrize('fn', SAMPLES)
+@pytest.mark.parametrize('scan', [False, True])
+def testBinaryTraceRoundTrip(fn, scan):
+    events = []
+    test2.run(fn, scan, test2.TRACE_EVENTS, events.extend)
+    binary = io.BytesIO()
+    test2.run(fn, scan, test2.TRACE_EVENTS, binary)
+    binary.seek(0)
+    # Token records carry the token kind too
+    read = [(event, value[1] if event == test2.TRACE_TOKEN else value) for event, value in test2.readTrace(binary)]
+    assert read == events
+    assert {event for event, value in events} >= {test2.TRACE_ENTER, test2.TRACE_EXIT, test2.TRACE_TOKEN}
+
+
+def testEventsFollowTextTrace():
+    fn = SAMPLES[1]
+    trace = io.StringIO()
+    test2.run(fn, target=trace)
+    events = []
+    test2.run(fn, trace=test2.TRACE_EVENTS, target=events.extend)
+    lines = [line for line in trace.getvalue().splitlines() if line.startswith(('Enter <', 'Exit <'))]
+    assert lines == [('Enter <' if event == test2.TRACE_ENTER else 'Exit <')+value+'>' for event, value in events
+                     if event in (test2.TRACE_ENTER, test2.TRACE_EXIT)]
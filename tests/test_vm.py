@@ -0,0 +1,70 @@
+import pytest
+
+import test2
+
+
+# Lexes, parses and compiles an error free program and runs it on the VM
+def execute(text, optimize = False):
+    stream, ast, errors = test2.lexAndParse('<test>', text, test2.MAXERRORS)
+    assert errors == []
+    if optimize:
+        ast = test2.Optimizer(ast).optimize()
+    return test2.VM(test2.Compiler('<test>', ast).compile()).run()
+
+
+def assertUnassigned(error, column):
+    assert error is not None
+    assert error.errorName == 'RuntimeError'
+    assert error.details == 'Variable used before it was assigned'
+    assert error.col == column
+
+
+def testCopyOfUnassignedVariable():
+    variables, error = execute("SHODAI alphaa = betaaa ;")
+    assertUnassigned(error, 17)
+    assert variables == {}
+
+
+def testCheckOnUnassignedVariable():
+    variables, error = execute("SHODAI alphaa ; CHECK ( alphaa ) { SHODAI gammaa = 1 ; } PSYCH { SHODAI gammaa = 2 ; }")
+    assertUnassigned(error, 25)
+    assert variables == {}
+
+
+@pytest.mark.parametrize('operator', ['==', '!='])
+def testEqualityWithUnassignedVariable(operator):
+    variables, error = execute("SHODAI alphaa = 1 ; CHECK ( ( alphaa + 1 ) "+operator+" betaaa ) { alphaa = 2 ; }")
+    assertUnassigned(error, 44)
+    assert variables == {'alphaa': 1}
+
+
+def testIdentityKeepsUnassignedRead():
+    text = "SHODAI betaaa ; betaaa = ( 8 * 4 % 4 ) + betaaa ;"
+    for optimize in (False, True):
+        variables, error = execute(text, optimize)
+        assert error is not None and error.details == 'Variable used before it was assigned'
+        assert variables == {}
+
+
+# Returns the optimized AST of text and the Optimizer
+def optimize(text):
+    stream, ast, errors = test2.lexAndParse('<test>', text, test2.MAXERRORS)
+    assert errors == []
+    optimizer = test2.Optimizer(ast)
+    return optimizer.optimize(), optimizer
+
+
+@pytest.mark.parametrize('condition', ['!! alphaa * 1 == 1', '1 * !! alphaa == 1', '!! alphaa + 0 == 1', '!! alphaa - 0 == 1'])
+def testIdentityKeepsBoolToIntConversion(condition):
+    ast, optimizer = optimize("SHODAI alphaa = 0 ; alphaa = 0 ; CHECK ( "+condition+" ) { alphaa = 1 ; }")
+    assert optimizer.simplified == 0
+
+
+def testIdentityKeepsFloatZeroSign():
+    text = "SHODAI alphaa = 1 ; alphaa = ( 0 - alphaa ) * 0.0 ; SHODAI betaaa = alphaa + 0 ; SHODAI gammaa = alphaa * 1 ;"
+    expected = execute(text)
+    assert repr(expected[0]['betaaa']) == '0.0'
+    assert repr(expected[0]['gammaa']) == '-0.0'
+    ast, optimizer = optimize(text)
+    assert optimizer.simplified == 1
+    assert repr(execute(text, True)) == repr(expected)